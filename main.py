@@ -1,31 +1,40 @@
 import os
-import io
 import json
-import smtplib
-import tempfile
-from email.message import EmailMessage
-from typing import List, Dict, Any, Optional
+import asyncio
+from typing import List, Dict, Any, Optional, Callable, Hashable, Tuple
 # --- Feedback route ---
 from pydantic import BaseModel
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 # --- OpenAI ---
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
-# --- Document tooling ---
-import fitz  # PyMuPDF
-from docx import Document
-
-# OCR (optional). If tesseract binary isn't present, we disable OCR gracefully.
-try:
-    import pytesseract  # type: ignore
-    from PIL import Image  # type: ignore
-    _HAS_TESSERACT = True
-except Exception:
-    _HAS_TESSERACT = False
+# --- Local utils ---
+from utils.cache import SqliteCache, fingerprint, DEFAULT_CACHE_DB
+from utils.ingest import spool_upload, unpack_zip, remove_quietly, open_pdf, MaxBodySizeMiddleware, MAX_UPLOAD_BYTES, BATCH_MAX_FILES, BATCH_MAX_BYTES
+from utils.chunk import chunk_pages, chunk_report, count_tokens, CHUNK_MAX_TOKENS
+from utils.route import SECTIONS, route_pages, chunk_sections, sub_schema, routing_report
+from utils.dedup import dedup_pages, expand_page_refs, DEDUP_PAGES, DEDUP_THRESHOLD
+from utils.rules import extract_fields, resolved_fields, covered_sections, prefill, rules_report, RULES_PREFILL, RULES_VERSION
+from utils.retrieve import DocStore, DEFAULT_DOC_STORE_DIR, search
+from utils.jobs import JobStore, JobRunner, DEFAULT_JOB_DIR
+from utils.store import Store, DEFAULT_DATABASE_URL
+from utils.feedback import FeedbackSink
+from utils.mailer import Mailer
+from utils.merge import MergeAccumulator, merge_results
+from utils.scheduler import FairScheduler, MODEL_CONCURRENCY_PER_PROCESS, MODEL_CONCURRENCY_PER_REQUEST
+from utils.ratelimit import ModelGate, CircuitOpen
+from utils import metrics, usage
+from utils.metrics import StageTimer, ServerTimingMiddleware, model_call, render_metrics
+from utils.extract import extract_pdf_with_pages as extract_pdf_text, extract_docx_with_pages, shutdown_pool as shutdown_pdf_pool, PDF_WORKERS
+# OCR (optional). If the tesseract binary isn't present, scanned pages go to the vision model.
+from utils.ocr import vision_ocr_pages, shutdown_pool as shutdown_ocr_pool, VISION_MODEL, _HAS_TESSERACT
 
 # ----------------------------------------------------------------------------
 # App & CORS
@@ -46,6 +55,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Refuse oversized bodies before multipart parsing (small allowance for form overhead); a
+# batch carries several files, each still limited to MAX_UPLOAD_BYTES as it is spooled.
+app.add_middleware(MaxBodySizeMiddleware, max_bytes=MAX_UPLOAD_BYTES + 64 * 1024,
+                   path_limits={"/upload/batch": BATCH_MAX_BYTES + BATCH_MAX_FILES * 64 * 1024})
+# Server-Timing header per request (+ optional sampled cProfile, PROFILE_SAMPLE_RATE).
+app.add_middleware(ServerTimingMiddleware)
 class FeedbackIn(BaseModel):
     rating: int
     message: str
@@ -54,87 +69,60 @@ class FeedbackIn(BaseModel):
 
 @app.post("/feedback")
 async def feedback(item: FeedbackIn):
-    # Minimal: log it. Replace with DB insert if you have Postgres.
-    try:
-        print("FEEDBACK:", item.model_dump())
-        # Example DB insert (pseudo):
-        # cur.execute("INSERT INTO feedback (rating,message,email,doc_name) VALUES (%s,%s,%s,%s)", (item.rating,item.message,item.email,item.docName))
-        return {"ok": True}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"detail": f"Could not record feedback: {e}"})
+    # Write-behind: queued here, inserted in batches by feedback_sink (see Lifecycle).
+    if not await feedback_sink.submit(item.model_dump()):
+        raise HTTPException(status_code=503, detail="Feedback is backed up; please retry shortly.",
+                            headers={"Retry-After": "2"})
+    return {"ok": True}
+
 # ----------------------------------------------------------------------------
 # OpenAI client
 # ----------------------------------------------------------------------------
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY is not set")
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Retries are ours (utils/ratelimit.py): shared RPM/TPM buckets, jittered backoff, circuit breaker.
+client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+aclient = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+model_gate = ModelGate.from_env()
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
+# Chunk fan-out from every upload, job and batch file in this worker goes through one fair
+# queue: MODEL_CONCURRENCY_PER_PROCESS slots, at most MODEL_CONCURRENCY_PER_REQUEST per document.
+model_scheduler = FairScheduler(MODEL_CONCURRENCY_PER_PROCESS, MODEL_CONCURRENCY_PER_REQUEST)
+
 # ----------------------------------------------------------------------------
 # Extraction utilities
 # ----------------------------------------------------------------------------
 
 def extract_pdf_with_pages(path: str, ocr: bool = True) -> List[Dict[str, Any]]:
-    doc = fitz.open(path)
-    pages: List[Dict[str, Any]] = []
-    for i, page in enumerate(doc):
-        text = page.get_text("text") or ""
-        if not text.strip() and ocr:
-            if _HAS_TESSERACT:
-                try:
-                    pix = page.get_pixmap(dpi=300)
-                    img = Image.open(io.BytesIO(pix.tobytes("png")))
-                    text = pytesseract.image_to_string(img)
-                except Exception:
-                    text = text or ""
-            else:
-                # Vision OCR fallback via OpenAI (no Tesseract needed)
-                try:
-                    pix = page.get_pixmap(dpi=240)
-                    import base64
-                    b64 = base64.b64encode(pix.tobytes("png")).decode("utf-8")
-                    vision_prompt = "Extract all readable text on this page. Return plain text only."
-                    resp = client.chat.completions.create(
-                        model=os.getenv("OPENAI_VISION_MODEL", "gpt-4o-mini"),
-                        messages=[{
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": vision_prompt},
-                                {"type": "input_image", "image_url": f"data:image/png;base64,{b64}"}
-                            ],
-                        }],
-                        temperature=0.0,
-                    )
-                    text = resp.choices[0].message.content or ""
-                except Exception:
-                    text = text or ""
-        pages.append({"page": i + 1, "text": text})
-    return pages
-
-
-def extract_docx_with_pages(path: str) -> List[Dict[str, Any]]:
-    """DOCX has no true pagination; treat whole doc as page 1."""
-    d = Document(path)
-    text = "\n".join(p.text for p in d.paragraphs)
-    return [{"page": 1, "text": text}]
-
-
-def chunk_pages(pages: List[Dict[str, Any]], max_chars: int = 8000) -> List[Dict[str, Any]]:
-    """Group page texts into chunks of ~max_chars, carrying page provenance."""
-    chunks: List[Dict[str, Any]] = []
-    buff, buff_pages = "", []
+    # Text layer is extracted in worker processes sharded by page range; blank pages then go
+    # through the pooled Tesseract stage (utils/ocr.py) when it's available.
+    return extract_pdf_text(path, ocr=ocr, workers=PDF_WORKERS, ocr_cache=ocr_cache)
+
+
+async def vision_fallback(path: str, pages: List[Dict[str, Any]]) -> None:
+    """Fill blank pages in place via the vision model (OCR requested, no Tesseract here).
+
+    Batches of page images share the model scheduler and rate-limit gate with chunk calls.
+    """
+    blank = [p["page"] for p in pages if not (p.get("text") or "").strip()]
+    if not blank:
+        return
+    owner = object()
+
+    async def complete(messages: List[Dict[str, Any]]) -> str:
+        async with model_scheduler.slot(owner):
+            with model_call("vision", VISION_MODEL) as m:
+                resp = await model_gate.acreate(aclient, "vision", model=VISION_MODEL, messages=messages, temperature=0.0)
+                m.usage(resp.usage)
+        return resp.choices[0].message.content or ""
+
+    texts = await vision_ocr_pages(path, blank, complete, cache=ocr_cache, model=VISION_MODEL)
     for p in pages:
-        header = f"[[PAGE {p['page']}]]\n"
-        candidate = header + (p.get("text") or "") + "\n\n"
-        if len(buff) + len(candidate) > max_chars and buff:
-            chunks.append({"text": buff, "pages": buff_pages[:]})
-            buff, buff_pages = "", []
-        buff += candidate
-        buff_pages.append(p["page"])
-    if buff:
-        chunks.append({"text": buff, "pages": buff_pages})
-    return chunks
+        if texts.get(p["page"]):
+            p["text"] = texts[p["page"]]
+
 
 # ----------------------------------------------------------------------------
 # Schema & instructions
@@ -260,6 +248,86 @@ Checklist to look for:
 - Special conditions & caveats (contract specials, restrictions)
 """
 
+PROMPT_TEMPLATE = """{instructions}
+Sections in scope for this excerpt: {sections}
+
+SOURCE:
+{source}
+
+Return JSON ONLY, matching this JSON schema loosely (names/types):
+{schema}
+"""
+
+# Bump-free cache invalidation: any edit to the schema, instructions or template changes this.
+PROMPT_VERSION = fingerprint(SECTION32_SCHEMA, EXTRACTION_INSTRUCTIONS, PROMPT_TEMPLATE)[:12]
+
+# ----------------------------------------------------------------------------
+# Result caches (whole document + per chunk)
+# ----------------------------------------------------------------------------
+CACHE_DB = os.getenv("CACHE_DB", DEFAULT_CACHE_DB)
+result_cache = SqliteCache(
+    CACHE_DB,
+    "document_results",
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "500")),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_MB", "128")) * 1024 * 1024,
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_HOURS", "168")) * 3600,
+)
+
+
+chunk_cache = SqliteCache(
+    CACHE_DB,
+    "chunk_results",
+    max_entries=int(os.getenv("CHUNK_CACHE_MAX_ENTRIES", "20000")),
+    max_bytes=int(os.getenv("CHUNK_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    ttl_seconds=float(os.getenv("CHUNK_CACHE_TTL_HOURS", "720")) * 3600,
+)
+
+# OCR text keyed by the hash of the rendered page image (see utils/ocr.py).
+ocr_cache = SqliteCache(
+    CACHE_DB,
+    "ocr_pages",
+    max_entries=int(os.getenv("OCR_CACHE_MAX_ENTRIES", "50000")),
+    max_bytes=int(os.getenv("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    ttl_seconds=float(os.getenv("OCR_CACHE_TTL_HOURS", "720")) * 3600,
+)
+
+
+# Extracted pages + BM25 index per uploaded document, for /ask {doc_id}.
+doc_store = DocStore(
+    os.getenv("DOC_STORE_DIR", DEFAULT_DOC_STORE_DIR),
+    max_docs=int(os.getenv("DOC_STORE_MAX_DOCS", "2000")),
+)
+ASK_MAX_PASSAGES = int(os.getenv("ASK_MAX_PASSAGES", "12"))
+
+
+# Durable record of each analysed document (pages, chunk outputs, summary) for
+# GET /documents/{id}. Postgres when DATABASE_URL is set, else a local SQLite file.
+DATABASE_URL = os.getenv("DATABASE_URL") or DEFAULT_DATABASE_URL
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+store: Optional[Store] = None  # created on startup
+
+
+def _open_store() -> Optional[Store]:
+    # An unreachable database shouldn't keep the app from starting: /upload works without
+    # it (nothing is persisted) and GET /documents/{id} answers 503.
+    try:
+        return Store(DATABASE_URL, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, connect_timeout=DB_CONNECT_TIMEOUT)
+    except Exception as e:
+        print("STORE: database unavailable, running without the document store:", type(e).__name__, e)
+        return None
+feedback_sink = FeedbackSink(lambda rows: store.save_feedback(rows))
+
+
+def document_id(sha256: str) -> str:
+    return sha256[:32]
+
+
+def document_cache_key(sha256: str, ocr: Optional[str], routed: bool = True, dedup: bool = True,
+                       rules: bool = True) -> str:
+    return fingerprint(sha256, MODEL, PROMPT_VERSION, ocr, routed, dedup and DEDUP_THRESHOLD, rules and RULES_VERSION)
+
 # ----------------------------------------------------------------------------
 # Model helpers
 # ----------------------------------------------------------------------------
@@ -272,67 +340,131 @@ def _extract_json(text: str) -> Dict[str, Any]:
     return json.loads(snippet)
 
 
-def call_model(chunk_text: str) -> Dict[str, Any]:
-    prompt = f"""{EXTRACTION_INSTRUCTIONS}
+def _build_prompt(chunk_text: str, sections: Optional[List[str]] = None,
+                  omit: Optional[Dict[str, List[str]]] = None) -> str:
+    """Prompt for one chunk. `sections` narrows the schema to what the router found on its pages;
+    `omit` drops fields the rule layer already resolved."""
+    sections = sections or SECTIONS
+    return PROMPT_TEMPLATE.format(
+        instructions=EXTRACTION_INSTRUCTIONS,
+        sections=", ".join(sections),
+        source=chunk_text,
+        schema=json.dumps(sub_schema(SECTION32_SCHEMA, sections, omit), separators=(",", ":")),
+    )
 
-SOURCE:
-{chunk_text}
 
-Return JSON ONLY, matching this JSON schema loosely (names/types):
-{json.dumps(SECTION32_SCHEMA, indent=2)}
-"""
-    resp = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-    )
+def call_model(chunk_text: str, sections: Optional[List[str]] = None,
+               omit: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    with model_call("chunk", MODEL) as m:
+        resp = model_gate.create(
+            client, "chunk",
+            model=MODEL,
+            messages=[{"role": "user", "content": _build_prompt(chunk_text, sections, omit)}],
+            temperature=0.2,
+        )
+        m.usage(resp.usage)
     txt = resp.choices[0].message.content or "{}"
     return _extract_json(txt)
 
 
-def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
-    out: Dict[str, Any] = {}
-
-    def union_list(a, b):
-        if isinstance(a, list) and isinstance(b, list):
-            return sorted(list({x for x in (a + b) if x not in (None, "")}))
-        if isinstance(a, list):
-            return a
-        if isinstance(b, list):
-            return b
-        return []
-
-    wanted = [
-        "title","mortgages","planning_zoning","rates_outgoings",
-        "insurance","building_permits","notices","special_conditions"
-    ]
-
-    for r in results:
-        for key, val in r.items():
-            if key in wanted and isinstance(val, dict):
-                out.setdefault(key, {})
-                cur = out[key]
-                for k, v in val.items():
-                    if k == "page_refs" and isinstance(v, list):
-                        cur.setdefault("page_refs", [])
-                        cur["page_refs"] = sorted(list(set(cur["page_refs"] + v)))
-                    elif k == "supporting_doc_present":
-                        cur["supporting_doc_present"] = bool(v) or cur.get("supporting_doc_present", False)
-                    elif isinstance(v, list):
-                        cur[k] = union_list(cur.get(k, []), v)
-                    else:
-                        cur[k] = v or cur.get(k)
-            elif key == "missing_or_unclear" and isinstance(val, list):
-                out.setdefault("missing_or_unclear", [])
-                out["missing_or_unclear"] = union_list(out["missing_or_unclear"], val)
-
-    for req in wanted:
-        out.setdefault(req, {})
-        out[req].setdefault("supporting_doc_present", False)
-        out[req].setdefault("page_refs", [])
-
-    out.setdefault("missing_or_unclear", [])
-    return out
+async def acall_model(chunk_text: str, sections: Optional[List[str]] = None,
+                      omit: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    """Async twin of call_model; does not block the event loop while waiting on the API."""
+    with model_call("chunk", MODEL) as m:
+        resp = await model_gate.acreate(
+            aclient, "chunk",
+            model=MODEL,
+            messages=[{"role": "user", "content": _build_prompt(chunk_text, sections, omit)}],
+            temperature=0.2,
+        )
+        m.usage(resp.usage)
+    txt = resp.choices[0].message.content or "{}"
+    return _extract_json(txt)
+
+
+# Instructions + full schema ride along with every chunk; the chunker budgets around them.
+PROMPT_OVERHEAD_TOKENS = count_tokens(_build_prompt("(Pages: [])\n"), MODEL)
+
+# Local keyword pre-classification (utils/route.py): chunks are prompted only for the
+# sections their pages look like, and pages matching nothing are skipped.
+ROUTE_PAGES = os.getenv("ROUTE_PAGES", "true").lower() == "true"
+
+# Per-request budgets (utils/usage.py): 0 = unlimited; BUDGET_MODE=refuse|degrade.
+UPLOAD_MAX_PAGES = usage.UPLOAD_MAX_PAGES
+UPLOAD_MAX_TOKENS = usage.UPLOAD_MAX_TOKENS
+BUDGET_MODE = usage.BUDGET_MODE
+BUDGET_COMPLETION_ALLOWANCE = usage.BUDGET_COMPLETION_ALLOWANCE
+
+
+def chunk_cache_key(chunk_with_pages: str, sections: Optional[List[str]] = None,
+                    omit: Optional[Dict[str, List[str]]] = None) -> str:
+    # Normalise whitespace so re-OCR'd or re-flowed text with the same content still hits.
+    parts = [MODEL, PROMPT_VERSION, sections or SECTIONS, " ".join(chunk_with_pages.split())]
+    if omit:
+        parts.append(omit)  # a narrower schema is a different prompt
+    return fingerprint(*parts)
+
+
+async def _extract_chunk(ch: Dict[str, Any], owner: Hashable,
+                         stats: Dict[str, int], use_cache: bool = True) -> Dict[str, Any]:
+    chunk_with_pages = f"(Pages: {ch['pages']})\n" + ch["text"]
+    section_pages = ch.get("sections") or {s: ch["pages"] for s in SECTIONS}
+    sections = list(section_pages)
+    omit = ch.get("omit") or None
+    key = chunk_cache_key(chunk_with_pages, sections, omit)
+    if use_cache:
+        cached = await run_in_threadpool(chunk_cache.get, key)
+        if cached is not None:
+            stats["reused"] += 1
+            return cached
+    try:
+        async with model_scheduler.slot(owner):
+            meter = usage.current()
+            if meter is not None and meter.exhausted():
+                # Actual usage overran the up-front estimate: skip what hasn't started.
+                stats["skipped"] += 1
+                return {"missing_or_unclear": [f"Pages {ch['pages']} not analysed: token budget exhausted"],
+                        "_failed": True}
+            js = await acall_model(chunk_with_pages, sections, omit)
+        # ensure page refs present (only the pages routed to that section)
+        for sect in SECTIONS:
+            if sect in js and isinstance(js[sect], dict):
+                prs = set(js[sect].get("page_refs", [])) | set(section_pages.get(sect, ch["pages"]))
+                js[sect]["page_refs"] = sorted(list(prs))
+        stats["recomputed"] += 1
+        await run_in_threadpool(chunk_cache.set, key, js)
+        return js
+    except Exception as e:
+        stats["failed"] += 1
+        return {"missing_or_unclear": [f"Chunk failed: {e}"], "_failed": True}
+
+
+async def extract_chunks(chunks: List[Dict[str, Any]], stats: Optional[Dict[str, int]] = None,
+                         use_cache: bool = True,
+                         on_chunk: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                         owner: Optional[Hashable] = None) -> List[Dict[str, Any]]:
+    """Queue all chunks on the model scheduler; results come back in chunk order.
+
+    Chunks already answered for this model/prompt version are served from the chunk cache;
+    `stats` collects reused/recomputed/failed counts. `on_chunk(index, result)` is called as
+    each chunk completes (in completion order). `owner` is the scheduler's fairness key
+    (default: this call is its own document).
+    """
+    if stats is None:
+        stats = {}
+    for k in ("reused", "recomputed", "failed", "skipped"):
+        stats.setdefault(k, 0)
+    if owner is None:
+        owner = object()
+
+    async def run(i: int, ch: Dict[str, Any]) -> Dict[str, Any]:
+        js = await _extract_chunk(ch, owner, stats, use_cache)
+        if on_chunk is not None:
+            on_chunk(i, js)
+        return js
+
+    return await asyncio.gather(*(run(i, ch) for i, ch in enumerate(chunks)))
+
 
 # ----------------------------------------------------------------------------
 # Pydantic models for auxiliary endpoints
@@ -340,12 +472,98 @@ def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
 class AskPayload(BaseModel):
     question: str
     context: Optional[str] = None
+    doc_id: Optional[str] = None  # from /upload; retrieves passages instead of using `context`
+    top_k: int = 6
 
 class EmailPayload(BaseModel):
     to: str
     subject: str
     body: str
 
+# Background SMTP delivery (SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_FROM, SMTP_STARTTLS);
+# None when SMTP isn't configured.
+mailer = Mailer.from_env()
+
+# ----------------------------------------------------------------------------
+# Background jobs (POST /jobs runs the /upload pipeline out of band)
+# ----------------------------------------------------------------------------
+JOB_DIR = os.getenv("JOB_DIR", DEFAULT_JOB_DIR)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "200"))
+job_store = JobStore(
+    os.getenv("JOBS_DB", os.path.join(JOB_DIR, "jobs.sqlite3")),
+    JOB_DIR,
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "300")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+)
+
+
+async def _run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    # The callbacks run on the event loop, once per chunk; the SQLite write goes to the
+    # threadpool, one at a time, always with the latest counts.
+    progress: Dict[str, Any] = {"done": 0, "total": None, "final": False}
+    changed = asyncio.Event()
+
+    async def write_progress() -> None:
+        while True:
+            await changed.wait()
+            changed.clear()
+            await run_in_threadpool(job_store.progress, job["id"], done=progress["done"], total=progress["total"])
+            if progress["final"] and not changed.is_set():
+                return
+
+    def on_chunk(i: int, js: Dict[str, Any]) -> None:
+        progress["done"] += 1
+        changed.set()
+
+    def on_chunks_planned(chunks: List[Dict[str, Any]], prefilled: Dict[str, Any]) -> None:
+        progress.update(done=0, total=len(chunks))
+        changed.set()
+
+    writer = asyncio.create_task(write_progress())
+    try:
+        return await analyze_document(
+            job["path"], job["filename"], job["sha256"],
+            no_cache=job["options"].get("no_cache", False),
+            on_chunk=on_chunk,
+            on_chunks_planned=on_chunks_planned,
+        )
+    finally:
+        # One last write with the final counts, after any still in flight.
+        progress["final"] = True
+        changed.set()
+        await writer
+
+
+job_runner = JobRunner(
+    job_store, _run_job, workers=JOB_WORKERS,
+    retention_seconds=float(os.getenv("JOB_RETENTION_HOURS", "24")) * 3600,
+)
+
+# ----------------------------------------------------------------------------
+# Lifecycle
+# ----------------------------------------------------------------------------
+@app.on_event("startup")
+async def _startup():
+    global store
+    store = await run_in_threadpool(_open_store)
+    feedback_sink.start()
+    if mailer is not None:
+        mailer.start()
+    job_runner.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown_pools():
+    await job_runner.stop()
+    shutdown_pdf_pool()
+    shutdown_ocr_pool()
+    await feedback_sink.stop()
+    if mailer is not None:
+        await mailer.stop()
+    if store is not None:
+        store.close()
+
 # ----------------------------------------------------------------------------
 # Routes
 # ----------------------------------------------------------------------------
@@ -354,44 +572,436 @@ async def root():
     return {"status": "ok", "model": MODEL}
 
 
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    # Decide OCR based on env & availability
-    ocr_enabled = os.getenv("ENABLE_OCR", "false").lower() == "true" and _HAS_TESSERACT
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
-
-    # Extract
-    if file.filename.lower().endswith(".pdf"):
-        pages = extract_pdf_with_pages(tmp_path, ocr=ocr_enabled)
-    elif file.filename.lower().endswith(".docx"):
-        pages = extract_docx_with_pages(tmp_path)
-    else:
+@app.get("/metrics")
+async def prometheus_metrics():
+    try:
+        body, content_type = render_metrics()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "result_cache": await run_in_threadpool(result_cache.stats),
+        "chunk_cache": await run_in_threadpool(chunk_cache.stats),
+        "ocr_cache": await run_in_threadpool(ocr_cache.stats),
+    }
+
+
+def _check_file_type(filename: Optional[str]) -> str:
+    name = (filename or "").lower()
+    if not (name.endswith(".pdf") or name.endswith(".docx")):
         raise HTTPException(status_code=400, detail="Unsupported file type. Please upload PDF or DOCX.")
+    return name
+
+
+async def analyze_document(path: str, filename: str, sha256: str, no_cache: bool = False,
+                           on_chunk: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                           on_chunks_planned: Optional[Callable[[List[Dict[str, Any]], Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """The /upload pipeline (cache → extract → chunk → model → merge) over a file already on disk.
+
+    The caller owns `path`. Returns the /upload response body, with the request's token `usage`.
+    `on_chunks_planned(chunks, prefilled)` gets the planned chunks and the rule layer's fields.
+    Raises 413 when the document is over the page/token budget (utils/usage.py); inside
+    /upload/batch that budget is shared with the other files of the request.
+    """
+    with usage.metering(UPLOAD_MAX_TOKENS, UPLOAD_MAX_PAGES) as meter:
+        try:
+            result = await _analyze_document(path, filename, sha256, no_cache, on_chunk, on_chunks_planned)
+        except usage.BudgetExceeded as e:
+            raise HTTPException(status_code=413, detail=str(e))
+    result["usage"] = meter.report()
+    return result
+
+
+def _pdf_page_count(path: str) -> int:
+    with open_pdf(path) as doc:
+        return doc.page_count
+
+
+async def _analyze_document(path: str, filename: str, sha256: str, no_cache: bool,
+                            on_chunk: Optional[Callable[[int, Dict[str, Any]], None]],
+                            on_chunks_planned: Optional[Callable[[List[Dict[str, Any]], Dict[str, Any]], None]]) -> Dict[str, Any]:
+    timer = StageTimer()
+    # Decide OCR based on env & availability: Tesseract if installed, else the vision model
+    ocr_engine = None
+    if os.getenv("ENABLE_OCR", "false").lower() == "true":
+        ocr_engine = "tesseract" if _HAS_TESSERACT else "vision"
+    name = _check_file_type(filename)
+
+    doc_id = document_id(sha256)
+    cache_key = document_cache_key(sha256, ocr_engine, ROUTE_PAGES, DEDUP_PAGES, RULES_PREFILL)
+    # A hit also needs the stored pages (for /ask) and the document record (for GET /documents);
+    # if either is missing, re-extract (model output then comes from the chunk cache).
+    if not no_cache and await run_in_threadpool(doc_store.exists, doc_id) and await _is_persisted(doc_id):
+        cached = await run_in_threadpool(result_cache.get, cache_key)
+        if cached is not None:
+            timer.lap("cache")
+            metrics.DOCUMENTS.labels("cached").inc()
+            return {"summary": cached["summary"], "pages": cached["pages"], "file": filename,
+                    "doc_id": doc_id, "cached": True, "timings": timer.report()}
+    timer.lap("cache")
+
+    # Extract (fitz/OCR are blocking; keep them off the event loop)
+    if name.endswith(".pdf"):
+        # Refuse before OCR/vision spend anything on an oversized bundle.
+        usage.check_pages(await run_in_threadpool(_pdf_page_count, path))
+        pages = await run_in_threadpool(extract_pdf_with_pages, path, ocr=ocr_engine == "tesseract")
+        if ocr_engine == "vision":
+            await vision_fallback(path, pages)
+    else:
+        pages = await run_in_threadpool(extract_docx_with_pages, path)
 
     if not pages or all(not (p.get("text") or "").strip() for p in pages):
         raise HTTPException(status_code=422, detail="No text could be extracted. Enable OCR or provide a text-based file.")
+    timer.lap("extract")
+    metrics.PAGES.inc(len(pages))
+    usage.check_pages(len(pages), charge=True)
+    await run_in_threadpool(doc_store.save, doc_id, filename, pages)
+    timer.lap("index")
 
-    # Chunk and extract
-    chunks = chunk_pages(pages, max_chars=8000)
-    results: List[Dict[str, Any]] = []
+    # Route, chunk and extract
+    routes = await run_in_threadpool(route_pages, pages) if ROUTE_PAGES else {}
+    routed = [p for p in pages if routes.get(p["page"])]
+    if not routed:
+        # Nothing looked like a Section 32 page (or routing is off): send everything, full schema.
+        routes = {p["page"]: list(SECTIONS) for p in pages}
+        routed = pages
+    timer.lap("route")
+    aliases: Dict[int, List[int]] = {}
+    dedup = None
+    if DEDUP_PAGES:
+        routed, aliases, dedup = await run_in_threadpool(dedup_pages, routed, model=MODEL)
+        # A kept page is asked about every section its duplicates were routed to.
+        for rep, dups in aliases.items():
+            tags = set(routes.get(rep, [])).union(*(routes.get(d, []) for d in dups))
+            routes[rep] = [s for s in SECTIONS if s in tags]
+        metrics.DEDUPED_PAGES.labels("duplicate").inc(sum(len(v) for v in aliases.values()))
+        metrics.DEDUPED_PAGES.labels("blank").inc(len(dedup["blank_pages"]))
+        timer.lap("dedup")
+    model_routes, omit, prefilled, rules = routes, {}, {}, None
+    if RULES_PREFILL:
+        fields = await run_in_threadpool(extract_fields, routed, routes)
+        covered = covered_sections(fields, SECTION32_SCHEMA)
+        omit = resolved_fields(fields)
+        prefilled = expand_page_refs(prefill(fields, {s: [n for n, tags in routes.items() if s in tags] for s in covered}), aliases)
+        # Covered sections aren't asked about; pages routed only to them aren't sent.
+        model_routes = {n: [s for s in tags if s not in covered] for n, tags in routes.items()}
+        before = len(routed)
+        routed = [p for p in routed if model_routes.get(p["page"])]
+        rules = {**rules_report(fields, covered), "pages_skipped": before - len(routed)}
+        metrics.RULE_FIELDS.labels("resolved").inc(sum(len(v) for v in omit.values()))
+        metrics.RULE_FIELDS.labels("ambiguous").inc(len(rules["ambiguous"]))
+        timer.lap("rules")
+    chunks = await run_in_threadpool(
+        chunk_pages, routed, max_tokens=CHUNK_MAX_TOKENS, model=MODEL, reserve_tokens=PROMPT_OVERHEAD_TOKENS
+    ) if routed else []
     for ch in chunks:
-        chunk_with_pages = f"(Pages: {ch['pages']})\n" + ch["text"]
+        ch["sections"] = chunk_sections(ch["pages"], model_routes)
+        ch["omit"] = {s: omit[s] for s in ch["sections"] if s in omit}
+    chunks, budget = _apply_token_budget(chunks)
+    if on_chunks_planned is not None:
+        on_chunks_planned(chunks, prefilled)
+    timer.lap("chunk")
+    chunk_stats: Dict[str, int] = {}
+    merged = MergeAccumulator()
+    if prefilled:
+        merged.add(prefilled)
+
+    def fold(i: int, js: Dict[str, Any]) -> None:
+        js = expand_page_refs(js, aliases)  # cite the duplicates of each page too
+        merged.add(js)
+        if on_chunk is not None:
+            on_chunk(i, js)
+
+    results = await extract_chunks(chunks, chunk_stats, use_cache=not no_cache, on_chunk=fold)
+
+    timer.lap("model")
+    for outcome, n in chunk_stats.items():
+        metrics.CHUNKS.labels(outcome).inc(n)
+    if budget.get("dropped_pages"):
+        merged.add({"missing_or_unclear": [
+            f"Pages {usage.page_ranges(budget['dropped_pages'])} not analysed: over the token budget ({budget['limit']})"]})
+    summary = merged.snapshot()
+    timer.lap("merge")
+    page_numbers = [p["page"] for p in pages]
+    # Don't pin partial results: a transient API failure shouldn't be served for a week.
+    if not any(r.get("_failed") for r in results) and not budget.get("dropped_pages"):
+        await run_in_threadpool(result_cache.set, cache_key, {"summary": summary, "pages": page_numbers})
+    await _persist_document(doc_id, filename, sha256, pages, summary, chunks, results)
+    timer.lap("persist")
+    partial = chunk_stats.get("failed") or chunk_stats.get("skipped") or budget.get("dropped_pages")
+    metrics.DOCUMENTS.labels("partial" if partial else "computed").inc()
+    return {
+        "summary": summary,
+        "pages": page_numbers,
+        "file": filename,
+        "doc_id": doc_id,
+        "chunk_cache": chunk_stats,
+        "chunking": chunk_report(chunks, CHUNK_MAX_TOKENS - PROMPT_OVERHEAD_TOKENS),
+        "routing": routing_report(routes),
+        "dedup": dedup,
+        "rules": rules,
+        "budget": budget,
+        "timings": timer.report(),
+    }
+
+
+def _apply_token_budget(chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Estimate the request's tokens from the planned chunks; refuse or trim per BUDGET_MODE."""
+    per_chunk = PROMPT_OVERHEAD_TOKENS + BUDGET_COMPLETION_ALLOWANCE
+    estimate = sum(ch.get("tokens", 0) for ch in chunks) + per_chunk * len(chunks)
+    budget: Dict[str, Any] = {"estimated_tokens": estimate, "limit": UPLOAD_MAX_TOKENS or None}
+    meter = usage.current()
+    # Less than the limit once vision OCR (or, in a batch, the other files) has spent some.
+    remaining = meter.remaining_tokens() if meter is not None else (UPLOAD_MAX_TOKENS or None)
+    if remaining is None or estimate <= remaining:
+        if meter is not None:
+            meter.reserve(meter.total_tokens + estimate)
+        return chunks, budget
+    if remaining <= 0:
+        raise usage.BudgetExceeded(f"The request's token budget ({UPLOAD_MAX_TOKENS}) is used up.")
+    if BUDGET_MODE != "degrade":
+        left = f"{remaining} of the request's {UPLOAD_MAX_TOKENS}-token budget are left" \
+            if remaining < UPLOAD_MAX_TOKENS else f"the per-request budget is {UPLOAD_MAX_TOKENS}"
+        raise usage.BudgetExceeded(f"Estimated {estimate} tokens for {len(chunks)} chunks; {left}.")
+    kept, dropped = usage.fit_chunks(chunks, remaining, per_chunk)
+    if meter is not None:
+        meter.reserve(meter.total_tokens + sum(chunks[i].get("tokens", 0) + per_chunk for i in kept))
+    budget["degraded"] = True
+    budget["dropped_pages"] = sorted({n for i in dropped for n in chunks[i]["pages"]} -
+                                     {n for i in kept for n in chunks[i]["pages"]})
+    return [chunks[i] for i in kept], budget
+
+
+async def _is_persisted(doc_id: str) -> bool:
+    if store is None:
+        return True
+    try:
+        return await run_in_threadpool(store.has_document, doc_id)
+    except Exception:
+        return True  # database down: still serve the cached summary
+
+
+async def _persist_document(doc_id: str, filename: str, sha256: str, pages: List[Dict[str, Any]],
+                            summary: Dict[str, Any], chunks: List[Dict[str, Any]],
+                            results: List[Dict[str, Any]]) -> None:
+    # The summary is already computed; a database outage shouldn't cost the caller it.
+    if store is None:
+        return
+    meter = usage.current()
+    try:
+        await run_in_threadpool(
+            store.save_document, doc_id, filename, sha256, pages, summary,
+            chunks=chunks, outputs=results, model=MODEL, prompt_version=PROMPT_VERSION,
+            usage=meter.report() if meter is not None else None,
+        )
+    except Exception as e:
+        print("STORE: could not save document", doc_id, e)
+
+
+@app.post("/upload")
+async def upload(file: UploadFile = File(...), no_cache: bool = False):
+    _check_file_type(file.filename)
+    # Stream to disk in blocks (hashing on the way) rather than buffering the upload in RAM.
+    tmp_path, sha256, _ = await spool_upload(file)
+    try:
+        return await analyze_document(tmp_path, file.filename, sha256, no_cache=no_cache)
+    finally:
+        remove_quietly(tmp_path)
+
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event) + "\n").encode("utf-8")
+
+
+@app.post("/upload/stream")
+async def upload_stream(file: UploadFile = File(...), no_cache: bool = False):
+    """Same pipeline as /upload, streamed as NDJSON: `start`, `plan`, one `chunk` event per
+    completed chunk carrying the merged-so-far summary, then `result` with the exact /upload
+    body (or `error` with status/detail)."""
+    _check_file_type(file.filename)
+    tmp_path, sha256, _ = await spool_upload(file)
+
+    async def events():
+        queue: asyncio.Queue = asyncio.Queue()
+        chunks: List[Dict[str, Any]] = []
+        merged = MergeAccumulator()
+        done = 0
+
+        async def run():
+            try:
+                res = await analyze_document(
+                    tmp_path, file.filename, sha256, no_cache=no_cache,
+                    on_chunk=lambda i, js: queue.put_nowait(("chunk", i, js)),
+                    on_chunks_planned=lambda chs, prefilled: queue.put_nowait(("plan", chs, prefilled)),
+                )
+                queue.put_nowait(("result", res))
+            except HTTPException as e:
+                queue.put_nowait(("error", e.status_code, e.detail))
+            except Exception as e:
+                queue.put_nowait(("error", 500, f"Processing failed: {e}"))
+
+        task = asyncio.create_task(run())
         try:
-            js = call_model(chunk_with_pages)
-            # ensure page refs present
-            for sect in ["title","mortgages","planning_zoning","rates_outgoings","insurance","building_permits","notices","special_conditions"]:
-                if sect in js and isinstance(js[sect], dict):
-                    prs = set(js[sect].get("page_refs", [])) | set(ch["pages"])
-                    js[sect]["page_refs"] = sorted(list(prs))
-            results.append(js)
-        except Exception as e:
-            results.append({"missing_or_unclear": [f"Chunk failed: {e}"]})
+            yield _ndjson({"event": "start", "file": file.filename})
+            while True:
+                item = await queue.get()
+                if item[0] == "plan":
+                    _, chunks, prefilled = item
+                    if prefilled:
+                        merged.add(prefilled)  # rule-layer fields show up from the first snapshot
+                    yield _ndjson({"event": "plan", "chunks": len(chunks),
+                                   "tokens_per_chunk": [ch.get("tokens") for ch in chunks],
+                                   "pages": sorted({p for ch in chunks for p in ch["pages"]})})
+                elif item[0] == "chunk":
+                    _, i, js = item
+                    merged.add(js)
+                    done += 1
+                    yield _ndjson({
+                        "event": "chunk",
+                        "index": i,
+                        "pages": chunks[i]["pages"] if i < len(chunks) else [],
+                        "done": done,
+                        "total": len(chunks),
+                        "summary": merged.snapshot(),
+                    })
+                elif item[0] == "result":
+                    yield _ndjson({"event": "result", **item[1]})
+                    return
+                else:
+                    yield _ndjson({"event": "error", "status": item[1], "detail": item[2]})
+                    return
+        finally:
+            task.cancel()
+            remove_quietly(tmp_path)
+
+    # The background task covers clients that disconnect before the body starts streaming.
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(remove_quietly, tmp_path))
+
 
-    summary = merge_results(results)
-    return {"summary": summary, "pages": [p["page"] for p in pages], "file": file.filename}
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...), no_cache: bool = False):
+    """Several documents in one request (PDF/DOCX files and/or .zip bundles of them).
+
+    Files are analysed in parallel; their chunks share the fair model scheduler with every
+    other request, so a large bundle doesn't starve the small certificates beside it.
+    Returns per-file results (or per-file errors), one combined summary across the files
+    that succeeded, and the total token usage.
+    """
+    items: List[Tuple[str, str, str]] = []  # (filename, path, sha256)
+    runs: Dict[str, asyncio.Task] = {}
+    try:
+        for f in files:
+            if (f.filename or "").lower().endswith(".zip"):
+                zpath, _, _ = await spool_upload(f)
+                try:
+                    items.extend(await run_in_threadpool(unpack_zip, zpath, max_files=BATCH_MAX_FILES - len(items)))
+                finally:
+                    remove_quietly(zpath)
+            else:
+                _check_file_type(f.filename)
+                if len(items) >= BATCH_MAX_FILES:
+                    raise HTTPException(status_code=413, detail=f"Too many files (limit {BATCH_MAX_FILES}).")
+                path, sha256, _ = await spool_upload(f)
+                items.append((f.filename, path, sha256))
+        if not items:
+            raise HTTPException(status_code=400, detail="No PDF or DOCX files in the upload.")
+
+        # One page/token budget for the whole request: each file's meter spends this one's too,
+        # so files that start after it runs out are refused (413) or skip their remaining chunks.
+        with usage.metering(UPLOAD_MAX_TOKENS, UPLOAD_MAX_PAGES) as meter:
+            # The same document twice in one bundle is analysed once.
+            for filename, path, sha256 in items:
+                if sha256 not in runs:
+                    runs[sha256] = asyncio.ensure_future(analyze_document(path, filename, sha256, no_cache=no_cache))
+            await asyncio.wait(runs.values())
+
+        results: List[Dict[str, Any]] = []
+        for filename, _, sha256 in items:
+            task = runs[sha256]
+            exc = task.exception()
+            if exc is None:
+                results.append({**task.result(), "file": filename})
+            elif isinstance(exc, HTTPException):
+                results.append({"file": filename, "error": exc.detail, "status": exc.status_code})
+            else:
+                results.append({"file": filename, "error": f"Processing failed: {exc}", "status": 500})
+        ok = [r for r in results if "summary" in r]
+        return {
+            "files": results,
+            # page_refs in the combined summary are each file's own page numbers;
+            # sections_by_file says which files they came from.
+            "summary": merge_results([r["summary"] for r in ok]),
+            "sections_by_file": {s: [r["file"] for r in ok if (r["summary"].get(s) or {}).get("supporting_doc_present")]
+                                 for s in SECTIONS},
+            "usage": meter.report(),
+        }
+    finally:
+        for task in runs.values():
+            task.cancel()  # client went away mid-batch
+        for _, path, _ in items:
+            remove_quietly(path)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...), no_cache: bool = False):
+    _check_file_type(file.filename)
+    stats = await run_in_threadpool(job_store.stats)
+    if stats["queued"] >= JOB_MAX_QUEUED:
+        raise HTTPException(status_code=503, detail="Job queue is full; retry later.")
+    path, sha256, _ = await spool_upload(file, dir=JOB_DIR)
+    try:
+        job_id = await run_in_threadpool(job_store.create, file.filename, path, sha256, {"no_cache": no_cache})
+    except Exception:
+        remove_quietly(path)
+        raise
+    job_runner.notify()
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs")
+async def jobs_overview():
+    """Queue depth for capacity planning (shared by all workers using the same JOBS_DB), plus
+    this process's model-call scheduler."""
+    return {**await run_in_threadpool(job_store.stats), "workers_per_process": JOB_WORKERS,
+            "model_scheduler": model_scheduler.stats(), "model_api": await run_in_threadpool(model_gate.stats)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    out = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "file": job["filename"],
+        "progress": {"chunks_done": job["chunks_done"], "chunks_total": job["chunks_total"]},
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["status"] == "done":
+        out["result"] = job["result"]
+    elif job["status"] == "failed":
+        out["error"] = job["error"]
+    return out
+
+
+@app.get("/documents/{doc_id}")
+async def get_document(doc_id: str, pages: bool = False, chunks: bool = False):
+    """A previously analysed document's summary (optionally with page text and per-chunk outputs)."""
+    if store is None:
+        raise HTTPException(status_code=503, detail="Document store is not available.")
+    doc = await run_in_threadpool(store.get_document, doc_id, include_pages=pages, include_chunks=chunks)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Unknown document id.")
+    return doc
 
 
 @app.post("/ask")
@@ -399,49 +1009,64 @@ async def ask(payload: AskPayload):
     if not payload.question or not payload.question.strip():
         raise HTTPException(status_code=400, detail="Question is required")
 
-    context_snippet = (payload.context or "").strip()
+    citations: List[Dict[str, Any]] = []
+    if payload.doc_id:
+        doc = await run_in_threadpool(doc_store.load, payload.doc_id)
+        if doc is None:
+            raise HTTPException(status_code=404, detail="Unknown doc_id; upload the document again.")
+        hits = search(doc["index"], payload.question, k=max(1, min(payload.top_k, ASK_MAX_PASSAGES)))
+        context_snippet = "\n\n".join(f"[Page {psg['page']}]\n{psg['text']}" for _, psg in hits)
+        citations = [{"page": psg["page"], "score": round(score, 3), "snippet": psg["text"][:200]}
+                     for score, psg in hits]
+        context_label = "CONTEXT (retrieved passages, each tagged with its page)"
+    else:
+        context_snippet = (payload.context or "").strip()
+        context_label = "CONTEXT (may be truncated)"
     user_prompt = (
         "You are a contract review assistant. Answer concisely and cite any specific sections/pages if you can.\n\n"
-        f"CONTEXT (may be truncated):\n{context_snippet}\n\n"
+        f"{context_label}:\n{context_snippet}\n\n"
         f"QUESTION: {payload.question}\n"
     )
 
-    resp = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": user_prompt}],
-        temperature=0.2,
-    )
+    with usage.metering() as meter, model_call("ask", MODEL) as m:
+        try:
+            resp = await model_gate.acreate(
+                aclient, "ask",
+                model=MODEL,
+                messages=[{"role": "user", "content": user_prompt}],
+                temperature=0.2,
+            )
+        except CircuitOpen as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+        m.usage(resp.usage)
     answer = resp.choices[0].message.content or ""
-    return {"answer": answer}
+    if payload.doc_id:
+        return {"answer": answer, "citations": citations, "usage": meter.report()}
+    return {"answer": answer, "usage": meter.report()}
 
 
 @app.post("/share-email")
 async def share_email(payload: EmailPayload):
-    """Send summary via SMTP if credentials are present; otherwise tell the client to use mailto fallback."""
-    smtp_host = os.getenv("SMTP_HOST")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_pass = os.getenv("SMTP_PASS")
-    smtp_from = os.getenv("SMTP_FROM") or smtp_user
-
-    if not (smtp_host and smtp_user and smtp_pass and smtp_from):
+    """Queue the summary email for background SMTP delivery; without SMTP, tell the client to use mailto fallback.
+
+    `sent: true` means accepted for delivery; poll GET /share-email/{delivery_id} for the outcome.
+    """
+    if mailer is None:
         # No SMTP configured; front-end should fallback to mailto
         return {"sent": False, "note": "SMTP not configured; use client mailto fallback."}
+    delivery_id = await mailer.submit(payload.to, payload.subject, payload.body)
+    if delivery_id is None:
+        raise HTTPException(status_code=503, detail="Email queue is full; try again shortly.",
+                            headers={"Retry-After": "10"})
+    return {"sent": True, "status": "queued", "delivery_id": delivery_id}
 
-    msg = EmailMessage()
-    msg["From"] = smtp_from
-    msg["To"] = payload.to
-    msg["Subject"] = payload.subject
-    msg.set_content(payload.body)
 
-    try:
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-        return {"sent": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Email send failed: {e}")
+@app.get("/share-email/{delivery_id}")
+async def share_email_status(delivery_id: str):
+    status = await mailer.status(delivery_id) if mailer is not None else None
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown delivery id.")
+    return status
 
 
 # Local dev entrypoint
@@ -0,0 +1,108 @@
+"""
+Benchmark the streaming DOCX extractor (utils/extract.py) against loading through python-docx.
+
+    python scripts/bench_docx.py path/to/contract.docx
+    python scripts/bench_docx.py --pages 400        # synthetic contract: paragraphs, tables, page breaks
+
+Each run is in a fresh process; peak memory is the growth of its max RSS during extraction
+(lxml allocates outside Python, so tracemalloc would miss most of it).
+"""
+import argparse, json, multiprocessing, os, resource, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def make_docx(path, pages):
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+    doc = Document()
+    for i in range(pages):
+        doc.add_heading(f"Schedule {i + 1}", level=2)
+        for j in range(12):
+            doc.add_paragraph(f"Clause {i + 1}.{j}: the vendor makes this statement in respect of the land, "
+                              "including title, planning, rates and building permits.")
+        if i % 3 == 0:
+            table = doc.add_table(rows=6, cols=3)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"Item {r}.{c} ${(i + 1) * (r + 1) * 100:,}"
+        if i < pages - 1:
+            doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    doc.save(path)
+
+
+def python_docx(path):
+    """What main.extract_docx_with_pages used to do: paragraphs only, one page."""
+    from docx import Document
+    d = Document(path)
+    return [{"page": 1, "text": "\n".join(p.text for p in d.paragraphs)}]
+
+
+def python_docx_tables(path):
+    """python-docx with table cells too, for a like-for-like text comparison (still one page)."""
+    from docx import Document
+    d = Document(path)
+    lines = [p.text for p in d.paragraphs]
+    for t in d.tables:
+        lines.extend(" | ".join(c.text for c in row.cells) for row in t.rows)
+    return [{"page": 1, "text": "\n".join(lines)}]
+
+
+def streaming(path):
+    from utils.extract import extract_docx_with_pages
+    return extract_docx_with_pages(path)
+
+
+METHODS = {"python-docx": python_docx, "python-docx+tables": python_docx_tables, "streaming": streaming}
+
+
+def _run(method, path, q):
+    fn = METHODS[method]
+    fn(path)  # warm imports; the timed run is the second
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    pages = fn(path)
+    elapsed = time.perf_counter() - t0
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    q.put({"s": elapsed, "peak_kb": after - before, "pages": len(pages), "chars": sum(len(p["text"]) for p in pages)})
+
+
+def measure(method, path):
+    ctx = multiprocessing.get_context("spawn")
+    q = ctx.Queue()
+    p = ctx.Process(target=_run, args=(method, path, q))
+    p.start()
+    out = q.get()
+    p.join()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("docx", nargs="?")
+    ap.add_argument("--pages", type=int, default=400)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    path = args.docx
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), "bench.docx")
+        make_docx(path, args.pages)
+    print(f"{os.path.basename(path)}: {os.path.getsize(path) / 1e6:.1f} MB")
+
+    results = {}
+    for method in METHODS:
+        runs = [measure(method, path) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["s"])
+        results[method] = {**best, "peak_kb": max(r["peak_kb"] for r in runs)}
+    base = results["python-docx"]["s"]
+    print(f"{'method':<20} {'best_s':>8} {'speedup':>8} {'peak_mb':>8} {'pages':>6} {'chars':>9}")
+    for method, r in results.items():
+        print(f"{method:<20} {r['s']:>8.3f} {base / r['s']:>7.2f}x {r['peak_kb'] / 1024:>8.1f} {r['pages']:>6} {r['chars']:>9}")
+    if args.json:
+        print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark page-range sharded PDF extraction (utils/extract.py) across worker counts.
+
+    python scripts/bench_extract.py path/to/bundle.pdf
+    python scripts/bench_extract.py --pages 300          # synthetic text PDF
+"""
+import argparse, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import fitz  # PyMuPDF
+from utils.extract import extract_pdf_with_pages, shutdown_pool
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        y = 60
+        for j in range(50):
+            page.insert_text((50, y), f"Page {i + 1} line {j}: vendor statement, title, planning and rates.", fontsize=9)
+            y += 14
+    doc.save(path)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pdf", nargs="?")
+    ap.add_argument("--pages", type=int, default=300)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--ocr", action="store_true")
+    args = ap.parse_args()
+
+    path = args.pdf
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), "bench.pdf")
+        make_pdf(path, args.pages)
+
+    counts = sorted({1, 2, 4, 8, os.cpu_count() or 1})
+    base = None
+    print(f"{'workers':>7} {'best_s':>8} {'speedup':>8}")
+    for w in counts:
+        extract_pdf_with_pages(path, ocr=args.ocr, workers=w)  # warm the pool
+        best = min(_timed(path, args.ocr, w) for _ in range(args.repeat))
+        base = base or best
+        print(f"{w:>7} {best:>8.3f} {base / best:>7.2f}x")
+    shutdown_pool()
+
+
+def _timed(path, ocr, workers):
+    t0 = time.perf_counter()
+    extract_pdf_with_pages(path, ocr=ocr, workers=workers)
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Peak RSS per upload: buffered (`await file.read()`) vs streamed (utils/ingest.spool_upload + mmap open).
+
+    python scripts/bench_ingest.py --mb 200
+    python scripts/bench_ingest.py path/to/bundle.pdf
+
+Each mode runs in a fresh subprocess so ru_maxrss is not polluted by the other.
+"""
+import argparse, asyncio, json, os, resource, subprocess, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+async def _run(mode, path):
+    import fitz  # PyMuPDF
+    from starlette.datastructures import UploadFile
+    from utils.ingest import spool_upload, open_pdf, remove_quietly
+
+    size = os.path.getsize(path)
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    with open(path, "rb") as src:
+        upload = UploadFile(file=src, size=size, filename=os.path.basename(path))
+        if mode == "buffered":
+            data = await upload.read()
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+                tmp.write(data)
+            doc = fitz.open(stream=data, filetype="pdf") if path.endswith(".pdf") else None
+            pages = doc.page_count if doc else 0
+            os.unlink(tmp.name)
+        else:
+            tmp_path, _, _ = await spool_upload(upload, max_bytes=size + 1)
+            try:
+                if path.endswith(".pdf"):
+                    with open_pdf(tmp_path) as doc:
+                        pages = doc.page_count
+                else:
+                    pages = 0
+            finally:
+                remove_quietly(tmp_path)
+    return {"mode": mode, "bytes": size, "pages": pages, "seconds": round(time.perf_counter() - t0, 3),
+            "baseline_rss_mb": round(base, 1), "peak_rss_mb": round(_rss_mb(), 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("file", nargs="?")
+    ap.add_argument("--mb", type=int, default=100, help="size of the synthetic file when no path is given")
+    ap.add_argument("--mode")
+    args = ap.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(_run(args.mode, args.file))))
+        return
+
+    path = args.file
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), "bench.bin")
+        with open(path, "wb") as f:
+            for _ in range(args.mb):
+                f.write(os.urandom(1024 * 1024))
+    for mode in ("buffered", "streamed"):
+        out = subprocess.run([sys.executable, __file__, path, "--mode", mode], capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout)
+        print(f"{r['mode']:>9}: {r['bytes'] / 2**20:7.1f} MB in {r['seconds']:6.3f}s  "
+              f"peak RSS {r['peak_rss_mb']:7.1f} MB (+{r['peak_rss_mb'] - r['baseline_rss_mb']:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Microbenchmark: folding per-chunk results with utils.merge.MergeAccumulator vs the
+old batch merge (list re-sorting per chunk, last-writer-wins scalars).
+
+    python scripts/bench_merge.py --chunks 50,200,1000
+    python scripts/bench_merge.py --chunks 500 --stream   # snapshot after every chunk, as /upload/stream does
+
+Chunk results are synthetic: lists with repeated entries in varying spellings
+("Westpac Banking Corporation" / "WESTPAC BANKING CORP"), scalars that sometimes disagree, page_refs.
+"""
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.merge import MergeAccumulator, merge_results  # noqa: E402
+from utils.route import SECTIONS  # noqa: E402
+
+NAMES = ["Westpac Banking Corp Ltd", "WESTPAC BANKING CORP", "Westpac Banking Corporation", "Commonwealth Bank of Australia",
+         "CBA", "ANZ", "Australia and New Zealand Banking Group Ltd", "Bendigo Bank", "ING", "Macquarie Bank Limited"]
+ITEMS = [f"Item {i}: easement E{i} over lot {i % 7}" for i in range(60)]
+
+
+def legacy_merge(results):
+    out = {}
+
+    def union_list(a, b):
+        if isinstance(a, list) and isinstance(b, list):
+            return sorted(list({x for x in (a + b) if x not in (None, "")}))
+        return a if isinstance(a, list) else b if isinstance(b, list) else []
+
+    for r in results:
+        for key, val in r.items():
+            if key in SECTIONS and isinstance(val, dict):
+                cur = out.setdefault(key, {})
+                for k, v in val.items():
+                    if k == "page_refs" and isinstance(v, list):
+                        cur["page_refs"] = sorted(list(set(cur.get("page_refs", []) + v)))
+                    elif k == "supporting_doc_present":
+                        cur[k] = bool(v) or cur.get(k, False)
+                    elif isinstance(v, list):
+                        cur[k] = union_list(cur.get(k, []), v)
+                    else:
+                        cur[k] = v or cur.get(k)
+            elif key == "missing_or_unclear" and isinstance(val, list):
+                out["missing_or_unclear"] = union_list(out.get("missing_or_unclear", []), val)
+    for req in SECTIONS:
+        out.setdefault(req, {}).setdefault("supporting_doc_present", False)
+        out[req].setdefault("page_refs", [])
+    out.setdefault("missing_or_unclear", [])
+    return out
+
+
+def make_results(n, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        r = {}
+        for s in rng.sample(SECTIONS, 3):
+            r[s] = {
+                "supporting_doc_present": rng.random() < 0.5,
+                "page_refs": rng.sample(range(1, 400), 4),
+                "mortgagees": rng.sample(NAMES, 2),
+                "items": [rng.choice(ITEMS).upper() if rng.random() < 0.2 else rng.choice(ITEMS) for _ in range(5)],
+                "council": rng.choice(["City of Melbourne", "Melbourne City Council", None]),
+            }
+        r["missing_or_unclear"] = [f"Page {rng.randint(1, 400)} illegible"]
+        out.append(r)
+    return out
+
+
+def bench(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", default="50,200,1000", help="comma-separated chunk counts")
+    ap.add_argument("--stream", action="store_true", help="merge after every chunk (streaming pattern)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'chunks':>7} {'legacy ms':>10} {'accum ms':>9} {'speedup':>8} {'mortgagees legacy/accum':>24}")
+    for n in [int(x) for x in args.chunks.split(",") if x.strip()]:
+        results = make_results(n)
+        if args.stream:
+            def old():
+                for k in range(1, n + 1):
+                    legacy_merge(results[:k])
+
+            def new():
+                acc = MergeAccumulator()
+                for r in results:
+                    acc.add(r)
+                    acc.snapshot()
+        else:
+            old = lambda: legacy_merge(results)
+            new = lambda: merge_results(results)
+        t_old, t_new = bench(old, args.repeat), bench(new, args.repeat)
+        distinct = lambda m: sum(len(m[s].get("mortgagees", [])) for s in SECTIONS)
+        print(f"{n:>7} {t_old * 1000:>10.2f} {t_new * 1000:>9.2f} {t_old / t_new:>7.1f}x "
+              f"{distinct(legacy_merge(results)):>12}/{distinct(merge_results(results))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Index build time and query latency for the per-document BM25 index (utils/retrieve.py).
+
+    python scripts/bench_retrieve.py --pages 300
+    python scripts/bench_retrieve.py path/to/bundle.pdf
+"""
+import argparse, os, random, statistics, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.retrieve import DocStore, build_index, search
+
+VOCAB = ("vendor purchaser title volume folio lot plan easement covenant mortgage westpac discharge "
+         "council rates levy owners corporation insurance policy building permit owner builder zone "
+         "overlay heritage planning certificate notice order water sewer drainage caveat special "
+         "condition settlement deposit land tax gst boundary fence driveway subdivision").split()
+
+QUESTIONS = [
+    "Who is the mortgagee and is a discharge required?",
+    "What zone and overlays apply to the land?",
+    "What are the annual council rates?",
+    "Is there an owner builder warranty insurance policy?",
+    "Are there any easements or covenants on title?",
+    "Were any building permits issued in the last seven years?",
+]
+
+
+def synthetic_pages(n, seed=7):
+    rnd = random.Random(seed)
+    pages = []
+    for i in range(n):
+        paras = [" ".join(rnd.choice(VOCAB) for _ in range(rnd.randint(40, 120))) for _ in range(rnd.randint(3, 8))]
+        pages.append({"page": i + 1, "text": "\n\n".join(paras)})
+    return pages
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pdf", nargs="?")
+    ap.add_argument("--pages", type=int, default=300)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=6)
+    args = ap.parse_args()
+
+    if args.pdf:
+        from utils.extract import extract_pdf_with_pages
+        pages = extract_pdf_with_pages(args.pdf, ocr=False)
+    else:
+        pages = synthetic_pages(args.pages)
+
+    t0 = time.perf_counter()
+    index = build_index(pages)
+    build_s = time.perf_counter() - t0
+
+    store = DocStore(tempfile.mkdtemp(), memory_docs=0)
+    t0 = time.perf_counter()
+    store.save("0" * 32, "bench.pdf", pages)
+    save_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    store.load("0" * 32)
+    load_s = time.perf_counter() - t0
+
+    lat = []
+    for i in range(args.queries):
+        t0 = time.perf_counter()
+        search(index, QUESTIONS[i % len(QUESTIONS)], k=args.k)
+        lat.append((time.perf_counter() - t0) * 1000)
+    lat.sort()
+
+    print(f"pages={len(pages)} passages={len(index['passages'])} terms={len(index['postings'])}")
+    print(f"build {build_s * 1000:.1f} ms | save (build + write) {save_s * 1000:.1f} ms | cold load {load_s * 1000:.1f} ms")
+    print(f"query p50 {statistics.median(lat):.2f} ms | p95 {lat[int(len(lat) * 0.95) - 1]:.2f} ms | max {lat[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
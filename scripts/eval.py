@@ -1,27 +1,335 @@
 """
-Minimal evaluation harness.
-Put golden cases under ../data/gold/<case>/expected.json
+Evaluation harness.
+Put golden cases under ../data/gold/<case>/expected.json, with the source
+document (PDF or DOCX) alongside it. expected.json follows SECTION32_SCHEMA;
+only the fields it contains are scored.
+
+    python scripts/eval.py             # run the pipeline over every case and score it
+    python scripts/eval.py --jobs 8    # cases in parallel (model calls still obey the app's caps)
+    python scripts/eval.py --fresh     # ignore cached outputs for this prompt version
+    python scripts/eval.py --list      # list cases
+    python scripts/eval.py --routing   # page-router precision/recall vs gold page_refs
+    python scripts/eval.py --rules     # rule layer alone: per-field coverage and accuracy vs gold
+    python scripts/eval.py --compare-rules  # full pipeline with RULES_PREFILL off vs on
+
+Each case's output is cached per (document, model, prompt version, chunking/routing
+settings), so reruns only pay for what changed. Scores: strings exact and fuzzy,
+string lists F1 (fuzzy element match), page_refs precision/recall/F1, booleans
+accuracy. Wall time, tokens and estimated cost are reported per case.
+Needs OPENAI_API_KEY (and OPENAI_BASE_URL for scripts/fake_openai.py).
 """
-import json, os, glob
+import argparse, asyncio, difflib, hashlib, json, os, glob, re, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+GOLD_DIR = os.getenv("GOLD_DIR") or os.path.join(os.path.dirname(__file__), "..", "data", "gold")
+EVAL_CACHE_DB = os.getenv("EVAL_CACHE_DB") or os.path.join(tempfile.gettempdir(), "contract_backend_eval.sqlite3")
+FUZZY_THRESHOLD = float(os.getenv("EVAL_FUZZY_THRESHOLD", "0.85"))
 
-GOLD_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "gold")
+def find_source(case_dir):
+    for ext in ("pdf", "docx"):
+        found = sorted(glob.glob(os.path.join(case_dir, f"*.{ext}")))
+        if found:
+            return found[0]
+    return None
 
 def load_pairs():
     pairs = []
-    for case_dir in glob.glob(os.path.join(GOLD_DIR, "*")):
+    for case_dir in sorted(glob.glob(os.path.join(GOLD_DIR, "*"))):
         exp = os.path.join(case_dir, "expected.json")
         if os.path.exists(exp):
             with open(exp) as f:
-                pairs.append({"name": os.path.basename(case_dir), "expected": json.load(f)})
+                pairs.append({"name": os.path.basename(case_dir), "expected": json.load(f),
+                              "source": find_source(case_dir)})
     return pairs
 
+def extract_pages(path):
+    from utils.extract import extract_pdf_with_pages, extract_docx_with_pages
+    if path.lower().endswith(".pdf"):
+        return extract_pdf_with_pages(path, ocr=os.getenv("ENABLE_OCR", "false").lower() == "true")
+    return extract_docx_with_pages(path)
+
+def eval_routing(pairs):
+    """Per section: precision/recall of routed pages against gold page_refs."""
+    from utils.route import SECTIONS, route_pages
+    totals = {s: {"tp": 0, "fp": 0, "fn": 0} for s in SECTIONS}
+    skipped = pages_total = 0
+    for p in pairs:
+        if not p["source"]:
+            print(f"CASE: {p['name']} -> no source document, skipped")
+            continue
+        routes = route_pages(extract_pages(p["source"]))
+        pages_total += len(routes)
+        skipped += sum(1 for tags in routes.values() if not tags)
+        for s in SECTIONS:
+            gold = set((p["expected"].get(s) or {}).get("page_refs") or [])
+            pred = {n for n, tags in routes.items() if s in tags}
+            totals[s]["tp"] += len(gold & pred)
+            totals[s]["fp"] += len(pred - gold)
+            totals[s]["fn"] += len(gold - pred)
+    print(f"{'section':<20} {'precision':>9} {'recall':>7}")
+    for s, t in totals.items():
+        prec = t["tp"] / (t["tp"] + t["fp"]) if t["tp"] + t["fp"] else 0.0
+        rec = t["tp"] / (t["tp"] + t["fn"]) if t["tp"] + t["fn"] else 0.0
+        print(f"{s:<20} {prec:>9.3f} {rec:>7.3f}")
+    if pages_total:
+        print(f"pages skipped by router: {skipped}/{pages_total} ({skipped / pages_total:.1%})")
+
+def eval_rules(pairs):
+    """Per rule field: gold values, how often the rules resolved it, and how often they were right."""
+    from utils.schema import SECTION32_SCHEMA
+    from utils.route import route_pages
+    from utils.rules import extract_fields, RULE_FIELDS
+    totals = {k: {"gold": 0, "resolved": 0, "correct": 0.0, "ambiguous": 0, "extra": 0} for k in RULE_FIELDS}
+    rule_s = 0.0
+    for p in pairs:
+        if not p["source"]:
+            print(f"CASE: {p['name']} -> no source document, skipped")
+            continue
+        pages = extract_pages(p["source"])
+        routes = route_pages(pages)
+        t0 = time.perf_counter()
+        fields = extract_fields(pages, routes)
+        rule_s += time.perf_counter() - t0
+        for key, t in totals.items():
+            section, field = key.split(".", 1)
+            f = fields.get(key)
+            exp = (p["expected"].get(section) or {}).get(field)
+            if exp is None:
+                t["extra"] += bool(f and f["resolved"])  # fired, but gold doesn't score this field
+                continue
+            t["gold"] += 1
+            if f and f["resolved"]:
+                t["resolved"] += 1
+                t["correct"] += score_field(field_kind(SECTION32_SCHEMA, section, field), exp, f["value"])["score"]
+            elif f:
+                t["ambiguous"] += 1
+    print(f"{'field':<36} {'gold':>4} {'resolved':>8} {'ambig':>5} {'coverage':>8} {'accuracy':>8} {'unscored':>8}")
+    for key, t in totals.items():
+        cov = t["resolved"] / t["gold"] if t["gold"] else 0.0
+        acc = t["correct"] / t["resolved"] if t["resolved"] else 0.0
+        print(f"{key:<36} {t['gold']:>4} {t['resolved']:>8} {t['ambiguous']:>5} {cov:>8.3f} {acc:>8.3f} {t['extra']:>8}")
+    print(f"rule layer time: {rule_s * 1000:.1f} ms over {len([p for p in pairs if p['source']])} cases")
+
+# --- scoring -----------------------------------------------------------------
+
+def norm(value):
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(value).lower()).split())
+
+def similar(a, b):
+    a, b = norm(a), norm(b)
+    return a == b or difflib.SequenceMatcher(None, a, b).ratio() >= FUZZY_THRESHOLD
+
+def _prf(tp, n_pred, n_gold):
+    prec = tp / n_pred if n_pred else (1.0 if not n_gold else 0.0)
+    rec = tp / n_gold if n_gold else 1.0
+    f1 = 2 * prec * rec / (prec + rec) if prec + rec else 0.0
+    return prec, rec, f1
+
+def score_field(kind, exp, got):
+    """{"exact": 0/1, "score": 0..1} for one field; `kind` is string/list/pages/boolean."""
+    if kind == "boolean":
+        ok = float(bool(got) == bool(exp))
+        return {"exact": ok, "score": ok}
+    if kind == "pages":
+        gold, pred = set(exp or []), {n for n in (got or []) if isinstance(n, int)}
+        prec, rec, f1 = _prf(len(gold & pred), len(pred), len(gold))
+        return {"exact": float(gold == pred), "score": f1, "precision": prec, "recall": rec}
+    if kind == "list":
+        gold = [g for g in (exp or []) if norm(g)]
+        pred = [g for g in (got or []) if isinstance(g, str) and norm(g)]
+        unmatched, tp = list(pred), 0
+        for g in gold:
+            hit = next((p for p in unmatched if similar(g, p)), None)
+            if hit is not None:
+                unmatched.remove(hit)
+                tp += 1
+        return {"exact": float({norm(g) for g in gold} == {norm(p) for p in pred}),
+                "score": _prf(tp, len(pred), len(gold))[2]}
+    got = got if isinstance(got, str) else ""
+    return {"exact": float(norm(exp) == norm(got)), "score": float(bool(got) and similar(exp, got))}
+
+def field_kind(schema, section, field):
+    if field == "page_refs":
+        return "pages"
+    t = schema["properties"][section]["properties"].get(field, {}).get("type")
+    return {"array": "list", "boolean": "boolean"}.get(t, "string")
+
+def score_case(schema, expected, summary):
+    scores = {}
+    for section, fields in expected.items():
+        if section not in schema["properties"] or not isinstance(fields, dict):
+            continue
+        got = summary.get(section) if isinstance(summary.get(section), dict) else {}
+        for field, exp in fields.items():
+            scores[f"{section}.{field}"] = score_field(field_kind(schema, section, field), exp, got.get(field))
+    return scores
+
+# --- running -----------------------------------------------------------------
+
+def pipeline_settings(main):
+    """Everything besides the document that changes the pipeline's output."""
+    from utils import chunk, dedup, route
+    return {"model": main.MODEL, "prompt_version": main.PROMPT_VERSION, "chunk_max_tokens": main.CHUNK_MAX_TOKENS,
+            "chunk_soft_fill": chunk.CHUNK_SOFT_FILL, "route_pages": main.ROUTE_PAGES,
+            "route_min_score": route.ROUTE_MIN_SCORE, "route_carry_pages": route.ROUTE_CARRY_PAGES,
+            "dedup": dedup.DEDUP_PAGES and [dedup.DEDUP_THRESHOLD, dedup.DEDUP_SHINGLE, dedup.DEDUP_MIN_WORDS],
+            "rules": main.RULES_PREFILL and main.RULES_VERSION,
+            "ocr": os.getenv("ENABLE_OCR", "false").lower() == "true"}
+
+async def run_case(main, cache, p, sem, fresh):
+    from utils.cache import fingerprint
+    with open(p["source"], "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    key = fingerprint(sha256, pipeline_settings(main))
+    if not fresh:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return {**cached, "cached": True}
+    async with sem:
+        t0 = time.perf_counter()
+        try:
+            resp = await main.analyze_document(p["source"], os.path.basename(p["source"]), sha256, no_cache=True)
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {getattr(e, 'detail', e)}", "cached": False}
+        usage = resp["usage"]
+        out = {
+            "summary": resp["summary"],
+            "wall_s": round(time.perf_counter() - t0, 3),
+            "timings": resp.get("timings", {}),
+            "pages": len(resp.get("pages", [])),
+            "chunks": (resp.get("chunking") or {}).get("count"),
+            "failed_chunks": (resp.get("chunk_cache") or {}).get("failed", 0),
+            "usage": {k: usage[k] for k in ("prompt_tokens", "completion_tokens", "calls")},
+            "cost_usd": usage["estimated_cost_usd"],
+        }
+    if not out["failed_chunks"]:
+        await asyncio.to_thread(cache.set, key, out)
+    return {**out, "cached": False}
+
+async def run_eval(pairs, jobs, fresh):
+    import main
+    from utils.cache import SqliteCache
+    cache = SqliteCache(EVAL_CACHE_DB, "eval_outputs", max_entries=10000, ttl_seconds=365 * 24 * 3600)
+    sem = asyncio.Semaphore(jobs)
+    cases = [p for p in pairs if p["source"]]
+    for p in pairs:
+        if not p["source"]:
+            print(f"CASE: {p['name']} -> no source document, skipped")
+    t0 = time.perf_counter()
+    outs = await asyncio.gather(*(run_case(main, cache, p, sem, fresh) for p in cases))
+    wall = time.perf_counter() - t0
+    report = {"settings": pipeline_settings(main), "wall_s": round(wall, 3), "cases": [], "fields": {}}
+    for p, out in zip(cases, outs):
+        case = {"name": p["name"], **{k: v for k, v in out.items() if k != "summary"}}
+        if "summary" in out:
+            case["scores"] = score_case(main.SECTION32_SCHEMA, p["expected"], out["summary"])
+            for field, sc in case["scores"].items():
+                agg = report["fields"].setdefault(field, {"n": 0, "exact": 0.0, "score": 0.0})
+                agg["n"] += 1
+                agg["exact"] += sc["exact"]
+                agg["score"] += sc["score"]
+        report["cases"].append(case)
+    for agg in report["fields"].values():
+        agg["exact"] = round(agg["exact"] / agg["n"], 4)
+        agg["score"] = round(agg["score"] / agg["n"], 4)
+    return report
+
+def print_report(report):
+    print(f"{'case':<24} {'pages':>5} {'chunks':>6} {'wall s':>7} {'tok in':>8} {'tok out':>7} {'cost $':>8} {'score':>6}")
+    tok_in = tok_out = cost = 0
+    for c in report["cases"]:
+        if "error" in c:
+            print(f"{c['name']:<24} ERROR {c['error']}")
+            continue
+        sc = c.get("scores") or {}
+        mean = sum(s["score"] for s in sc.values()) / len(sc) if sc else 0.0
+        u = c["usage"]
+        tok_in, tok_out, cost = tok_in + u["prompt_tokens"], tok_out + u["completion_tokens"], cost + c["cost_usd"]
+        flag = " (cached)" if c.get("cached") else ""
+        print(f"{c['name']:<24} {c['pages']:>5} {c['chunks'] or 0:>6} {c['wall_s']:>7.2f} {u['prompt_tokens']:>8} "
+              f"{u['completion_tokens']:>7} {c['cost_usd']:>8.4f} {mean:>6.3f}{flag}")
+    print(f"\n{'field':<36} {'n':>3} {'exact':>6} {'score':>6}")
+    for field, agg in sorted(report["fields"].items()):
+        print(f"{field:<36} {agg['n']:>3} {agg['exact']:>6.3f} {agg['score']:>6.3f}")
+    print(f"\nrun wall time {report['wall_s']:.2f}s  tokens {tok_in} in / {tok_out} out  est. cost ${cost:.4f}"
+          f"  (prompt version {report['settings']['prompt_version']})")
+
+def _totals(report):
+    ok = [c for c in report["cases"] if "error" not in c]
+    scores = [s["score"] for c in ok for s in (c.get("scores") or {}).values()]
+    return {"tok_in": sum(c["usage"]["prompt_tokens"] for c in ok),
+            "tok_out": sum(c["usage"]["completion_tokens"] for c in ok),
+            "calls": sum(c["usage"]["calls"] for c in ok),
+            "case_wall_s": sum(c["wall_s"] for c in ok),
+            "score": sum(scores) / len(scores) if scores else 0.0}
+
+async def compare_rules(pairs, jobs, fresh):
+    """The same cases with the rule layer off, then on (main.RULES_PREFILL is read per document)."""
+    import main
+    reports = {}
+    for flag in (False, True):
+        main.RULES_PREFILL = flag
+        reports["on" if flag else "off"] = await run_eval(pairs, jobs, fresh)
+    return reports
+
+def print_rules_comparison(reports):
+    from utils.rules import RULE_FIELDS
+    off, on = _totals(reports["off"]), _totals(reports["on"])
+    print(f"{'':<14} {'rules off':>10} {'rules on':>10} {'change':>8}")
+    for k, label in (("tok_in", "tokens in"), ("tok_out", "tokens out"), ("calls", "model calls"),
+                     ("case_wall_s", "case wall s"), ("score", "mean score")):
+        a, b = off[k], on[k]
+        change = f"{(b - a) / a:+.1%}" if a else "-"
+        fmt = "{:>10.3f}" if isinstance(a, float) else "{:>10}"
+        print(f"{label:<14} {fmt.format(a)} {fmt.format(b)} {change:>8}")
+    print(f"\n{'rule field':<36} {'off':>6} {'on':>6}")
+    for field in RULE_FIELDS:
+        a, b = reports["off"]["fields"].get(field), reports["on"]["fields"].get(field)
+        if a or b:
+            print(f"{field:<36} {(a or {}).get('score', 0):>6.3f} {(b or {}).get('score', 0):>6.3f}")
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--routing", action="store_true", help="score the page router against gold page_refs")
+    ap.add_argument("--rules", action="store_true", help="score the rule layer alone against gold (no model calls)")
+    ap.add_argument("--compare-rules", action="store_true", help="run the pipeline with RULES_PREFILL off and on")
+    ap.add_argument("--list", action="store_true", help="list cases and exit")
+    ap.add_argument("--jobs", type=int, default=4, help="cases run concurrently")
+    ap.add_argument("--fresh", action="store_true", help="re-run every case, ignoring cached outputs")
+    ap.add_argument("--out", help="write the full report as JSON")
+    args = ap.parse_args()
+
     pairs = load_pairs()
     if not pairs:
         print("No golden cases found. Add folders under data/gold with expected.json")
         return
-    for p in pairs:
-        print(f"CASE: {p['name']} -> compare got vs expected (implement metrics here)")
+    if args.list:
+        for p in pairs:
+            print(f"CASE: {p['name']} -> {p['source'] or 'no source document'}")
+        return
+    if args.routing:
+        eval_routing(pairs)
+        return
+    if args.rules:
+        eval_rules(pairs)
+        return
+    if args.compare_rules:
+        reports = asyncio.run(compare_rules(pairs, max(1, args.jobs), args.fresh))
+        for label, report in reports.items():
+            print(f"\n=== rules {label} ===")
+            print_report(report)
+        print()
+        print_rules_comparison(reports)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(reports, f, indent=2)
+        return
+    report = asyncio.run(run_eval(pairs, max(1, args.jobs), args.fresh))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,167 @@
+"""
+Local stand-in for the chat-completions endpoint, so /upload can be load-tested without API credits.
+
+    python scripts/fake_openai.py --port 9100 --latency 0.8 --jitter 0.3
+    python scripts/fake_openai.py --rpm 60 --rate-429 0.1 --error-rate 0.05
+    OPENAI_API_KEY=x OPENAI_BASE_URL=http://127.0.0.1:9100/v1 uvicorn main:app
+
+Replies with a schema-shaped JSON summary for the sections named in the prompt (page_refs
+taken from the [[PAGE n]] markers), or per-page text for vision transcription requests, and
+a `usage` block (prompt tokens ~ chars/4, 1105 per image).
+Latency is `latency` + tokens * `per_token` seconds, with uniform jitter. GET /stats reports
+call and token counts; POST /stats/reset zeroes them.
+
+Failure injection: `rpm` enforces a sliding one-minute request limit (429 with Retry-After
+and x-ratelimit-* headers, as the real API sends), `rate_429` adds random 429s and
+`error_rate` random 500s. POST /settings {"error_rate": 1.0} changes any setting live,
+e.g. to simulate an outage.
+"""
+import argparse, asyncio, collections, json, os, random, re, time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+SETTINGS = {
+    "latency": float(os.getenv("FAKE_LATENCY", "0.5")),
+    "jitter": float(os.getenv("FAKE_JITTER", "0.1")),
+    "per_token": float(os.getenv("FAKE_PER_TOKEN", "0")),
+    "completion_tokens": int(os.getenv("FAKE_COMPLETION_TOKENS", "300")),
+    "rpm": int(os.getenv("FAKE_RPM", "0")),
+    "rate_429": float(os.getenv("FAKE_RATE_429", "0")),
+    "error_rate": float(os.getenv("FAKE_ERROR_RATE", "0")),
+}
+STATS = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "in_flight": 0, "max_in_flight": 0,
+         "rate_limited": 0, "errors": 0}
+_recent = collections.deque()  # request times in the last minute, for `rpm`
+
+app = FastAPI()
+
+_SECTION_VALUES = {
+    "title": {"owner_names": ["John Smith"], "volume_folio": "Volume 10234 Folio 567", "plan_lot": "Lot 3 on LP12345"},
+    "mortgages": {"mortgagees": ["Westpac Banking Corporation"]},
+    "planning_zoning": {"zone": "GRZ1", "overlays": ["HO45"]},
+    "rates_outgoings": {"council": "Whitehorse City Council", "annual_amount": "$2,104.50"},
+    "insurance": {"policy_number": "DBI-1234567"},
+    "building_permits": {"permits": ["BS-U 1234/2020"]},
+    "notices": {"adverse_notices": []},
+    "special_conditions": {"items": ["Special condition 1"]},
+}
+
+
+def _answer(prompt: str):
+    if "=== PAGE" in prompt:  # vision transcription: one marker + text per page image
+        pages = re.findall(r"Page (\d+):", prompt)
+        return "\n".join(f"=== PAGE {n} ===\nSection 32 Vendor Statement\nTitle: Volume 10234 Folio 567, "
+                         f"registered proprietor John Smith (transcribed page {n})" for n in pages)
+    if "QUESTION" in prompt:
+        return "The document states the answer on the cited page."
+    pages = [int(n) for n in re.findall(r"\[\[PAGE (\d+)", prompt)]
+    m = re.search(r"Sections in scope for this excerpt: ([a-z_, ]+)", prompt)
+    wanted = [s.strip() for s in m.group(1).split(",")] if m else list(_SECTION_VALUES)
+    # Only fields the prompt's schema asks for (the app leaves out what its rules resolved);
+    # `prompt` is the JSON-encoded messages, hence the escaped quotes.
+    out = {s: {**{k: v for k, v in _SECTION_VALUES[s].items() if f'\\"{k}\\"' in prompt},
+               "supporting_doc_present": True, "page_refs": sorted(set(pages))[:3]}
+           for s in wanted if s in _SECTION_VALUES}
+    out["missing_or_unclear"] = []
+    return json.dumps(out)
+
+
+def _limit_headers(now):
+    rpm = SETTINGS["rpm"]
+    if not rpm:
+        return {}
+    reset = max(0.0, _recent[0] + 60 - now) if _recent else 0.0
+    return {"x-ratelimit-limit-requests": str(rpm),
+            "x-ratelimit-remaining-requests": str(max(0, rpm - len(_recent))),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s"}
+
+
+def _rejection(now):
+    """A 429/500 response if this request should fail, else None."""
+    while _recent and _recent[0] <= now - 60:
+        _recent.popleft()
+    if SETTINGS["rpm"] and len(_recent) >= SETTINGS["rpm"]:
+        retry = _recent[0] + 60 - now
+    elif random.random() < SETTINGS["rate_429"]:
+        retry = 1.0
+    else:
+        retry = None
+    if retry is not None:
+        STATS["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429, headers={**_limit_headers(now), "retry-after": f"{max(retry, 0.0):.3f}"})
+    if random.random() < SETTINGS["error_rate"]:
+        STATS["errors"] += 1
+        return JSONResponse({"error": {"message": "The server had an error", "type": "server_error"}}, status_code=500)
+    _recent.append(now)
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(req: Request):
+    rejected = _rejection(time.time())
+    if rejected is not None:
+        return rejected
+    body = await req.json()
+    prompt = json.dumps(body.get("messages", []))
+    text, images = re.subn(r"data:image/[a-z]+;base64,[A-Za-z0-9+/=]+", "", prompt)
+    prompt_tokens = len(text) // 4 + images * 1105  # high-detail page image
+    completion_tokens = SETTINGS["completion_tokens"]
+    STATS["calls"] += 1
+    STATS["prompt_tokens"] += prompt_tokens
+    STATS["completion_tokens"] += completion_tokens
+    STATS["in_flight"] += 1
+    STATS["max_in_flight"] = max(STATS["max_in_flight"], STATS["in_flight"])
+    try:
+        delay = SETTINGS["latency"] + SETTINGS["per_token"] * (prompt_tokens + completion_tokens)
+        await asyncio.sleep(max(0.0, delay + random.uniform(-SETTINGS["jitter"], SETTINGS["jitter"])))
+    finally:
+        STATS["in_flight"] -= 1
+    return JSONResponse({
+        "id": f"chatcmpl-fake-{STATS['calls']}", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": _answer(prompt)}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }, headers=_limit_headers(time.time()))
+
+
+@app.get("/stats")
+async def stats():
+    return {**STATS, "settings": SETTINGS}
+
+
+@app.post("/settings")
+async def update_settings(req: Request):
+    changes = await req.json()
+    for key, val in changes.items():
+        if key in SETTINGS:
+            SETTINGS[key] = type(SETTINGS[key])(val)
+    return SETTINGS
+
+
+@app.post("/stats/reset")
+async def reset():
+    for k in STATS:
+        STATS[k] = 0
+    return STATS
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    for key, val in SETTINGS.items():
+        ap.add_argument("--" + key.replace("_", "-"), type=type(val), default=val)
+    args = ap.parse_args()
+    for key in SETTINGS:
+        SETTINGS[key] = getattr(args, key)
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Synthetic Section 32 vendor statements for benchmarks: a statement body followed by
+title, mortgage, planning, rates, insurance and permit attachments padded with filler.
+
+    python scripts/gen_docs.py --out /tmp/s32 --count 5 --pages 40 --scanned 0.2
+    python scripts/gen_docs.py --out /tmp/s32 --format docx --pages 20
+
+Scanned pages are rendered to an image with no text layer (they need OCR). Output is
+deterministic for a given --seed.
+"""
+import argparse, os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+STREETS = ["Station St", "Burke Rd", "High St", "Elgar Rd", "Union Rd", "Main Rd", "Glenferrie Rd"]
+SUBURBS = ["Box Hill", "Kew", "Camberwell", "Northcote", "Brunswick", "Footscray", "Richmond"]
+BANKS = ["Westpac Banking Corporation", "Commonwealth Bank of Australia", "ANZ", "National Australia Bank"]
+COUNCILS = ["Whitehorse City Council", "Boroondara City Council", "Darebin City Council", "Yarra City Council"]
+ZONES = ["GRZ1", "NRZ3", "RGZ2", "MUZ", "C1Z"]
+OVERLAYS = ["HO45", "DDO8", "SBO", "VPO2", "LSIO"]
+NAMES = ["John Smith", "Mei Chen", "Priya Nair", "Luca Rossi", "Sarah O'Brien", "Ahmed Haddad"]
+
+FILLER = (
+    "The vendor makes this statement in respect of the land in accordance with section 32 of the "
+    "Sale of Land Act 1962. The purchaser acknowledges having received this statement before signing "
+    "any contract. Nothing in this statement is to be taken as a warranty as to the condition of the land."
+)
+
+
+def sections(rng):
+    vol, fol = rng.randint(8000, 12999), rng.randint(100, 999)
+    lot, plan = rng.randint(1, 60), f"LP{rng.randint(10000, 99999)}"
+    owner = rng.choice(NAMES)
+    council = rng.choice(COUNCILS)
+    return [
+        ("Section 32 Vendor Statement", [
+            f"Property: {rng.randint(1, 200)} {rng.choice(STREETS)}, {rng.choice(SUBURBS)} VIC",
+            f"Vendor: {owner}",
+            "1. Financial matters", "Particulars of any rates, taxes, charges or other similar outgoings are attached.",
+            "2. Insurance", "3. Land use", "4. Services", "5. Title", "6. Subdivision", "7. Notices",
+        ]),
+        ("Register Search Statement", [
+            f"Volume {vol} Folio {fol}",
+            f"LAND DESCRIPTION: Lot {lot} on Plan of Subdivision {plan}",
+            f"REGISTERED PROPRIETOR: Estate Fee Simple, Sole Proprietor {owner.upper()}",
+            "ENCUMBRANCES, CAVEATS AND NOTICES",
+            f"MORTGAGE AX{rng.randint(100000, 999999)}K {rng.choice(BANKS).upper()}",
+            "Any crossed out encumbrance has been removed from the register. Easements as shown on the plan.",
+        ]),
+        ("Planning Certificate", [
+            f"Planning scheme: {council.replace(' City Council', '')} Planning Scheme",
+            f"Zone: General Residential Zone - Schedule 1 ({rng.choice(ZONES)})",
+            f"Overlays: {', '.join(rng.sample(OVERLAYS, 2))}",
+            "Proposed planning scheme amendments: none.",
+        ]),
+        ("Land Information Certificate", [
+            f"Issued by {council}",
+            f"Council rates for 2024/2025: ${rng.randint(1500, 4200)}.{rng.randint(10, 99)}",
+            f"Capital improved value: ${rng.randint(600, 2400)},000. Site value: ${rng.randint(300, 1500)},000",
+            "Arrears: nil. Interest: nil. Water rates and charges are levied by the water authority.",
+        ]),
+        ("Certificate of Currency - Domestic Building Insurance", [
+            f"Policy number: DBI-{rng.randint(1000000, 9999999)}",
+            f"Insurer: VMIA. Builder: {rng.choice(NAMES)} Constructions Pty Ltd",
+            "Domestic building insurance is required for building work over $16,000.",
+        ]),
+        ("Building Permit", [
+            f"Building permit number BS-U {rng.randint(1000, 9999)}/{rng.randint(2015, 2024)}",
+            "Nature of building work: construction of a single dwelling and garage.",
+            "Certificate of final inspection issued by the relevant building surveyor.",
+        ]),
+        ("Notices", [
+            "The vendor is not aware of any notice, order, declaration, report or recommendation of a public",
+            "authority or government department affecting the land. No compulsory acquisition notices.",
+        ]),
+        ("Special Conditions", [
+            "Special condition 1: the purchaser may not make any requisition or objection in respect of the title.",
+            "Special condition 2: general conditions 23 and 24 are amended as follows.",
+        ]),
+    ]
+
+
+def layout(rng, n_pages):
+    """One (heading, lines) per page: each section gets a first page, filler pages spread between."""
+    secs = sections(rng)
+    pages = [(h, lines) for h, lines in secs][:n_pages]
+    while len(pages) < n_pages:
+        i = rng.randrange(len(pages))
+        pages.insert(i + 1, (None, [FILLER] * rng.randint(3, 8)))
+    return pages
+
+
+def write_pdf(path, pages, scanned, rng):
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for heading, lines in pages:
+        page = doc.new_page()
+        body = "\n".join(([heading.upper(), ""] if heading else []) + lines)
+        page.insert_textbox(fitz.Rect(50, 60, 545, 790), body, fontsize=10)
+        if rng.random() < scanned:
+            # Replace the page with a grayscale picture of itself: no text layer, needs OCR.
+            pix = page.get_pixmap(dpi=120, colorspace=fitz.csGRAY)
+            doc.delete_page(-1)
+            doc.new_page().insert_image(fitz.Rect(0, 0, 595, 842), pixmap=pix)
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def write_docx(path, pages):
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+    doc = Document()
+    for i, (heading, lines) in enumerate(pages):
+        if heading:
+            doc.add_heading(heading, level=1)
+        for line in lines:
+            doc.add_paragraph(line)
+        if i < len(pages) - 1:
+            doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    doc.save(path)
+
+
+def generate(out_dir, count=1, pages=40, scanned=0.0, fmt="pdf", seed=0):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        rng = random.Random(f"{seed}-{i}")
+        path = os.path.join(out_dir, f"s32_{pages}p_{int(scanned * 100)}s_{i:03d}.{fmt}")
+        if fmt == "pdf":
+            write_pdf(path, layout(rng, pages), scanned, rng)
+        else:
+            write_docx(path, layout(rng, pages))
+        paths.append(path)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--count", type=int, default=1)
+    ap.add_argument("--pages", type=int, default=40)
+    ap.add_argument("--scanned", type=float, default=0.0, help="fraction of PDF pages rendered as images")
+    ap.add_argument("--format", choices=("pdf", "docx"), default="pdf")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    for path in generate(args.out, args.count, args.pages, args.scanned, args.format, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
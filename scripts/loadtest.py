@@ -0,0 +1,274 @@
+"""
+End-to-end /upload load test against the local fake model server (no API credits).
+
+    python scripts/loadtest.py --concurrency 1,4,8 --requests 16 --pages 40 --scanned 0.1
+    python scripts/loadtest.py --docs /path/to/pdfs --latency 1.2
+    python scripts/loadtest.py --compare bench_results/<old>.json
+
+Starts scripts/fake_openai.py and `uvicorn main:app` as subprocesses with throwaway
+cache/store directories, then for each concurrency level posts --requests uploads
+(`no_cache=true`, so every request runs the full pipeline). Reports p50/p95/p99
+latency, docs/minute, mean per-stage `timings` from the responses and peak RSS of
+the app process tree. Results are written to bench_results/<git sha>[-dirty]-<time>.json;
+--compare prints the change against an earlier file.
+"""
+import argparse, asyncio, json, os, platform, shutil, socket, subprocess, sys, tempfile, threading, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+RESULTS_DIR = os.path.join(ROOT, "bench_results")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_http(url, proc, timeout=60):
+    import httpx
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url}: server exited with {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url}: server did not start")
+
+
+def _git_rev():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def _rss_tree_kb(pid):
+    """RSS of a process and all its descendants (PDF/OCR pool workers included)."""
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                todo.extend(int(c) for c in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            pass
+    return total
+
+
+class PeakRss:
+    def __init__(self, pid, interval=0.1):
+        self.pid, self.interval, self.peak_kb = pid, interval, 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, _rss_tree_kb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_kb = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._stop.clear()
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return round(values[lo] + (values[hi] - values[lo]) * (k - lo), 3)
+
+
+async def _run_level(base_url, docs, concurrency, n_requests, timeout):
+    import httpx
+    sem = asyncio.Semaphore(concurrency)
+    latencies, stage_sums, errors = [], {}, []
+
+    async def one(i, client):
+        path = docs[i % len(docs)]
+        async with sem:
+            with open(path, "rb") as f:
+                data = f.read()
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(f"{base_url}/upload", params={"no_cache": "true"},
+                                      files={"file": (os.path.basename(path), data)})
+            except httpx.HTTPError as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            elapsed = time.perf_counter() - t0
+        if r.status_code != 200:
+            errors.append(f"HTTP {r.status_code}: {r.text[:200]}")
+            return
+        latencies.append(elapsed)
+        for stage, secs in (r.json().get("timings") or {}).items():
+            stage_sums[stage] = stage_sums.get(stage, 0.0) + secs
+
+    t0 = time.perf_counter()
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        await asyncio.gather(*[one(i, client) for i in range(n_requests)])
+    wall = time.perf_counter() - t0
+    ok = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "ok": ok,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_s": round(wall, 3),
+        "docs_per_min": round(ok / wall * 60, 2) if wall else 0.0,
+        "latency_s": {"p50": _pct(latencies, 0.5), "p95": _pct(latencies, 0.95), "p99": _pct(latencies, 0.99),
+                      "max": round(max(latencies), 3) if latencies else None},
+        "stage_mean_s": {k: round(v / ok, 4) for k, v in stage_sums.items()} if ok else {},
+    }
+
+
+def _compare(current, previous):
+    prev = {lvl["concurrency"]: lvl for lvl in previous["levels"]}
+    print(f"\nvs {previous.get('git_rev')} ({previous.get('started_at')}):")
+    for lvl in current["levels"]:
+        old = prev.get(lvl["concurrency"])
+        if not old:
+            continue
+        parts = []
+        for key in ("p50", "p95", "p99"):
+            a, b = old["latency_s"].get(key), lvl["latency_s"].get(key)
+            if a and b:
+                parts.append(f"{key} {b - a:+.3f}s ({(b - a) / a:+.0%})")
+        a, b = old["docs_per_min"], lvl["docs_per_min"]
+        if a:
+            parts.append(f"docs/min {b - a:+.2f} ({(b - a) / a:+.0%})")
+        a, b = old.get("peak_rss_mb"), lvl.get("peak_rss_mb")
+        if a:
+            parts.append(f"peak RSS {b - a:+.1f} MB")
+        print(f"  c={lvl['concurrency']:<3} " + ", ".join(parts))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", default="1,4,8", help="comma-separated concurrency levels")
+    ap.add_argument("--requests", type=int, default=16, help="uploads per level")
+    ap.add_argument("--docs", help="directory of PDF/DOCX files to upload (default: generate)")
+    ap.add_argument("--count", type=int, default=4, help="distinct generated documents")
+    ap.add_argument("--pages", type=int, default=40)
+    ap.add_argument("--scanned", type=float, default=0.0)
+    ap.add_argument("--format", choices=("pdf", "docx"), default="pdf")
+    ap.add_argument("--latency", type=float, default=0.5, help="fake model latency (s)")
+    ap.add_argument("--jitter", type=float, default=0.1)
+    ap.add_argument("--per-token", type=float, default=0.0)
+    ap.add_argument("--rpm", type=int, default=0, help="fake server per-minute request limit (429s beyond it)")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="fraction of random 429s from the fake server")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of random 500s from the fake server")
+    ap.add_argument("--timeout", type=float, default=600)
+    ap.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app (repeatable)")
+    ap.add_argument("--out", help="result file (default: bench_results/<git sha>-<time>.json)")
+    ap.add_argument("--compare", help="earlier result file to diff against")
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="loadtest-")
+    if args.docs:
+        docs = sorted(os.path.join(args.docs, f) for f in os.listdir(args.docs)
+                      if f.lower().endswith((".pdf", ".docx")))
+    else:
+        from scripts.gen_docs import generate
+        docs = generate(os.path.join(work, "docs"), args.count, args.pages, args.scanned, args.format)
+    if not docs:
+        sys.exit("no documents to upload")
+
+    fake_port, app_port = _free_port(), _free_port()
+    procs = []
+    try:
+        fake = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "scripts", "fake_openai.py"), "--port", str(fake_port),
+             "--latency", str(args.latency), "--jitter", str(args.jitter), "--per-token", str(args.per_token),
+             "--rpm", str(args.rpm), "--rate-429", str(args.rate_429), "--error-rate", str(args.error_rate)],
+            cwd=ROOT,
+        )
+        procs.append(fake)
+        _wait_http(f"http://127.0.0.1:{fake_port}/stats", fake)
+
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "fake", "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+            "CACHE_DB": os.path.join(work, "cache.sqlite3"),
+            "DOC_STORE_DIR": os.path.join(work, "docs_store"),
+            "JOB_DIR": os.path.join(work, "jobs"),
+            "RATE_LIMIT_DB": os.path.join(work, "ratelimit.sqlite3"),
+            "DATABASE_URL": os.environ.get("LOADTEST_DATABASE_URL") or f"sqlite:///{os.path.join(work, 'store.sqlite3')}",
+        }
+        env.pop("SMTP_HOST", None)
+        for kv in args.env:
+            k, _, v = kv.partition("=")
+            env[k] = v
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        )
+        procs.append(app)
+        base_url = f"http://127.0.0.1:{app_port}"
+        _wait_http(base_url + "/", app)
+
+        import httpx
+        result = {
+            "git_rev": _git_rev(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+            "documents": [{"file": os.path.basename(d), "bytes": os.path.getsize(d)} for d in docs],
+            "levels": [],
+        }
+        for c in [int(x) for x in args.concurrency.split(",") if x.strip()]:
+            httpx.post(f"http://127.0.0.1:{fake_port}/stats/reset")
+            with PeakRss(app.pid) as rss:
+                level = asyncio.run(_run_level(base_url, docs, c, args.requests, args.timeout))
+            level["peak_rss_mb"] = round(rss.peak_kb / 1024, 1)
+            level["model"] = httpx.get(f"http://127.0.0.1:{fake_port}/stats").json()
+            level["model"].pop("settings", None)
+            result["levels"].append(level)
+            lat = level["latency_s"]
+            print(f"c={c:<3} ok={level['ok']}/{level['requests']}  p50={lat['p50']}s p95={lat['p95']}s p99={lat['p99']}s  "
+                  f"{level['docs_per_min']} docs/min  peak RSS {level['peak_rss_mb']} MB  "
+                  f"model calls {level['model']['calls']} (max in flight {level['model']['max_in_flight']})")
+            if level["stage_mean_s"]:
+                print("      stages: " + "  ".join(f"{k}={v}" for k, v in level["stage_mean_s"].items()))
+            for err in level["error_samples"]:
+                print("      error: " + err)
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{result['git_rev']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results: {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# main.py reads these at import time; keep every store the app opens out of the shared temp dir.
+_TMP = tempfile.mkdtemp(prefix="contract_backend_tests_")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CACHE_DB", os.path.join(_TMP, "cache.sqlite3"))
+os.environ.setdefault("RATE_LIMIT_DB", os.path.join(_TMP, "ratelimit.sqlite3"))
+os.environ.setdefault("DOC_STORE_DIR", os.path.join(_TMP, "docs"))
+os.environ.setdefault("JOB_DIR", os.path.join(_TMP, "jobs"))
+os.environ.setdefault("MAIL_DB", os.path.join(_TMP, "mail.sqlite3"))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(_TMP, "store.sqlite3"))
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,27 @@
+import random
+
+from utils.chunk import chunk_pages, count_tokens
+
+WORDS = "vendor purchaser land title volume folio planning zone overlay rates council $2,104.50 1962 section".split()
+
+
+def _pages(rng, n=5):
+    pages = []
+    for i in range(1, n + 1):
+        paras = ["\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))) for _ in range(rng.randint(1, 6)))
+                 for _ in range(rng.randint(1, 60))]
+        pages.append({"page": i, "text": "\n\n".join(paras)})
+    return pages
+
+
+def test_chunks_stay_within_budget_when_pages_are_split():
+    rng = random.Random(1)
+    for budget in (300, 600, 2000):
+        for _ in range(10):
+            pages = _pages(rng)
+            chunks = chunk_pages(pages, max_tokens=budget)
+            assert any("(cont.)" in ch["text"] for ch in chunks)
+            for ch in chunks:
+                assert ch["tokens"] <= budget
+                assert count_tokens(ch["text"]) <= budget
+            assert sorted({n for ch in chunks for n in ch["pages"]}) == [p["page"] for p in pages]
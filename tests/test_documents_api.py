@@ -0,0 +1,49 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from utils.store import Store
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = Store("sqlite:///" + str(tmp_path / "store.sqlite3"))
+    monkeypatch.setattr(main, "store", store)
+    yield TestClient(main.app), store  # not entered: startup hooks (workers, SMTP) don't run
+    store.close()
+
+
+def test_get_document_404(client):
+    c, _ = client
+    resp = c.get("/documents/nope")
+    assert resp.status_code == 404
+
+
+def test_get_document_200(client):
+    c, store = client
+    pages = [{"page": 1, "text": "Volume 10234 Folio 567"}]
+    summary = {"title": {"volume_folio": "Volume 10234 Folio 567", "page_refs": [1]}}
+    store.save_document("doc1", "s32.pdf", "ab" * 32, pages, summary,
+                        chunks=[{"pages": [1]}], outputs=[summary])
+
+    resp = c.get("/documents/doc1")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["doc_id"] == "doc1"
+    assert body["summary"] == summary
+    assert "pages" not in body
+
+    body = c.get("/documents/doc1", params={"pages": True, "chunks": True}).json()
+    assert body["pages"] == pages
+    assert body["chunks"] == [{"index": 0, "pages": [1], "output": summary}]
+
+
+def test_get_document_503_without_store(monkeypatch):
+    monkeypatch.setattr(main, "store", None)
+    assert TestClient(main.app).get("/documents/doc1").status_code == 503
+
+
+def test_unreachable_database_leaves_store_off(monkeypatch):
+    # Nothing listens on port 1: connecting fails at once instead of crashing startup.
+    monkeypatch.setattr(main, "DATABASE_URL", "postgresql://user:pw@127.0.0.1:1/contracts")
+    assert main._open_store() is None
@@ -0,0 +1,23 @@
+import zipfile
+
+from utils.extract import extract_docx_with_pages
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+TABS = '<w:pPr><w:tabs><w:tab w:val="left" w:pos="1440"/><w:tab w:val="right" w:pos="9000"/></w:tabs></w:pPr>'
+
+
+def _docx(tmp_path, body):
+    path = str(tmp_path / "doc.docx")
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("word/document.xml", f"<w:document {W}><w:body>{body}</w:body></w:document>")
+    return path
+
+
+def test_tab_stops_are_not_text(tmp_path):
+    # A paragraph nested in a text box sits inside the outer paragraph's runs, so its
+    # tab-stop definitions would land mid-line; only w:tab inside a run is a tab.
+    body = (f"<w:p>{TABS}<w:r><w:t>Vendor</w:t></w:r><w:r><w:tab/><w:t>John Smith</w:t></w:r>"
+            f"<w:r><w:pict><w:txbxContent><w:p>{TABS}<w:r><w:t>Lot 3</w:t></w:r></w:p></w:txbxContent></w:pict></w:r></w:p>"
+            f"<w:p>{TABS}<w:r><w:t>Purchaser</w:t></w:r></w:p>")
+    pages = extract_docx_with_pages(_docx(tmp_path, body))
+    assert pages == [{"page": 1, "text": "Vendor\tJohn SmithLot 3\nPurchaser"}]
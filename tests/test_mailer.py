@@ -0,0 +1,99 @@
+import asyncio
+import socket
+
+import pytest
+
+from utils.mailer import DeliveryLog, Mailer
+
+aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+
+class _Handler:
+    """Local SMTP stand-in: accepts mail, refuses recipients at reject.example."""
+
+    def __init__(self):
+        self.received = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith("@reject.example"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append((envelope.rcpt_tos[:], envelope.content.decode()))
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    handler = _Handler()
+    controller = aiosmtpd.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield handler, port
+    controller.stop()
+
+
+def _mailer(port, log, **kw):
+    return Mailer("127.0.0.1", port, sender="s32@example.com", starttls=False, log=log, backoff=0.01, **kw)
+
+
+def test_status_is_shared_between_workers(smtp, tmp_path):
+    handler, port = smtp
+    db = str(tmp_path / "mail.sqlite3")
+
+    async def run():
+        sender = _mailer(port, DeliveryLog(db))
+        other = _mailer(port, DeliveryLog(db))  # another uvicorn worker: same file, never started
+        sender.start()
+        ok = await sender.submit("buyer@example.com", "Section 32 summary", "Zone: GRZ1")
+        bad = await sender.submit("nobody@reject.example", "Section 32 summary", "Zone: GRZ1")
+        for _ in range(200):
+            if (await other.status(ok))["status"] == "sent" and (await other.status(bad))["status"] == "failed":
+                break
+            await asyncio.sleep(0.01)
+        await sender.stop()
+        return await other.status(ok), await other.status(bad), await other.status("nope")
+
+    ok, bad, unknown = asyncio.run(run())
+    assert ok["status"] == "sent" and ok["to"] == "buyer@example.com" and ok["attempts"] == 1
+    assert bad["status"] == "failed" and "550" in bad["error"]  # permanent: not retried
+    assert unknown is None
+    assert [rcpt for rcpt, _ in handler.received] == [["buyer@example.com"]]
+    assert "Zone: GRZ1" in handler.received[0][1]
+
+
+def test_stop_sends_what_is_queued(smtp, tmp_path):
+    handler, port = smtp
+    log = DeliveryLog(str(tmp_path / "mail.sqlite3"))
+
+    async def run():
+        mailer = _mailer(port, log)
+        mailer.start()
+        ids = [await mailer.submit(f"buyer{i}@example.com", "Summary", "body") for i in range(5)]
+        await mailer.stop()
+        assert await mailer.submit("late@example.com", "Summary", "body") is None
+        return ids
+
+    ids = asyncio.run(run())
+    assert [log.get(i)["status"] for i in ids] == ["sent"] * 5
+    assert len(handler.received) == 5
+
+
+def test_stop_fails_what_it_could_not_send(tmp_path):
+    log = DeliveryLog(str(tmp_path / "mail.sqlite3"))
+
+    async def run():
+        # Nothing listens on port 1: every attempt is a transient connection error.
+        mailer = _mailer(1, log, timeout=0.5, drain_seconds=0.5, max_attempts=1000)
+        mailer.start()
+        delivery_id = await mailer.submit("buyer@example.com", "Summary", "body")
+        await asyncio.sleep(0.05)
+        await mailer.stop()
+        return delivery_id
+
+    d = log.get(asyncio.run(run()))
+    assert d["status"] == "failed" and d["error"] == "Shut down before delivery" and d["attempts"] >= 1
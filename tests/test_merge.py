@@ -0,0 +1,18 @@
+from utils.merge import entity_key, merge_results
+
+
+def test_entity_key_strips_only_trailing_corporate_suffixes():
+    assert entity_key("Westpac Banking Corporation") == entity_key("WESTPAC BANKING CORP LTD") == "westpac banking"
+    assert entity_key("The Trust Company (Australia) Pty. Ltd. ABN 21 000 000 993") == "trust company australia"
+    assert entity_key("Bank of Melbourne") == "bank of melbourne"
+    assert entity_key("Australia and New Zealand Banking Group Limited") == "australia and new zealand banking group"
+
+
+def test_owner_names_keep_companies_apart_from_people():
+    merged = merge_results([
+        {"title": {"owner_names": ["John Smith", "JOHN SMITH"], "page_refs": [1]}},
+        {"title": {"owner_names": ["John Smith Pty Ltd"], "page_refs": [2]}},
+        {"mortgages": {"mortgagees": ["Westpac Banking Corporation", "WESTPAC BANKING CORP"], "page_refs": [3]}},
+    ])
+    assert sorted(merged["title"]["owner_names"]) == ["John Smith", "John Smith Pty Ltd"]
+    assert merged["mortgages"]["mortgagees"] == ["Westpac Banking Corporation"]
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import openai
+import pytest
+
+from utils.ratelimit import CircuitBreaker, CircuitOpen, ModelGate
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import fake_openai  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Sections in scope for this excerpt: title\n[[PAGE 1]] Volume 10234 Folio 567"}]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """scripts/fake_openai.py served in-process; tests change its SETTINGS to inject failures."""
+    monkeypatch.setattr(fake_openai, "SETTINGS", {**fake_openai.SETTINGS, "latency": 0.0, "jitter": 0.0,
+                                                  "rpm": 0, "rate_429": 0.0, "error_rate": 0.0})
+    fake_openai._recent.clear()
+    for k in fake_openai.STATS:
+        fake_openai.STATS[k] = 0
+    return fake_openai
+
+
+def _client(on_response=None):
+    hooks = {"response": [on_response]} if on_response else {}
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_openai.app), event_hooks=hooks)
+    return openai.AsyncOpenAI(api_key="x", base_url="http://fake/v1", max_retries=0, http_client=http)
+
+
+def _gate(tmp_path, **kw):
+    breaker = CircuitBreaker(threshold=2, cooldown=0.3, path=str(tmp_path / "ratelimit.sqlite3"))
+    return ModelGate(None, breaker, backoff_base=0.001, **kw)
+
+
+def test_retry_after_is_honoured(fake, tmp_path):
+    fake.SETTINGS["rate_429"] = 1.0  # the fake answers 429 with Retry-After: 1.000
+
+    async def first_only(response):
+        fake.SETTINGS["rate_429"] = 0.0
+
+    gate = _gate(tmp_path, backoff_max=5.0)
+    t0 = time.monotonic()
+    resp = asyncio.run(gate.acreate(_client(first_only), "chunk", model="gpt-4o-mini", messages=MESSAGES))
+    assert time.monotonic() - t0 >= 1.0
+    assert resp.usage.total_tokens > 0
+    assert gate.retries == 1 and fake.STATS["rate_limited"] == 1
+    assert gate.breaker.state == "closed"
+
+
+def test_retries_run_out(fake, tmp_path):
+    fake.SETTINGS["rate_429"] = 1.0
+    gate = _gate(tmp_path, max_retries=2, backoff_max=0.01)
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(gate.acreate(_client(), "chunk", model="gpt-4o-mini", messages=MESSAGES))
+    assert fake.STATS["rate_limited"] == 3
+    assert gate.breaker.state == "closed"  # throttling isn't an outage
+
+
+def test_breaker_opens_and_closes_for_every_worker(fake, tmp_path):
+    fake.SETTINGS["error_rate"] = 1.0
+    gate = _gate(tmp_path, max_retries=0)
+    other = _gate(tmp_path, max_retries=0)  # another worker on the same RATE_LIMIT_DB
+    client = _client()
+
+    def call(g):
+        return asyncio.run(g.acreate(client, "chunk", model="gpt-4o-mini", messages=MESSAGES))
+
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            call(gate)
+    assert gate.breaker.state == "open" and other.breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        call(other)
+    assert fake.STATS["errors"] == 2  # the open breaker didn't reach the API
+
+    time.sleep(0.35)
+    fake.SETTINGS["error_rate"] = 0.0
+    assert other.breaker.state == "half_open"
+    call(other)  # the trial call succeeds and closes it for both
+    assert gate.breaker.state == "closed" and gate.breaker.failures == 0
@@ -0,0 +1,64 @@
+import pytest
+
+from utils.store import Store
+
+PAGES = [{"page": 1, "text": "Register Search Statement\nVolume 10234 Folio 567"},
+         {"page": 2, "text": "Planning Certificate\nZone: GRZ1"}]
+CHUNKS = [{"pages": [1]}, {"pages": [2]}]
+OUTPUTS = [{"title": {"volume_folio": "Volume 10234 Folio 567", "page_refs": [1]}},
+           {"planning_zoning": {"zone": "GRZ1", "page_refs": [2]}}]
+SUMMARY = {"title": {"volume_folio": "Volume 10234 Folio 567", "page_refs": [1]},
+           "planning_zoning": {"zone": "GRZ1", "page_refs": [2]}, "missing_or_unclear": []}
+USAGE = {"by_model": {"gpt-4o-mini": {"prompt_tokens": 1200, "completion_tokens": 300, "calls": 2}}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = Store("sqlite:///" + str(tmp_path / "store.sqlite3"))
+    yield s
+    s.close()
+
+
+def save(store, doc_id="doc1", **kw):
+    args = dict(pages=PAGES, summary=SUMMARY, chunks=CHUNKS, outputs=OUTPUTS,
+                model="gpt-4o-mini", prompt_version="v1", usage=USAGE)
+    args.update(kw)
+    store.save_document(doc_id, "s32.pdf", "ab" * 32, **args)
+
+
+def test_save_and_get_round_trip(store):
+    assert not store.has_document("doc1")
+    save(store)
+    assert store.has_document("doc1")
+
+    doc = store.get_document("doc1", include_pages=True, include_chunks=True)
+    assert doc["doc_id"] == "doc1"
+    assert doc["file"] == "s32.pdf"
+    assert doc["page_count"] == 2
+    assert doc["summary"] == SUMMARY
+    assert doc["pages"] == PAGES
+    assert doc["chunks"] == [{"index": 0, "pages": [1], "output": OUTPUTS[0]},
+                             {"index": 1, "pages": [2], "output": OUTPUTS[1]}]
+    assert doc["usage"] == {"gpt-4o-mini": {"prompt_tokens": 1200, "completion_tokens": 300, "calls": 2}}
+
+
+def test_get_omits_pages_and_chunks_by_default(store):
+    save(store)
+    doc = store.get_document("doc1")
+    assert "pages" not in doc and "chunks" not in doc
+
+
+def test_resave_replaces_pages_and_accumulates_usage(store):
+    save(store)
+    save(store, pages=PAGES[:1], chunks=CHUNKS[:1], outputs=OUTPUTS[:1], summary={"missing_or_unclear": []})
+    doc = store.get_document("doc1", include_pages=True, include_chunks=True)
+    assert doc["page_count"] == 1
+    assert doc["pages"] == PAGES[:1]
+    assert len(doc["chunks"]) == 1
+    assert doc["summary"] == {"missing_or_unclear": []}
+    assert doc["usage"]["gpt-4o-mini"]["calls"] == 4
+
+
+def test_unknown_document(store):
+    assert not store.has_document("missing")
+    assert store.get_document("missing") is None
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from utils import usage
+
+
+def test_page_ranges():
+    assert usage.page_ranges([10, 1, 2, 3, 7, 9, 2]) == "1-3, 7, 9-10"
+    assert usage.page_ranges([5]) == "5"
+    assert usage.page_ranges([]) == ""
+
+
+def test_nested_meters_share_the_outer_budget():
+    with usage.metering(max_tokens=1000, max_pages=10) as batch:
+        with usage.metering(max_tokens=1000, max_pages=10) as first:
+            usage.check_pages(6, charge=True)
+            first.add("gpt-4o-mini", "chunk", 500, 200)
+        with usage.metering(max_tokens=1000, max_pages=10) as second:
+            assert second.remaining_tokens() == 300
+            with pytest.raises(usage.BudgetExceeded, match="4 of the request's 10-page budget"):
+                usage.check_pages(5)
+            usage.check_pages(4, charge=True)
+            second.add("gpt-4o-mini", "chunk", 300, 0)
+            assert second.exhausted()
+    assert first.report()["prompt_tokens"] == 500
+    assert batch.report()["prompt_tokens"] == 800
+    assert batch.report()["calls"] == 2
+    assert batch.pages == 10
+
+
+def test_check_pages_outside_a_meter(monkeypatch):
+    monkeypatch.setattr(usage, "UPLOAD_MAX_PAGES", 3)
+    usage.check_pages(3)
+    with pytest.raises(usage.BudgetExceeded, match="the limit is 3"):
+        usage.check_pages(4)
+
+
+def test_reservations_hold_the_outer_budget():
+    seen = []
+
+    async def file(planned, reserved):
+        with usage.metering(max_tokens=1000) as m:
+            if planned is None:
+                m.reserve(600)
+                reserved.set()
+                await asyncio.sleep(0)
+                m.add("gpt-4o-mini", "chunk", 200, 0)
+                seen.append(("own", m.remaining_tokens()))
+            else:
+                await reserved.wait()
+                seen.append(("sibling", m.remaining_tokens()))
+                await planned.wait()
+
+    async def batch():
+        reserved, done = asyncio.Event(), asyncio.Event()
+        with usage.metering(max_tokens=1000) as meter:
+            await asyncio.gather(file(None, reserved), file(done, reserved), _after(done))
+            seen.append(("after", meter.remaining_tokens()))
+
+    async def _after(done):
+        await asyncio.sleep(0.01)
+        done.set()
+
+    asyncio.run(batch())
+    # A sibling sees the 600 held; the reserving file only its own spend; closed meters hold nothing.
+    assert seen == [("sibling", 400), ("own", 800), ("after", 800)]
@@ -1,16 +1,153 @@
-from typing import List, Dict, Any
+import os
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+# Real token counts when tiktoken (and its encoding files) are available; otherwise a
+# ~4 chars/token estimate, which is close enough for budgeting English legal text.
+try:
+    import tiktoken  # type: ignore
+    _HAS_TIKTOKEN = True
+except Exception:
+    _HAS_TIKTOKEN = False
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "12000"))
+# Once a chunk is this full, a page that opens a new Section 32 heading starts a new chunk.
+CHUNK_SOFT_FILL = float(os.getenv("CHUNK_SOFT_FILL", "0.6"))
+
+# Headings of the Section 32 body and of the certificates usually attached to it.
+SECTION_HEADING_RE = re.compile(
+    r"^\s*(?:\d{1,2}(?:\.\d{1,2})*\.?\s+)?(?:"
+    r"title|register search statement|financial matters|mortgages?|charges?|"
+    r"insurance|land use|easements?|covenants?|planning|zoning|planning certificate|"
+    r"rates|outgoings|land information certificate|owners corporation|"
+    r"building permits?|notices?|services|subdivision|special conditions|"
+    r"growth areas? infrastructure contribution|disclosure of energy information|"
+    r"due diligence checklist|attachments?"
+    r")\b[^\n]{0,60}$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if not _HAS_TIKTOKEN:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        return None  # encoding files unavailable (offline); use the estimate
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def starts_section(text: str) -> bool:
+    """True if one of the first few non-blank lines is a Section 32 heading."""
+    head = "\n".join([ln for ln in text.splitlines() if ln.strip()][:3])
+    return bool(SECTION_HEADING_RE.search(head))
+
+
+def _split_text(text: str, budget: int, model: str) -> List[str]:
+    """Split an over-budget page: at headings, then blank lines, then lines, then hard cuts."""
+    if count_tokens(text, model) <= budget:
+        return [text]
+    for pattern in (SECTION_HEADING_RE, re.compile(r"\n\s*\n"), re.compile(r"\n")):
+        cuts = [m.start() for m in pattern.finditer(text) if m.start() > 0]
+        if cuts:
+            parts = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+            return _pack_parts(parts, budget, model)
+    # One enormous line: cut on characters, sized from the measured density.
+    step = max(1, int(len(text) * budget / max(1, count_tokens(text, model))))
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def _pack_parts(parts: List[str], budget: int, model: str) -> List[str]:
+    out: List[str] = []
+    buff, used = "", 0
+    for part in parts:
+        n = count_tokens(part, model)
+        if n > budget:
+            if buff and budget - used >= budget // 2:
+                # Keep what's buffered (often just a heading) with the start of the text it
+                # introduces instead of sending it as a chunk of its own: split the part to
+                # the room left, so its first piece fits after the buffer.
+                pieces = _split_text(part, budget - used, model)
+                pieces[0] = buff + pieces[0]
+            else:
+                if buff:
+                    out.append(buff)
+                pieces = _split_text(part, budget, model)
+            buff, used = "", 0
+            out.extend(pieces)
+            continue
+        if used + n > budget and buff:
+            out.append(buff)
+            buff, used = "", 0
+        buff += part
+        used += n
+    if buff:
+        out.append(buff)
+    return out
+
+
+def chunk_pages(pages: List[Dict[str, Any]], max_tokens: int = CHUNK_MAX_TOKENS,
+                model: str = "gpt-4o-mini", reserve_tokens: int = 0) -> List[Dict[str, Any]]:
+    """Pack page texts into chunks of at most `max_tokens - reserve_tokens` tokens, carrying page provenance.
+
+    `reserve_tokens` is the prompt overhead (instructions + schema) that rides along with
+    every chunk. Pages larger than the budget are split (preferring heading boundaries);
+    a page that opens a new section starts a new chunk once the current one is reasonably full.
+    Each chunk is {"text", "pages", "tokens"}.
+    """
+    budget = max(256, max_tokens - reserve_tokens)
+    chunks: List[Dict[str, Any]] = []
+    buff, buff_pages, used = "", [], 0
+
+    def flush():
+        nonlocal buff, buff_pages, used
+        if buff:
+            chunks.append({"text": buff, "pages": buff_pages, "tokens": used})
+        buff, buff_pages, used = "", [], 0
 
-def chunk_pages(pages: List[Dict[str, Any]], max_chars: int = 8000) -> List[Dict[str, Any]]:
-    chunks = []
-    buff, buff_pages = "", []
     for p in pages:
+        text = p.get("text") or ""
         header = f"[[PAGE {p['page']}]]\n"
-        candidate = header + (p.get("text") or "") + "\n\n"
-        if len(buff) + len(candidate) > max_chars and buff:
-            chunks.append({"text": buff, "pages": buff_pages[:]})
-            buff, buff_pages = "", []
-        buff += candidate
-        buff_pages.append(p["page"])
-    if buff:
-        chunks.append({"text": buff, "pages": buff_pages})
+        cont = f"[[PAGE {p['page']} (cont.)]]\n"
+        # Sized for the longer continuation header, which every piece after the first carries.
+        overhead = count_tokens(cont, model) + 1
+        pieces = _split_text(text, budget - overhead, model)
+        for n, piece in enumerate(pieces):
+            candidate = (header if n == 0 else cont) + piece + "\n\n"
+            cost = count_tokens(candidate, model)
+            if buff and (used + cost > budget or (used >= budget * CHUNK_SOFT_FILL and starts_section(piece))):
+                flush()
+            buff += candidate
+            used += cost
+            if p["page"] not in buff_pages:
+                buff_pages.append(p["page"])
+    flush()
     return chunks
+
+
+def chunk_report(chunks: List[Dict[str, Any]], budget: Optional[int] = None) -> Dict[str, Any]:
+    tokens = [c.get("tokens", 0) for c in chunks]
+    out: Dict[str, Any] = {
+        "count": len(chunks),
+        "tokens_per_chunk": tokens,
+        "total_tokens": sum(tokens),
+    }
+    if budget:
+        out["budget"] = budget
+        out["mean_fill"] = round(sum(tokens) / (len(tokens) * budget), 3) if tokens else 0.0
+    return out
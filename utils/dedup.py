@@ -0,0 +1,147 @@
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils.chunk import count_tokens
+
+# Near-duplicate pages (estimated Jaccard over word shingles >= DEDUP_THRESHOLD, and the same
+# numbers on both) are sent once; boilerplate-only pages aren't sent at all.
+DEDUP_PAGES = os.getenv("DEDUP_PAGES", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+DEDUP_SHINGLE = int(os.getenv("DEDUP_SHINGLE", "5"))
+DEDUP_BINS = int(os.getenv("DEDUP_BINS", "64"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+# Pages with fewer words than this are only collapsed when their normalised text is identical.
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "20"))
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[.,/'-][a-z0-9]+)*")
+_NUMBER_RE = re.compile(r"\d[\d,./-]*\d|\d")
+BLANK_PAGE_RE = re.compile(
+    r"(?:this\s+page\s+(?:has\s+been\s+|is\s+)?)?(?:intentionally|deliberately)\s+(?:left\s+)?blank",
+    re.IGNORECASE,
+)
+_FILLER_RE = re.compile(r"page\s+\d+(?:\s+of\s+\d+)?|continued\s+(?:over|overleaf)", re.IGNORECASE)
+# What may remain on a "left blank" sheet besides the phrase itself (a form title, a footer).
+_BOILERPLATE_MAX_WORDS = 6
+_EMPTY = 0xFFFFFFFF + 1
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def is_boilerplate(text: str) -> bool:
+    """Empty, only page numbers, or a "this page intentionally left blank" sheet."""
+    rest = _words(_FILLER_RE.sub(" ", text or ""))
+    if not any(w[0].isalpha() for w in rest):
+        return True
+    return bool(BLANK_PAGE_RE.search(text)) and len(_words(BLANK_PAGE_RE.sub(" ", " ".join(rest)))) <= _BOILERPLATE_MAX_WORDS
+
+
+def sketch(words: List[str], k: int = DEDUP_SHINGLE, bins: int = DEDUP_BINS) -> List[int]:
+    """One-permutation MinHash: each k-word shingle is hashed once (crc32, stable across
+    processes) into one of `bins` bins, keeping the minimum per bin. Two pages' share of equal
+    non-empty bins estimates the Jaccard similarity of their shingle sets."""
+    out = [_EMPTY] * bins
+    for i in range(max(1, len(words) - k + 1)):
+        h = zlib.crc32(" ".join(words[i:i + k]).encode("utf-8"))
+        b = h % bins
+        if h < out[b]:
+            out[b] = h
+    return out
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    both = [(x, y) for x, y in zip(a, b) if x != _EMPTY or y != _EMPTY]
+    return sum(1 for x, y in both if x == y) / len(both) if both else 1.0
+
+
+def _bands(sk: List[int], bands: int, rows: int) -> List[Tuple[int, Tuple[int, ...]]]:
+    # Bands with no shingles in them would put every short page in one bucket.
+    out = []
+    for b in range(bands):
+        key = tuple(sk[b * rows:(b + 1) * rows])
+        if any(x != _EMPTY for x in key):
+            out.append((b, key))
+    return out
+
+
+def dedup_pages(pages: List[Dict[str, Any]], threshold: float = DEDUP_THRESHOLD,
+                bands: int = DEDUP_BANDS, model: str = "gpt-4o-mini") -> Tuple[List[Dict[str, Any]], Dict[int, List[int]], Dict[str, Any]]:
+    """Drop boilerplate and collapse near-duplicate pages, keeping the first of each group.
+
+    Candidates come from LSH over the sketch bins (`bands` bands), then are confirmed by
+    estimated similarity and an exact match of the numbers on the page (so two certificates
+    that differ only in a lot number or amount are both kept).
+    Returns (kept pages in order, {kept page: [pages it stands for]}, report).
+    """
+    kept: List[Dict[str, Any]] = []
+    aliases: Dict[int, List[int]] = {}
+    blank: List[int] = []
+    tokens_saved = 0
+    rows = max(1, DEDUP_BINS // max(1, bands))
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+    exact: Dict[str, int] = {}
+    info: Dict[int, Tuple[List[int], Set[str]]] = {}
+
+    for p in pages:
+        n, text = p["page"], p.get("text") or ""
+        if is_boilerplate(text):
+            blank.append(n)
+            tokens_saved += count_tokens(text, model) if text else 0
+            continue
+        words = _words(text)
+        norm = " ".join(words)
+        rep: Optional[int] = exact.get(norm)
+        numbers = set(_NUMBER_RE.findall(text))
+        sk: List[int] = []
+        if rep is None and len(words) >= DEDUP_MIN_WORDS:
+            sk = sketch(words)
+            seen: Set[int] = set()
+            for band in _bands(sk, bands, rows):
+                for cand in buckets.get(band, ()):
+                    if cand in seen:
+                        continue
+                    seen.add(cand)
+                    c_sk, c_numbers = info[cand]
+                    if c_numbers == numbers and similarity(sk, c_sk) >= threshold:
+                        rep = cand
+                        break
+                if rep is not None:
+                    break
+        if rep is not None:
+            aliases.setdefault(rep, []).append(n)
+            tokens_saved += count_tokens(text, model)
+            continue
+        kept.append(p)
+        exact.setdefault(norm, n)
+        if sk:
+            info[n] = (sk, numbers)
+            for band in _bands(sk, bands, rows):
+                buckets.setdefault(band, []).append(n)
+
+    report = {
+        "pages_in": len(pages),
+        "pages_kept": len(kept),
+        "pages_saved": len(pages) - len(kept),
+        "tokens_saved": tokens_saved,
+        "duplicates": {str(k): v for k, v in aliases.items()},
+        "blank_pages": blank,
+    }
+    return kept, aliases, report
+
+
+def expand_page_refs(result: Dict[str, Any], aliases: Dict[int, List[int]]) -> Dict[str, Any]:
+    """Copy of a chunk result whose page_refs also cite the pages each kept page stands for."""
+    if not aliases:
+        return result
+    out = dict(result)
+    for key, val in result.items():
+        if isinstance(val, dict) and isinstance(val.get("page_refs"), list):
+            refs = set(val["page_refs"])
+            for n in val["page_refs"]:
+                if isinstance(n, int):
+                    refs.update(aliases.get(n, ()))
+            out[key] = {**val, "page_refs": sorted(r for r in refs if isinstance(r, int))}
+    return out
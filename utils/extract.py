@@ -1,31 +1,194 @@
-import fitz  # PyMuPDF
-from docx import Document
-from typing import List, Dict, Any
-
-try:
-    import pytesseract  # type: ignore
-    from PIL import Image  # type: ignore
-    _HAS_TESSERACT = True
-except Exception:
-    _HAS_TESSERACT = False
-
-def extract_pdf_with_pages(path: str, ocr: bool = True) -> List[Dict[str, Any]]:
-    doc = fitz.open(path)
-    pages = []
-    for i, page in enumerate(doc):
-        text = page.get_text("text") or ""
-        if not text.strip() and ocr and _HAS_TESSERACT:
-            try:
-                pix = page.get_pixmap(dpi=300)
-                import io
-                img = Image.open(io.BytesIO(pix.tobytes("png")))
-                text = pytesseract.image_to_string(img)
-            except Exception:
-                text = text or ""
-        pages.append({"page": i + 1, "text": text})
+import os
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional
+
+from lxml import etree
+
+from utils.ingest import open_pdf
+from utils.ocr import ocr_pages, _HAS_TESSERACT
+
+# Worker processes for page-range sharded extraction. Small documents are
+# extracted in-process: shipping them to a pool costs more than it saves.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        # spawn: the API process has threads (uvicorn, threadpool) that fork would copy mid-flight
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[Dict[str, Any]]:
+    with open_pdf(path) as doc:
+        return [{"page": i + 1, "text": doc[i].get_text("text") or ""} for i in range(start, stop)]
+
+
+def _page_ranges(n: int, shards: int) -> List[tuple]:
+    step = -(-n // shards)
+    return [(a, min(a + step, n)) for a in range(0, n, step)]
+
+
+def extract_pdf_parallel(path: str, workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Extract the text layer with page ranges sharded across worker processes; result is in page order."""
+    workers = PDF_WORKERS if workers is None else workers
+    with open_pdf(path) as doc:
+        n = doc.page_count
+    if workers <= 1 or n < PDF_PARALLEL_MIN_PAGES:
+        return _extract_range(path, 0, n)
+    # A few shards per worker so one slow (image-heavy) range doesn't hold up the rest.
+    try:
+        futures = [
+            _get_pool(workers).submit(_extract_range, path, a, b)
+            for a, b in _page_ranges(n, min(n, workers * 4))
+        ]
+        pages: List[Dict[str, Any]] = []
+        for f in futures:
+            pages.extend(f.result())
+        return pages
+    except BrokenProcessPool:
+        # A worker died (OOM, MuPDF crash): drop the pool so the next document gets a fresh
+        # one, and extract this one in-process.
+        shutdown_pool(wait=False)
+        return _extract_range(path, 0, n)
+
+
+def extract_pdf_with_pages(path: str, ocr: bool = True, workers: Optional[int] = None,
+                           ocr_cache: Any = None) -> List[Dict[str, Any]]:
+    pages = extract_pdf_parallel(path, workers=workers)
+    if ocr and _HAS_TESSERACT:
+        blank = [p["page"] for p in pages if not p["text"].strip()]
+        for n, text in ocr_pages(path, blank, cache=ocr_cache).items():
+            pages[n - 1]["text"] = text
     return pages
 
+# DOCX has no stored pagination: pseudo-pages end at explicit page breaks, section breaks and
+# (DOCX_RENDERED_BREAKS) the page breaks Word recorded at its last layout.
+DOCX_RENDERED_BREAKS = os.getenv("DOCX_RENDERED_BREAKS", "true").lower() == "true"
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+_OFF = ("0", "false", "off")
+
+
+class _DocxPages:
+    """Collects paragraphs and table rows into pseudo-pages while word/document.xml streams by."""
+
+    def __init__(self) -> None:
+        self.pages: List[List[str]] = [[]]
+        self.runs: List[str] = []  # text of the paragraph being read
+        self.rows: List[List[str]] = []  # per open table: cell texts of the current row
+        self.cell: List[List[str]] = []  # per open table: paragraphs of the current cell
+        self.pending = False  # a break inside a table takes effect after the outer row
+
+    def end_line(self) -> None:
+        line = "".join(self.runs).strip()
+        self.runs = []
+        if line:
+            (self.cell[-1] if self.cell else self.pages[-1]).append(line)
+
+    def new_page(self) -> None:
+        self.end_line()
+        if self.pages[-1]:  # Word records a rendered break right after an explicit one: count it once
+            self.pages.append([])
+
+    def page_break(self) -> None:
+        if self.cell:
+            self.pending = True
+        else:
+            self.new_page()
+
+    def end_cell(self) -> None:
+        self.end_line()
+        self.rows[-1].append(" ".join(self.cell[-1]))
+        self.cell[-1] = []
+
+    def end_row(self) -> None:
+        cells = [c for c in self.rows[-1] if c]
+        self.rows[-1] = []
+        if cells:
+            (self.cell[-2] if len(self.cell) > 1 else self.pages[-1]).append(" | ".join(cells))
+        if self.pending and len(self.cell) == 1:
+            self.pending = False
+            self.new_page()
+
+    def texts(self) -> List[str]:
+        self.end_line()
+        return ["\n".join(lines) for lines in self.pages if lines] or [""]
+
+
 def extract_docx_with_pages(path: str) -> List[Dict[str, Any]]:
-    d = Document(path)
-    text = "\\n".join(p.text for p in d.paragraphs)
-    return [{"page": 1, "text": text}]
+    """Stream word/document.xml (lxml.iterparse) into pseudo-pages, table rows as "a | b | c".
+
+    Memory stays flat: each body-level element is dropped once read. Headers, footers and
+    tracked deletions are left out; text boxes are read once (not again from their fallback).
+    """
+    acc = _DocxPages()
+    fallback = 0
+    with zipfile.ZipFile(path) as zf, zf.open("word/document.xml") as xml:
+        for event, el in etree.iterparse(xml, events=("start", "end")):
+            tag = el.tag
+            if tag == _MC_FALLBACK:
+                fallback += 1 if event == "start" else -1
+                continue
+            if fallback:
+                continue
+            if event == "start":
+                if tag == _W + "tbl":
+                    acc.end_line()
+                    acc.rows.append([])
+                    acc.cell.append([])
+                elif tag == _W + "lastRenderedPageBreak" and DOCX_RENDERED_BREAKS:
+                    acc.page_break()
+                continue
+            if tag == _W + "t":
+                acc.runs.append(el.text or "")
+            elif tag == _W + "tab" and el.getparent().tag == _W + "r":  # not a tab stop under pPr/tabs
+                acc.runs.append("\t")
+            elif tag in (_W + "br", _W + "cr"):
+                if el.get(_W + "type") == "page":
+                    acc.page_break()
+                else:
+                    acc.runs.append("\n")
+            elif tag == _W + "pageBreakBefore" and el.get(_W + "val", "true") not in _OFF:
+                acc.page_break()
+            elif tag == _W + "p":
+                acc.end_line()
+                # A sectPr in the paragraph's properties ends a section. Whether the next one
+                # starts a new page is only stated in *its* sectPr, further on; split anyway.
+                if el.find(_W + "pPr/" + _W + "sectPr") is not None:
+                    acc.page_break()
+            elif tag == _W + "tc":
+                acc.end_cell()
+            elif tag == _W + "tr":
+                acc.end_row()
+            elif tag == _W + "tbl":
+                acc.rows.pop()
+                acc.cell.pop()
+                if acc.pending and not acc.cell:
+                    acc.pending = False
+                    acc.new_page()
+            parent = el.getparent()
+            if parent is not None and parent.tag == _W + "body":
+                el.clear()
+                while el.getprevious() is not None:
+                    del parent[0]
+    return [{"page": i + 1, "text": text} for i, text in enumerate(acc.texts())]
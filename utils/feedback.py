@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+FEEDBACK_QUEUE_MAX = int(os.getenv("FEEDBACK_QUEUE_MAX", "5000"))
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "200"))
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", "2"))
+# How long a request may wait for room in a full queue before it is refused.
+FEEDBACK_PUT_TIMEOUT = float(os.getenv("FEEDBACK_PUT_TIMEOUT", "0.25"))
+
+
+class FeedbackSink:
+    """Write-behind buffer: items are queued in memory and written in batches by one background task.
+
+    A batch is flushed when it reaches `batch_size` items or `flush_seconds` after its first
+    item. `writer(rows)` is blocking (a multi-row insert) and runs in the threadpool; a failed
+    batch is retried with backoff, then dropped. `stop()` flushes everything still queued.
+    """
+
+    def __init__(self, writer: Callable[[List[Dict[str, Any]]], None], max_queue: int = FEEDBACK_QUEUE_MAX,
+                 batch_size: int = FEEDBACK_BATCH_SIZE, flush_seconds: float = FEEDBACK_FLUSH_SECONDS,
+                 put_timeout: float = FEEDBACK_PUT_TIMEOUT, max_attempts: int = 3):
+        self.writer = writer
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []  # collected, not yet handed to a write
+        self._inflight: Optional[asyncio.Future] = None
+        self._stats = {"accepted": 0, "rejected": 0, "written": 0, "dropped": 0, "batches": 0}
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight is not None:
+            await self._inflight
+        batch, self._batch = self._batch, []
+        await self._write(batch)
+        while not self._queue.empty():
+            await self._write(self._drain(self.batch_size))
+
+    async def submit(self, item: Dict[str, Any]) -> bool:
+        """Queue one item. False if the queue stayed full for `put_timeout` (caller should shed load)."""
+        if self._queue is None:
+            raise RuntimeError("FeedbackSink.start() has not been called")
+        item.setdefault("received_at", time.time())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(item), timeout=self.put_timeout)
+            except asyncio.TimeoutError:
+                self._stats["rejected"] += 1
+                return False
+        self._stats["accepted"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "queued": self._queue.qsize() if self._queue else 0, "max_queue": self.max_queue}
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            self._batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(self._batch) < self.batch_size:
+                self._batch.extend(self._drain(self.batch_size - len(self._batch)))
+                remaining = deadline - time.monotonic()
+                if len(self._batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # Shielded so a shutdown mid-write doesn't lose the batch; stop() awaits it.
+            self._inflight = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await run_in_threadpool(self.writer, batch)
+                self._stats["written"] += len(batch)
+                self._stats["batches"] += 1
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self._stats["dropped"] += len(batch)
+                    print(f"FEEDBACK: dropped {len(batch)} items after {attempt} attempts: {e}")
+                    return
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
@@ -0,0 +1,161 @@
+import os
+import mmap
+import hashlib
+import zipfile
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "20"))
+# Whole-request cap for /upload/batch; each part is still held to MAX_UPLOAD_BYTES by spool_upload.
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_MB", str(BATCH_MAX_FILES * MAX_UPLOAD_BYTES // (1024 * 1024)))) * 1024 * 1024
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large (limit {max_bytes // (1024 * 1024)} MB).")
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES,
+                       block_size: int = UPLOAD_BLOCK_SIZE, dir: Optional[str] = None) -> Tuple[str, str, int]:
+    """Copy an upload to a temp file in fixed-size blocks, hashing as it goes.
+
+    Returns (path, sha256 hex, size). The caller owns the file and must unlink it;
+    on any error here (including the size limit) it is removed before raising.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+    suffix = os.path.splitext(os.path.basename(file.filename or ""))[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=dir)
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(block_size)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+                h.update(block)
+                out.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, h.hexdigest(), size
+
+
+def unpack_zip(path: str, suffixes: Tuple[str, ...] = (".pdf", ".docx"), max_files: int = BATCH_MAX_FILES,
+               max_bytes: int = MAX_UPLOAD_BYTES, dir: Optional[str] = None) -> List[Tuple[str, str, str]]:
+    """Copy the members of a zip with a supported suffix to temp files: [(name, path, sha256)].
+
+    Folders, macOS resource forks and other file types are skipped. The uncompressed total is
+    counted as it is copied (not trusted from the header), so a zip bomb stops at `max_bytes`.
+    The caller owns the returned files; on any error they are removed before raising.
+    """
+    out: List[Tuple[str, str, str]] = []
+    total = 0
+    try:
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                name = info.filename
+                base = os.path.basename(name)
+                if info.is_dir() or name.startswith("__MACOSX/") or base.startswith(".") \
+                        or not base.lower().endswith(suffixes):
+                    continue
+                if len(out) >= max_files:
+                    raise HTTPException(status_code=413, detail=f"Too many files (limit {max_files}).")
+                fd, dest = tempfile.mkstemp(suffix=os.path.splitext(base)[1], dir=dir)
+                out.append((base, dest, ""))
+                h = hashlib.sha256()
+                with zf.open(info) as src, os.fdopen(fd, "wb") as dst:
+                    while True:
+                        block = src.read(UPLOAD_BLOCK_SIZE)
+                        if not block:
+                            break
+                        total += len(block)
+                        if total > max_bytes:
+                            raise _too_large(max_bytes)
+                        h.update(block)
+                        dst.write(block)
+                out[-1] = (base, dest, h.hexdigest())
+    except zipfile.BadZipFile:
+        for _, p, _ in out:
+            remove_quietly(p)
+        raise HTTPException(status_code=400, detail="Not a valid zip archive.")
+    except BaseException:
+        for _, p, _ in out:
+            remove_quietly(p)
+        raise
+    return out
+
+
+def remove_quietly(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def open_pdf(path: str) -> Iterator["fitz.Document"]:
+    """Open a PDF over a read-only memory map: pages are faulted in on demand and
+    shared through the page cache with any other process mapping the same file."""
+    if os.path.getsize(path) == 0:
+        raise fitz.EmptyFileError("Cannot open empty file.")
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    doc = fitz.open(stream=view, filetype="pdf")
+    try:
+        yield doc
+    finally:
+        doc.close()
+        view.release()
+        mm.close()
+
+
+class MaxBodySizeMiddleware:
+    """Reject oversized request bodies before they are parsed: up front from
+    Content-Length, or mid-stream for chunked uploads. `path_limits` overrides
+    `max_bytes` for particular paths (a multi-file upload)."""
+
+    def __init__(self, app, max_bytes: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        max_bytes = self.path_limits.get(scope.get("path", ""), self.max_bytes)
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > max_bytes:
+                return await self._reject(send)
+
+        seen = 0
+
+        async def limited_receive():
+            nonlocal seen
+            message = await receive()
+            if message["type"] == "http.request":
+                seen += len(message.get("body", b""))
+                if seen > max_bytes:
+                    raise _too_large(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body too large."}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
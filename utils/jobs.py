@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from utils.ingest import remove_quietly
+
+DEFAULT_JOB_DIR = os.path.join(tempfile.gettempdir(), "contract_backend_jobs")
+
+
+class JobStore:
+    """Durable job queue in SQLite. Uploaded files live next to it in `job_dir`.
+
+    A job is claimed with a lease; running jobs whose lease lapses (worker died,
+    dyno restarted) are put back in the queue, so state survives restarts and is
+    shared by every uvicorn worker pointing at the same file.
+    """
+
+    def __init__(self, path: str, job_dir: str, lease_seconds: float = 300, max_attempts: int = 3):
+        self.path = path
+        self.job_dir = job_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(job_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT NOT NULL, path TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL, options TEXT NOT NULL DEFAULT '{}',"
+            " chunks_done INTEGER NOT NULL DEFAULT 0, chunks_total INTEGER,"
+            " result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL, lease_until REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at)")
+
+    def _exec(self, sql: str, args: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, args)
+
+    def create(self, filename: str, path: str, sha256: str, options: Optional[Dict[str, Any]] = None,
+               job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        self._exec(
+            "INSERT INTO jobs (id, status, filename, path, sha256, options, created_at) VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, filename, path, sha256, json.dumps(options or {}), time.time()),
+        )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            # Reclaim expired leases first (giving up on jobs that keep killing their worker),
+            # then take the oldest queued job atomically.
+            lost = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', finished_at = ?"
+                " WHERE status = 'running' AND lease_until < ? AND attempts >= ? RETURNING path",
+                (now, now, self.max_attempts),
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND lease_until < ?", (now,)
+            )
+            row = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, lease_until = ?, attempts = attempts + 1"
+                " WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1)"
+                " RETURNING *",
+                (now, now + self.lease_seconds),
+            ).fetchone()
+        for r in lost:
+            remove_quietly(r[0])
+        return self._row(row) if row else None
+
+    def requeue(self, job_id: str) -> None:
+        self._exec("UPDATE jobs SET status = 'queued', lease_until = NULL, attempts = MAX(attempts - 1, 0)"
+                   " WHERE id = ? AND status = 'running'", (job_id,))
+
+    def heartbeat(self, job_id: str) -> None:
+        self._exec("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                   (time.time() + self.lease_seconds, job_id))
+
+    def progress(self, job_id: str, done: Optional[int] = None, total: Optional[int] = None) -> None:
+        self._exec(
+            "UPDATE jobs SET chunks_done = COALESCE(?, chunks_done), chunks_total = COALESCE(?, chunks_total),"
+            " lease_until = ? WHERE id = ?",
+            (done, total, time.time() + self.lease_seconds, job_id),
+        )
+
+    def finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        self._exec("UPDATE jobs SET status = 'done', result = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                   (json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._exec("UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                   (error, time.time(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._exec("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        counts = {s: 0 for s in ("queued", "running", "done", "failed")}
+        for status, n in self._exec("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall():
+            counts[status] = n
+        oldest = self._exec("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        counts["oldest_queued_age_s"] = round(now - oldest, 1) if oldest else 0.0
+        return counts
+
+    def purge(self, older_than_seconds: float) -> List[str]:
+        """Drop finished jobs past retention and any upload still spooled for them; returns their ids."""
+        cutoff = time.time() - older_than_seconds
+        rows = self._exec(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ? RETURNING id, path", (cutoff,)
+        ).fetchall()
+        for r in rows:
+            remove_quietly(r[1])
+        return [r[0] for r in rows]
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        d = dict(row)
+        d["options"] = json.loads(d["options"] or "{}")
+        d["result"] = json.loads(d["result"]) if d["result"] else None
+        return d
+
+
+class JobRunner:
+    """Bounded pool of asyncio workers draining a JobStore with `handler(job)`."""
+
+    def __init__(self, store: JobStore, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 workers: int = 2, poll_seconds: float = 1.0, retention_seconds: float = 24 * 3600):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Set[str] = set()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # Hand in-flight jobs straight back to the queue; if we die before this runs,
+        # their lease lapses and another worker reclaims them anyway.
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._running):
+            await run_in_threadpool(self.store.requeue, job_id)
+        self._running.clear()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    async def _worker(self) -> None:
+        while True:
+            job = await run_in_threadpool(self.store.claim)
+            if job is None:
+                await run_in_threadpool(self.store.purge, self.retention_seconds)
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        self._running.add(job["id"])
+        beat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await self.handler(job)
+            await run_in_threadpool(self.store.finish, job["id"], result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            await run_in_threadpool(self.store.fail, job["id"], str(detail))
+        finally:
+            beat.cancel()
+        self._running.discard(job["id"])
+        remove_quietly(job["path"])
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            await run_in_threadpool(self.store.heartbeat, job_id)
+
@@ -0,0 +1,291 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import smtplib
+import tempfile
+import threading
+from email.message import EmailMessage
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "20"))
+# Close the session after this long without mail; servers drop idle clients anyway.
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+MAIL_QUEUE_MAX = int(os.getenv("MAIL_QUEUE_MAX", "500"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_BACKOFF_SECONDS = float(os.getenv("MAIL_BACKOFF_SECONDS", "2"))
+# Delivery states live here so every uvicorn worker can answer a status poll.
+MAIL_DB = os.getenv("MAIL_DB", os.path.join(tempfile.gettempdir(), "contract_backend_mail.sqlite3"))
+MAIL_RETENTION_SECONDS = float(os.getenv("MAIL_RETENTION_HOURS", "24")) * 3600
+# How long shutdown waits for queued mail to go out.
+MAIL_DRAIN_SECONDS = float(os.getenv("MAIL_DRAIN_SECONDS", "10"))
+
+
+class DeliveryLog:
+    """Delivery states in SQLite, shared by every worker process pointing at the same file,
+    so GET /share-email/{id} answers wherever the message was queued."""
+
+    def __init__(self, path: str = MAIL_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " delivery_id TEXT PRIMARY KEY, recipient TEXT NOT NULL, status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, error TEXT, queued_at REAL NOT NULL, sent_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS deliveries_queued ON deliveries(queued_at)")
+
+    def _exec(self, sql: str, args: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, args)
+
+    def add(self, delivery_id: str, to: str) -> None:
+        self._exec("INSERT INTO deliveries (delivery_id, recipient, status, queued_at) VALUES (?, ?, 'queued', ?)",
+                   (delivery_id, to, time.time()))
+
+    def update(self, delivery_id: str, status: str, attempts: Optional[int] = None, error: Optional[str] = None,
+               sent_at: Optional[float] = None) -> None:
+        self._exec("UPDATE deliveries SET status = ?, attempts = COALESCE(?, attempts), error = ?, sent_at = ?"
+                   " WHERE delivery_id = ?", (status, attempts, error, sent_at, delivery_id))
+
+    def get(self, delivery_id: str) -> Optional[Dict[str, Any]]:
+        row = self._exec("SELECT * FROM deliveries WHERE delivery_id = ?", (delivery_id,)).fetchone()
+        if row is None:
+            return None
+        d = dict(row)
+        d["to"] = d.pop("recipient")
+        return d
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._exec("SELECT status, COUNT(*) FROM deliveries GROUP BY status").fetchall())
+
+    def purge(self, older_than_seconds: float) -> int:
+        cutoff = time.time() - older_than_seconds
+        return self._exec("DELETE FROM deliveries WHERE queued_at < ? AND status IN ('sent', 'failed')",
+                          (cutoff,)).rowcount
+
+
+class Mailer:
+    """Background SMTP delivery over one long-lived, authenticated session.
+
+    `submit()` queues a message and returns a delivery id; a single worker sends in order,
+    reconnecting when the session has dropped. Transient failures (connection errors, 4xx)
+    are retried with jittered exponential backoff; 5xx replies fail the delivery at once.
+    Delivery states go to a DeliveryLog (kept for `retention_seconds`); the messages themselves
+    stay in this process. `stop()` sends what is still queued, for up to `drain_seconds`.
+    """
+
+    def __init__(self, host: str, port: int = 587, user: Optional[str] = None, password: Optional[str] = None,
+                 sender: Optional[str] = None, starttls: bool = SMTP_STARTTLS, timeout: float = SMTP_TIMEOUT,
+                 idle_seconds: float = SMTP_IDLE_SECONDS, max_queue: int = MAIL_QUEUE_MAX,
+                 max_attempts: int = MAIL_MAX_ATTEMPTS, backoff: float = MAIL_BACKOFF_SECONDS,
+                 log: Optional[DeliveryLog] = None, retention_seconds: float = MAIL_RETENTION_SECONDS,
+                 drain_seconds: float = MAIL_DRAIN_SECONDS):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.sender = sender or user
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.log = log or DeliveryLog()
+        self.retention_seconds = retention_seconds
+        self.drain_seconds = drain_seconds
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._retries: Dict[asyncio.TimerHandle, str] = {}
+        self._messages: Dict[str, Tuple[EmailMessage, int]] = {}  # delivery id -> (message, attempts)
+        self._stopping = False
+
+    @classmethod
+    def from_env(cls) -> Optional["Mailer"]:
+        """A Mailer from SMTP_* settings, or None if SMTP isn't configured."""
+        host = os.getenv("SMTP_HOST")
+        user, password = os.getenv("SMTP_USER"), os.getenv("SMTP_PASS")
+        sender = os.getenv("SMTP_FROM") or user
+        if not (host and sender):
+            return None
+        return cls(host, int(os.getenv("SMTP_PORT", "587")), user, password, sender)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop taking mail, send what's queued (retries at once), give up after `drain_seconds`."""
+        if self._task is None:
+            return
+        self._stopping = True
+        for handle, delivery_id in list(self._retries.items()):
+            handle.cancel()
+            self._requeue_now(delivery_id)
+        self._retries.clear()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for delivery_id, (_, attempts) in list(self._messages.items()):
+            await run_in_threadpool(self.log.update, delivery_id, "failed", attempts, "Shut down before delivery")
+        self._messages.clear()
+        await run_in_threadpool(self._close)
+
+    async def submit(self, to: str, subject: str, body: str) -> Optional[str]:
+        """Queue a message; returns its delivery id, or None if the queue is full (or shutting down)."""
+        if self._queue is None:
+            raise RuntimeError("Mailer.start() has not been called")
+        if self._stopping or self._queue.full():
+            return None
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = to
+        msg["Subject"] = subject
+        msg.set_content(body)
+        delivery_id = uuid.uuid4().hex
+        await run_in_threadpool(self.log.add, delivery_id, to)
+        try:
+            self._queue.put_nowait(delivery_id)
+        except asyncio.QueueFull:  # filled up during the write
+            await run_in_threadpool(self.log.update, delivery_id, "failed", 0, "Queue full")
+            return None
+        self._messages[delivery_id] = (msg, 0)
+        return delivery_id
+
+    async def status(self, delivery_id: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self.log.get, delivery_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize() if self._queue else 0, "connected": self._smtp is not None,
+                **self.log.counts()}
+
+    # --- worker -------------------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delivery_id = await asyncio.wait_for(self._queue.get(), timeout=self.idle_seconds)
+            except asyncio.TimeoutError:
+                await run_in_threadpool(self._close)
+                await run_in_threadpool(self.log.purge, self.retention_seconds)
+                continue
+            try:
+                await self._deliver(delivery_id)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, delivery_id: str) -> None:
+        if delivery_id not in self._messages:
+            return
+        msg, attempts = self._messages[delivery_id]
+        attempts += 1
+        self._messages[delivery_id] = (msg, attempts)
+        await run_in_threadpool(self.log.update, delivery_id, "sending", attempts)
+        try:
+            await run_in_threadpool(self._send, msg)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if _is_permanent(e) or attempts >= self.max_attempts:
+                self._messages.pop(delivery_id, None)
+                await run_in_threadpool(self.log.update, delivery_id, "failed", attempts, error)
+            else:
+                await run_in_threadpool(self.log.update, delivery_id, "retrying", attempts, error)
+                self._schedule_retry(delivery_id, attempts)
+            return
+        self._messages.pop(delivery_id, None)
+        await run_in_threadpool(self.log.update, delivery_id, "sent", attempts, None, time.time())
+
+    def _schedule_retry(self, delivery_id: str, attempt: int) -> None:
+        if self._stopping:
+            self._requeue_now(delivery_id)  # draining: no time to back off
+            return
+        delay = self.backoff * 2 ** (attempt - 1)
+        delay = random.uniform(delay / 2, delay)  # jitter so a burst doesn't retry in lockstep
+        loop = asyncio.get_running_loop()
+
+        def requeue():
+            self._retries.pop(handle, None)
+            try:
+                self._queue.put_nowait(delivery_id)
+            except asyncio.QueueFull:
+                self._schedule_retry(delivery_id, attempt)
+
+        handle = loop.call_later(delay, requeue)
+        self._retries[handle] = delivery_id
+
+    def _requeue_now(self, delivery_id: str) -> None:
+        try:
+            self._queue.put_nowait(delivery_id)
+        except asyncio.QueueFull:
+            pass  # still in _messages: stop() marks it failed
+
+    # --- SMTP session (runs in the threadpool, only ever from the worker) ----
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.user and self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _close(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+    def _send(self, msg: EmailMessage) -> None:
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(msg)
+            return
+        except smtplib.SMTPServerDisconnected:
+            pass  # stale session (server timed us out): reconnect once and resend
+        except smtplib.SMTPException as e:
+            if getattr(e, "smtp_code", None) == 421:  # server is closing the connection
+                self._close()
+            raise
+        except OSError:
+            pass  # socket reset
+        self._close()
+        self._smtp = self._connect()
+        self._smtp.send_message(msg)
+
+
+def _is_permanent(e: Exception) -> bool:
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return True
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
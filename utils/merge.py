@@ -0,0 +1,164 @@
+import re
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.route import SECTIONS
+
+# Fields naming an organisation: "Westpac Banking Corporation" and "WESTPAC BANKING CORP LTD"
+# are one entry. Not owner_names: "John Smith" and "John Smith Pty Ltd" are different owners.
+ENTITY_FIELDS = {"mortgagees", "insurer", "council"}
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+# Only a leading "the" and trailing corporate suffixes/registration numbers; words inside the
+# name ("Bank of Melbourne", "Australia and New Zealand Banking Group") are kept.
+_ENTITY_PREFIX_RE = re.compile(r"^the\s+")
+_ENTITY_SUFFIX_RE = re.compile(
+    r"(?:\s+(?:pty|ltd|limited|proprietary|inc|incorporated|co|company|corp|corporation|"
+    r"(?:abn|acn)(?:\s+\d+)+))+$"
+)
+
+
+@lru_cache(maxsize=65536)
+def normalize(value: str) -> str:
+    return " ".join(_PUNCT_RE.sub(" ", value.casefold()).split())
+
+
+@lru_cache(maxsize=65536)
+def entity_key(value: str) -> str:
+    base = normalize(value)
+    return _ENTITY_SUFFIX_RE.sub("", _ENTITY_PREFIX_RE.sub("", base)) or base
+
+
+def _key(field: str, value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        return json.dumps(value, sort_keys=True)
+    key = entity_key(value) if field in ENTITY_FIELDS else normalize(value)
+    return key or None
+
+
+class _Votes:
+    """Normalised key -> evidence count, plus each spelling seen for it."""
+
+    __slots__ = ("counts", "spellings", "values")
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.spellings: Dict[str, Dict[Any, int]] = {}
+        self.values: Dict[Any, Any] = {}  # hashable spelling -> original value (dicts/lists)
+
+    def add(self, key: str, value: Any) -> None:
+        self.counts[key] = self.counts.get(key, 0) + 1
+        sp = self.spellings.setdefault(key, {})
+        if isinstance(value, (str, int, float)):
+            hv = value
+        else:
+            hv = ("json", json.dumps(value, sort_keys=True))
+            self.values.setdefault(hv, value)
+        sp[hv] = sp.get(hv, 0) + 1
+
+    def display(self, key: str) -> Any:
+        # Most-seen spelling; ties go to the more informative (longer, not shouted) one, then
+        # lexical order, so the result never depends on the order chunks finished in.
+        best = max(self.spellings[key].items(), key=lambda kv: (kv[1], _informative(kv[0]), str(kv[0])))[0]
+        return self.values.get(best, best) if isinstance(best, tuple) else best
+
+    def ranked(self) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda kv: (-kv[1], -_informative(self.display(kv[0])), kv[0]))
+
+
+def _informative(value: Any) -> int:
+    if not isinstance(value, str):
+        return 0
+    return len(value) * 2 + (0 if value.isupper() else 1)
+
+
+class _Section:
+    __slots__ = ("page_refs", "flags", "lists", "scalars")
+
+    def __init__(self):
+        self.page_refs: set = set()
+        self.flags: Dict[str, bool] = {}
+        self.lists: Dict[str, _Votes] = {}
+        self.scalars: Dict[str, _Votes] = {}
+
+
+class MergeAccumulator:
+    """Order-independent fold of per-chunk extraction results.
+
+    `add()` costs O(size of the result): page_refs go into sets, list entries and scalar
+    candidates into dicts keyed by their normalised form. `snapshot()` renders the merged
+    summary at any point (e.g. for streaming):
+      - page_refs: union, sorted;
+      - booleans: OR (any chunk that saw the document wins);
+      - lists: deduplicated on the normalised key, shown in their most common spelling;
+      - scalars: the value most chunks agree on; disagreements are noted in missing_or_unclear.
+    """
+
+    def __init__(self, sections: List[str] = SECTIONS):
+        self.sections = list(sections)
+        self._sections: Dict[str, _Section] = {}
+        self._missing = _Votes()
+        self.count = 0
+
+    def add(self, result: Dict[str, Any]) -> None:
+        self.count += 1
+        for name, val in result.items():
+            if name in self.sections and isinstance(val, dict):
+                self._add_section(self._sections.setdefault(name, _Section()), val)
+            elif name == "missing_or_unclear" and isinstance(val, list):
+                for item in val:
+                    key = _key(name, item)
+                    if key:
+                        self._missing.add(key, item)
+
+    def _add_section(self, sect: _Section, val: Dict[str, Any]) -> None:
+        for field, v in val.items():
+            if field == "page_refs":
+                if isinstance(v, list):
+                    sect.page_refs.update(n for n in v if isinstance(n, int) and not isinstance(n, bool))
+            elif isinstance(v, bool):
+                sect.flags[field] = sect.flags.get(field, False) or v
+            elif isinstance(v, list):
+                votes = sect.lists.setdefault(field, _Votes())
+                for item in v:
+                    key = _key(field, item)
+                    if key:
+                        votes.add(key, item)
+            else:
+                key = _key(field, v)
+                if key:
+                    sect.scalars.setdefault(field, _Votes()).add(key, v)
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        notes: List[str] = []
+        for name in self.sections:
+            sect = self._sections.get(name)
+            cur: Dict[str, Any] = {}
+            if sect is not None:
+                for field, votes in sect.scalars.items():
+                    ranked = votes.ranked()
+                    cur[field] = votes.display(ranked[0][0])
+                    if len(ranked) > 1:
+                        alts = ", ".join(f"{votes.display(k)!r} x{n}" for k, n in ranked)
+                        notes.append(f"{name}.{field}: conflicting values across the document ({alts})")
+                for field, votes in sect.lists.items():
+                    cur[field] = sorted((votes.display(k) for k in votes.counts), key=lambda x: (normalize(str(x)), str(x)))
+                cur.update(sect.flags)
+                cur["page_refs"] = sorted(sect.page_refs)
+            cur.setdefault("supporting_doc_present", False)
+            cur.setdefault("page_refs", [])
+            out[name] = cur
+        missing = sorted((self._missing.display(k) for k in self._missing.counts), key=lambda x: (normalize(str(x)), str(x)))
+        out["missing_or_unclear"] = missing + sorted(notes)
+        return out
+
+
+def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    acc = MergeAccumulator()
+    for r in results:
+        acc.add(r)
+    return acc.snapshot()
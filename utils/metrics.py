@@ -0,0 +1,188 @@
+import os
+import time
+import random
+import tempfile
+import cProfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from utils import usage as usage_meter
+
+# Prometheus export is optional; without prometheus_client every metric is a no-op
+# (Server-Timing headers still work).
+try:
+    from prometheus_client import Counter, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, REGISTRY  # type: ignore
+    _HAS_PROMETHEUS = True
+except Exception:
+    _HAS_PROMETHEUS = False
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "contract_backend_profiles"))
+
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Noop:
+    def labels(self, *args: Any, **kwargs: Any) -> "_Noop":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+
+def _counter(name: str, doc: str, labels: Tuple[str, ...]) -> Any:
+    return Counter(name, doc, labels) if _HAS_PROMETHEUS else _Noop()
+
+
+def _histogram(name: str, doc: str, labels: Tuple[str, ...]) -> Any:
+    return Histogram(name, doc, labels, buckets=_SECONDS_BUCKETS) if _HAS_PROMETHEUS else _Noop()
+
+
+STAGE_SECONDS = _histogram("contract_stage_seconds", "Wall time per pipeline stage", ("stage",))
+DOCUMENTS = _counter("contract_documents_total", "Documents analysed", ("outcome",))
+PAGES = _counter("contract_pages_total", "Pages extracted", ())
+OCR_PAGES = _counter("contract_ocr_pages_total", "Pages sent to OCR", ("engine", "outcome"))
+VISION_IMAGE_BYTES = _counter("contract_vision_image_bytes_total", "Encoded page-image bytes sent to the vision model", ())
+DEDUPED_PAGES = _counter("contract_dedup_pages_total", "Pages not sent to the model by the dedup stage", ("reason",))
+RULE_FIELDS = _counter("contract_rule_fields_total", "Fields matched by the rule layer", ("outcome",))
+CHUNKS = _counter("contract_chunks_total", "Chunks by outcome", ("outcome",))
+MODEL_SECONDS = _histogram("contract_model_call_seconds", "Chat completion latency", ("purpose",))
+MODEL_CALLS = _counter("contract_model_calls_total", "Chat completions by outcome", ("purpose", "outcome"))
+MODEL_TOKENS = _counter("contract_model_tokens_total", "Tokens reported by the API", ("purpose", "kind"))
+MODEL_RETRIES = _counter("contract_model_retries_total", "Chat completion retries", ("purpose", "reason"))
+
+# Stage durations for the current HTTP request (set by ServerTimingMiddleware). A plain
+# dict shared by reference, so threadpool work and gathered tasks add to the same one.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+class StageTimer:
+    """Wall-clock seconds per pipeline stage, reported as `timings` in the /upload response
+    and recorded to the stage histogram / Server-Timing."""
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        record_stage(stage, now - self.last)
+        self.stages[stage] = round(self.stages.get(stage, 0.0) + now - self.last, 4)
+        self.last = now
+
+    def report(self) -> Dict[str, float]:
+        return {**self.stages, "total": round(time.perf_counter() - self.start, 4)}
+
+
+class model_call:
+    """Times one chat completion; call `.usage(resp.usage)` inside the block to count tokens
+    (in the metrics and in the request's utils.usage meter).
+
+        with model_call("chunk", MODEL) as m:
+            resp = await aclient.chat.completions.create(...)
+            m.usage(resp.usage)
+    """
+
+    def __init__(self, purpose: str, model: str = "unknown"):
+        self.purpose = purpose
+        self.model = model
+
+    def __enter__(self) -> "model_call":
+        self.t0 = time.perf_counter()
+        return self
+
+    def usage(self, usage: Any) -> None:
+        usage_meter.record(self.model, self.purpose, usage)
+        if usage is not None:
+            MODEL_TOKENS.labels(self.purpose, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+            MODEL_TOKENS.labels(self.purpose, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        MODEL_SECONDS.labels(self.purpose).observe(time.perf_counter() - self.t0)
+        MODEL_CALLS.labels(self.purpose, "error" if exc_type else "ok").inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus text exposition (merged across workers when PROMETHEUS_MULTIPROC_DIR is set)."""
+    if not _HAS_PROMETHEUS:
+        raise RuntimeError("prometheus_client is not installed")
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # type: ignore
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+_profiling = threading.Lock()  # cProfile allows one active profiler at a time
+
+
+class ServerTimingMiddleware:
+    """Adds a `Server-Timing` header with the stage durations recorded during the request.
+
+    With `profile_rate` > 0 that fraction of requests is run under cProfile (one at a time)
+    and dumped to `profile_dir`. The profiler only sees the event-loop thread, and other
+    requests interleaved on the loop show up in it too.
+    """
+
+    def __init__(self, app, profile_rate: float = PROFILE_SAMPLE_RATE, profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.profile_rate = profile_rate
+        self.profile_dir = profile_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        t0 = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                parts = [f"{name};dur={secs * 1000:.1f}" for name, secs in timings.items()]
+                parts.append(f"app;dur={(time.perf_counter() - t0) * 1000:.1f}")
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"server-timing", ", ".join(parts).encode("latin-1"))]}
+            await send(message)
+
+        profiler = None
+        if self.profile_rate > 0 and random.random() < self.profile_rate and _profiling.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _profiling.release()
+                self._dump(profiler, scope)
+
+    def _dump(self, profiler: cProfile.Profile, scope) -> None:
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = scope.get("path", "").strip("/").replace("/", "_") or "root"
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}.prof"))
+        except OSError:
+            pass
@@ -0,0 +1,289 @@
+import os
+import re
+import base64
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from typing import List, Dict, Any, Awaitable, Callable, Deque, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from utils.ingest import open_pdf
+from utils.metrics import stage, OCR_PAGES, VISION_IMAGE_BYTES
+
+try:
+    import pytesseract  # type: ignore
+    from PIL import Image  # type: ignore
+    pytesseract.get_tesseract_version()  # the wrapper is no use without the binary
+    _HAS_TESSERACT = True
+except Exception:
+    _HAS_TESSERACT = False
+
+# Pages are first OCR'd at OCR_DPI_LOW; only pages whose mean word confidence
+# falls below OCR_MIN_CONFIDENCE are re-rendered and re-run at OCR_DPI_HIGH.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_DPI_LOW = int(os.getenv("OCR_DPI_LOW", "150"))
+OCR_DPI_HIGH = int(os.getenv("OCR_DPI_HIGH", "300"))
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "70"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Pages rendered and queued on the pool at once; bounds the page images held in memory.
+OCR_IN_FLIGHT = int(os.getenv("OCR_IN_FLIGHT", str(2 * OCR_WORKERS)))
+
+# Vision-model fallback when Tesseract isn't installed. Pages are rendered grayscale at the
+# resolution the model actually uses (high-detail images are scaled so the short side is
+# 768 px), JPEG-encoded, and sent VISION_PAGES_PER_REQUEST to a request.
+VISION_MODEL = os.getenv("OPENAI_VISION_MODEL", "gpt-4o-mini")
+VISION_SHORT_SIDE = int(os.getenv("VISION_SHORT_SIDE", "768"))
+VISION_DPI_MIN = int(os.getenv("VISION_DPI_MIN", "72"))
+VISION_DPI_MAX = int(os.getenv("VISION_DPI_MAX", "200"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "70"))
+VISION_PAGES_PER_REQUEST = int(os.getenv("VISION_PAGES_PER_REQUEST", "4"))
+VISION_PROMPT_VERSION = "v1"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+def _submit(*args: Any) -> Future:
+    """Queue one page on the pool; a pool broken by a dead worker is replaced (once)."""
+    try:
+        pool = _get_pool()
+        fut = pool.submit(_ocr_samples, *args)
+    except BrokenProcessPool:
+        shutdown_pool(wait=False)
+        pool = _get_pool()
+        fut = pool.submit(_ocr_samples, *args)
+    fut.pool = pool  # type: ignore[attr-defined]
+    return fut
+
+
+def _result(fut: Future, args: Tuple[Any, ...]) -> Tuple[str, float]:
+    try:
+        return fut.result()
+    except BrokenProcessPool:
+        # Every pending future of a broken pool fails with it: replace the pool (unless an
+        # earlier page already did) and run this page once more.
+        if getattr(fut, "pool", None) is _pool:
+            shutdown_pool(wait=False)
+        return _submit(*args).result()
+
+
+def _ocr_samples(samples: bytes, width: int, height: int, stride: int) -> Tuple[str, float]:
+    """Worker: run Tesseract on raw 8-bit grayscale samples. Returns (text, mean word confidence)."""
+    try:
+        return _tesseract(samples, width, height, stride)
+    except Exception as e:
+        # Some pytesseract errors can't be unpickled in the parent, which breaks the pool.
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+def _tesseract(samples: bytes, width: int, height: int, stride: int) -> Tuple[str, float]:
+    img = Image.frombytes("L", (width, height), samples, "raw", "L", stride)
+    data = pytesseract.image_to_data(img, lang=OCR_LANG, output_type=pytesseract.Output.DICT)
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confs: List[float] = []
+    for word, conf, block, par, line in zip(
+        data["text"], data["conf"], data["block_num"], data["par_num"], data["line_num"]
+    ):
+        if not word.strip():
+            continue
+        lines.setdefault((block, par, line), []).append(word)
+        if float(conf) >= 0:
+            confs.append(float(conf))
+    out, prev = [], None
+    for key in sorted(lines):
+        if prev is not None and key[:2] != prev[:2]:
+            out.append("")  # blank line between paragraphs
+        out.append(" ".join(lines[key]))
+        prev = key
+    return "\n".join(out), (sum(confs) / len(confs) if confs else 0.0)
+
+
+def _render(page: "fitz.Page", dpi: int) -> Tuple[bytes, int, int, int]:
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return bytes(pix.samples), pix.width, pix.height, pix.stride
+
+
+def ocr_pages(path: str, page_numbers: List[int], cache: Any = None) -> Dict[int, str]:
+    """OCR the given 1-based pages of a PDF. `cache` is any get/set store (utils.cache.SqliteCache)."""
+    if not page_numbers or not _HAS_TESSERACT:
+        return {}
+    with stage("ocr"):
+        return _ocr_pages(path, page_numbers, cache)
+
+
+def _ocr_pages(path: str, page_numbers: List[int], cache: Any) -> Dict[int, str]:
+    # Each page is rendered just before it's queued and its samples are dropped once its
+    # result is in, so at most OCR_IN_FLIGHT pages' pixels are held at a time (a 150-DPI
+    # grayscale A4 page is ~2.2 MB; a 300-DPI retry ~8.7 MB).
+    out: Dict[int, str] = {}
+    todo: Deque[Tuple[int, Optional[Tuple[str, str, float]]]] = deque((n, None) for n in page_numbers)
+    inflight: Deque[Tuple[int, str, Optional[Tuple[str, str, float]], Tuple[Any, ...], Future]] = deque()
+    with open_pdf(path) as doc:
+        while todo or inflight:
+            while todo and len(inflight) < OCR_IN_FLIGHT:
+                # `low` is None for a first pass, else (key, text, conf) of the low-DPI pass.
+                n, low = todo.popleft()
+                args = _render(doc[n - 1], OCR_DPI_LOW if low is None else OCR_DPI_HIGH)
+                if low is None:
+                    samples, w, h, _ = args
+                    key = hashlib.sha256(samples).hexdigest() + f":{w}x{h}:{OCR_LANG}:{OCR_DPI_HIGH}:{OCR_MIN_CONFIDENCE}"
+                    hit = cache.get(key) if cache is not None else None
+                    if hit is not None:
+                        out[n] = hit["text"]
+                        OCR_PAGES.labels("tesseract", "cached").inc()
+                        continue
+                else:
+                    key = low[0]
+                try:
+                    inflight.append((n, key, low, args, _submit(*args)))
+                except BrokenProcessPool:
+                    out[n] = low[1] if low is not None else ""  # keep the low-DPI pass if there was one
+                    OCR_PAGES.labels("tesseract", "failed").inc()
+                del args
+            if not inflight:
+                continue
+            n, key, low, args, fut = inflight.popleft()
+            try:
+                text, conf = _result(fut, args)
+            except Exception:
+                text, conf = "", -1.0
+            del args, fut
+            if low is None:
+                if conf < 0:
+                    out[n] = ""  # not cached: a broken tesseract install shouldn't pin empty pages
+                    OCR_PAGES.labels("tesseract", "failed").inc()
+                elif conf < OCR_MIN_CONFIDENCE and OCR_DPI_HIGH > OCR_DPI_LOW:
+                    todo.appendleft((n, (key, text, conf)))
+                else:
+                    out[n] = text
+                    OCR_PAGES.labels("tesseract", "computed").inc()
+                    if cache is not None:
+                        cache.set(key, {"text": text, "conf": conf, "dpi": OCR_DPI_LOW})
+                continue
+            dpi = OCR_DPI_HIGH
+            if conf < low[2]:
+                text, conf, dpi = low[1], low[2], OCR_DPI_LOW
+            out[n] = text
+            OCR_PAGES.labels("tesseract", "computed").inc()
+            if cache is not None:
+                cache.set(key, {"text": text, "conf": conf, "dpi": dpi})
+    return out
+
+
+# --- vision fallback ---------------------------------------------------------
+
+def vision_dpi(page: "fitz.Page") -> int:
+    """DPI that renders the page's short side at VISION_SHORT_SIDE px (clamped)."""
+    short_in = min(page.rect.width, page.rect.height) / 72.0
+    dpi = round(VISION_SHORT_SIDE / short_in) if short_in > 0 else VISION_DPI_MAX
+    return max(VISION_DPI_MIN, min(VISION_DPI_MAX, dpi))
+
+
+def render_vision_jpeg(page: "fitz.Page") -> bytes:
+    pix = page.get_pixmap(dpi=vision_dpi(page), colorspace=fitz.csGRAY, alpha=False)
+    return pix.tobytes("jpeg", jpg_quality=VISION_JPEG_QUALITY)
+
+
+def vision_messages(images: List[Tuple[int, bytes]]) -> List[Dict[str, Any]]:
+    """One user message carrying several page images, each introduced by its page number."""
+    numbers = ", ".join(str(n) for n, _ in images)
+    content: List[Dict[str, Any]] = [{"type": "text", "text": (
+        f"Transcribe all readable text on each of the following scanned pages ({numbers}). "
+        "For each page, in order, output a line `=== PAGE <number> ===` followed by that page's "
+        "text. Plain text only; no commentary. Output the marker even for a page with no text."
+    )}]
+    for n, jpeg in images:
+        content.append({"type": "text", "text": f"Page {n}:"})
+        content.append({"type": "image_url", "image_url": {
+            "url": "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii"), "detail": "high"}})
+    return [{"role": "user", "content": content}]
+
+
+_PAGE_MARKER_RE = re.compile(r"^[\s`*#]*=+\s*PAGE\s+(\d+)\s*=+[\s`*]*$", re.MULTILINE | re.IGNORECASE)
+
+
+def parse_vision_output(text: str, page_numbers: List[int]) -> Dict[int, str]:
+    """Split a batched reply on its page markers. Pages without a marker are left out."""
+    wanted = set(page_numbers)
+    marks = list(_PAGE_MARKER_RE.finditer(text or ""))
+    out: Dict[int, str] = {}
+    for i, m in enumerate(marks):
+        n = int(m.group(1))
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        if n in wanted:
+            out[n] = text[m.end():end].strip()
+    if not marks and len(page_numbers) == 1 and (text or "").strip():
+        out[page_numbers[0]] = text.strip()  # single page, model skipped the marker
+    return out
+
+
+def _vision_key(jpeg: bytes, model: str) -> str:
+    return f"vision:{hashlib.sha256(jpeg).hexdigest()}:{model}:{VISION_PROMPT_VERSION}"
+
+
+def _prepare_vision(path: str, page_numbers: List[int], cache: Any, model: str) -> Tuple[Dict[int, str], List[Tuple[int, bytes, str]]]:
+    """(cached text by page, [(page, jpeg, cache key)] still to transcribe)."""
+    done: Dict[int, str] = {}
+    todo: List[Tuple[int, bytes, str]] = []
+    with open_pdf(path) as doc:
+        for n in page_numbers:
+            jpeg = render_vision_jpeg(doc[n - 1])
+            key = _vision_key(jpeg, model)
+            hit = cache.get(key) if cache is not None else None
+            if hit is not None:
+                done[n] = hit["text"]
+                OCR_PAGES.labels("vision", "cached").inc()
+            else:
+                todo.append((n, jpeg, key))
+    return done, todo
+
+
+async def vision_ocr_pages(path: str, page_numbers: List[int],
+                           complete: Callable[[List[Dict[str, Any]]], Awaitable[str]],
+                           cache: Any = None, model: str = VISION_MODEL,
+                           per_request: int = VISION_PAGES_PER_REQUEST) -> Dict[int, str]:
+    """Transcribe 1-based PDF pages with a vision model. `complete(messages)` makes the chat
+    call and returns the reply text (the caller owns concurrency, retries and metering);
+    batches are sent concurrently. Pages whose batch failed come back as ""."""
+    if not page_numbers:
+        return {}
+    with stage("vision"):
+        out, todo = await asyncio.to_thread(_prepare_vision, path, page_numbers, cache, model)
+        per_request = max(1, per_request)
+        batches = [todo[i:i + per_request] for i in range(0, len(todo), per_request)]
+
+        async def run(batch: List[Tuple[int, bytes, str]]) -> None:
+            numbers = [n for n, _, _ in batch]
+            VISION_IMAGE_BYTES.inc(sum(len(j) for _, j, _ in batch))
+            try:
+                text = await complete(vision_messages([(n, j) for n, j, _ in batch]))
+            except Exception as e:
+                print(f"VISION: pages {numbers} failed: {e}")
+                OCR_PAGES.labels("vision", "failed").inc(len(batch))
+                return
+            parsed = parse_vision_output(text, numbers)
+            for n, _, key in batch:
+                out[n] = parsed.get(n, "")
+                OCR_PAGES.labels("vision", "computed" if n in parsed else "failed").inc()
+                if n in parsed and cache is not None:
+                    await asyncio.to_thread(cache.set, key, {"text": parsed[n], "model": model})
+
+        await asyncio.gather(*(run(b) for b in batches))
+    return out
@@ -0,0 +1,392 @@
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import tempfile
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import openai
+
+from utils import metrics
+
+# Account limits for the shared buckets (0 disables that bucket). Rate-limit headers on
+# responses override them once seen.
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+# Buckets live in a SQLite file so every uvicorn worker on the host draws from the same budget.
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "contract_backend_ratelimit.sqlite3"))
+RATE_MAX_RETRIES = int(os.getenv("RATE_MAX_RETRIES", "5"))
+RATE_BACKOFF_BASE = float(os.getenv("RATE_BACKOFF_BASE", "0.5"))
+RATE_BACKOFF_MAX = float(os.getenv("RATE_BACKOFF_MAX", "30"))
+# Consecutive transport/5xx failures that open the breaker, and how long it stays open
+# (shared by the workers through RATE_LIMIT_DB, like the buckets).
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+# Completion tokens reserved per call when the request doesn't set max_tokens.
+RATE_COMPLETION_ESTIMATE = int(os.getenv("RATE_COMPLETION_ESTIMATE", "500"))
+
+_RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+
+class CircuitOpen(Exception):
+    """The model API has been failing; calls fail fast until `retry_after` seconds pass."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("model API unavailable (circuit open)")
+        self.retry_after = retry_after
+
+
+def _duration(value: Optional[str]) -> Optional[float]:
+    """'1s', '6m0s', '20ms', '0.5' -> seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(n) * scale[u] for n, u in parts)
+
+
+class SharedBuckets:
+    """Token buckets for requests and tokens per minute, kept in a SQLite table.
+
+    `reserve()` takes the cost up front and returns how long to wait before sending; the
+    level may go negative, which queues later callers behind earlier ones (across
+    processes too) without polling.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB, rpm: int = OPENAI_RPM, tpm: int = OPENAI_TPM):
+        self.limits = {"requests": rpm, "tokens": tpm}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " name TEXT PRIMARY KEY, level REAL NOT NULL, capacity REAL NOT NULL,"
+            " updated REAL NOT NULL, blocked_until REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _txn(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(time.time())
+                self._conn.execute("COMMIT")
+                return out
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _row(self, name: str, now: float) -> Tuple[float, float, float]:
+        """(level after refill, capacity, blocked_until) for a bucket, creating it if needed."""
+        row = self._conn.execute(
+            "SELECT level, capacity, updated, blocked_until FROM rate_buckets WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            cap = float(self.limits[name])
+            self._conn.execute("INSERT INTO rate_buckets (name, level, capacity, updated) VALUES (?, ?, ?, ?)",
+                               (name, cap, cap, now))
+            return cap, cap, 0.0
+        level, cap, updated, blocked = row
+        return min(cap, level + (now - updated) * cap / 60.0), cap, blocked
+
+    def _active(self):
+        return [n for n, lim in self.limits.items() if lim > 0]
+
+    def reserve(self, tokens: int) -> float:
+        cost = {"requests": 1, "tokens": tokens}
+
+        def fn(now):
+            wait = 0.0
+            for name in self._active():
+                level, cap, blocked = self._row(name, now)
+                level -= cost[name]
+                self._conn.execute("UPDATE rate_buckets SET level = ?, updated = ? WHERE name = ?", (level, now, name))
+                wait = max(wait, blocked - now, -level / (cap / 60.0) if level < 0 else 0.0)
+            return wait
+
+        return self._txn(fn) if self._active() else 0.0
+
+    def adjust(self, name: str, delta: float) -> None:
+        """Return (+) or charge (-) the difference once actual usage is known."""
+        if not self.limits.get(name):
+            return
+
+        def fn(now):
+            level, cap, _ = self._row(name, now)
+            self._conn.execute("UPDATE rate_buckets SET level = ?, updated = ? WHERE name = ?",
+                               (min(cap, level + delta), now, name))
+
+        self._txn(fn)
+
+    def observe(self, headers: Any) -> None:
+        """Adopt the account limits the API reports, and never think we have more left than it says."""
+        updates = {}
+        for name in self._active():
+            limit = headers.get(f"x-ratelimit-limit-{name}")
+            remaining = headers.get(f"x-ratelimit-remaining-{name}")
+            if limit or remaining:
+                updates[name] = (float(limit) if limit else None, float(remaining) if remaining else None)
+        if not updates:
+            return
+
+        def fn(now):
+            for name, (limit, remaining) in updates.items():
+                level, cap, _ = self._row(name, now)
+                if limit:
+                    cap = limit
+                if remaining is not None:
+                    level = min(level, remaining)
+                self._conn.execute("UPDATE rate_buckets SET level = ?, capacity = ?, updated = ? WHERE name = ?",
+                                   (min(level, cap), cap, now, name))
+
+        self._txn(fn)
+
+    def block(self, seconds: float) -> None:
+        """After a 429: hold every process back for `seconds`."""
+        def fn(now):
+            for name in self._active():
+                self._row(name, now)
+                self._conn.execute("UPDATE rate_buckets SET blocked_until = MAX(blocked_until, ?) WHERE name = ?",
+                                   (now + seconds, name))
+
+        if self._active():
+            self._txn(fn)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` one trial call is let
+    through (half-open) and its outcome closes or re-opens it.
+
+    The state is a row in the same SQLite file as the buckets, so the workers on a host trip
+    and recover together instead of each hammering a failing API until it learns.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 path: str = RATE_LIMIT_DB, name: str = "openai"):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.name = name
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS circuit_breakers ("
+            " name TEXT PRIMARY KEY, failures INTEGER NOT NULL DEFAULT 0, opened_at REAL, trial_at REAL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO circuit_breakers (name) VALUES (?)", (name,))
+
+    def _txn(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT failures, opened_at, trial_at FROM circuit_breakers WHERE name = ?",
+                                         (self.name,)).fetchone()
+                out = fn(time.time(), *row)
+                self._conn.execute("COMMIT")
+                return out
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _set(self, failures: int, opened_at: Optional[float], trial_at: Optional[float]) -> None:
+        self._conn.execute("UPDATE circuit_breakers SET failures = ?, opened_at = ?, trial_at = ? WHERE name = ?",
+                           (failures, opened_at, trial_at, self.name))
+
+    def _read(self) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            return self._conn.execute("SELECT failures, opened_at FROM circuit_breakers WHERE name = ?",
+                                      (self.name,)).fetchone()
+
+    def check(self) -> None:
+        if self._read()[1] is None:
+            return  # closed: no write on the hot path
+
+        def fn(now, failures, opened_at, trial_at):
+            if opened_at is None:
+                return
+            remaining = opened_at + self.cooldown - now
+            # A trial that never reported back (cancelled) stops blocking after one cooldown.
+            if remaining > 0 or (trial_at is not None and now - trial_at < self.cooldown):
+                raise CircuitOpen(max(remaining, 1.0))
+            self._set(failures, opened_at, now)
+
+        self._txn(fn)
+
+    def success(self) -> None:
+        if self._read() == (0, None):
+            return
+
+        def fn(now, failures, opened_at, trial_at):
+            if opened_at is not None:
+                print("RATELIMIT: circuit closed")
+            self._set(0, None, None)
+
+        self._txn(fn)
+
+    def failure(self) -> None:
+        def fn(now, failures, opened_at, trial_at):
+            failures += 1
+            if trial_at is not None or (self.threshold and failures >= self.threshold):
+                if opened_at is None:
+                    print(f"RATELIMIT: circuit opened after {failures} consecutive failures")
+                opened_at, trial_at = now, None
+            self._set(failures, opened_at, trial_at)
+
+        self._txn(fn)
+
+    @property
+    def failures(self) -> int:
+        return self._read()[0]
+
+    @property
+    def state(self) -> str:
+        opened_at = self._read()[1]
+        if opened_at is None:
+            return "closed"
+        return "half_open" if time.time() >= opened_at + self.cooldown else "open"
+
+
+# A high-detail page image is billed as 85 + 170 per 512px tile; a 768x1086 page is 6 tiles.
+IMAGE_TOKEN_ESTIMATE = int(os.getenv("RATE_IMAGE_TOKEN_ESTIMATE", "1105"))
+_DATA_URL_RE = re.compile(r"data:image/[a-z]+;base64,[A-Za-z0-9+/=]+")
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    # ~4 characters per token over the serialised messages; inline images are counted per
+    # image, not by their base64 length. The difference is settled when usage comes back.
+    text, images = _DATA_URL_RE.subn("", json.dumps(kwargs.get("messages", [])))
+    return len(text) // 4 + images * IMAGE_TOKEN_ESTIMATE + int(kwargs.get("max_tokens") or RATE_COMPLETION_ESTIMATE)
+
+
+class ModelGate:
+    """Every chat completion goes through here: shared RPM/TPM buckets, retries with
+    jittered exponential backoff (honouring Retry-After), and a circuit breaker.
+
+        resp = await gate.acreate(aclient, "chunk", model=MODEL, messages=[...])
+        resp = gate.create(client, "vision", model=..., messages=[...])   # threads
+
+    Clients should be built with max_retries=0 so the SDK doesn't retry underneath.
+    """
+
+    def __init__(self, buckets: Optional[SharedBuckets] = None, breaker: Optional[CircuitBreaker] = None,
+                 max_retries: int = RATE_MAX_RETRIES, backoff_base: float = RATE_BACKOFF_BASE,
+                 backoff_max: float = RATE_BACKOFF_MAX):
+        self.buckets = buckets
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ModelGate":
+        return cls(SharedBuckets() if OPENAI_RPM or OPENAI_TPM else None)
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))  # full jitter
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        hinted = _duration(headers.get("retry-after-ms"))
+        hinted = hinted / 1000 if hinted is not None else _duration(headers.get("retry-after"))
+        if hinted is not None:
+            delay = max(delay, min(hinted, self.backoff_max))
+        return delay
+
+    def _before(self, est: int) -> float:
+        self.breaker.check()
+        wait = self.buckets.reserve(est) if self.buckets else 0.0
+        if wait > 0:
+            self.throttled_seconds += wait
+        return wait
+
+    def _after_ok(self, raw: Any, est: int) -> Any:
+        self.breaker.success()
+        resp = raw.parse()
+        if self.buckets:
+            self.buckets.observe(raw.headers)
+            used = getattr(resp.usage, "total_tokens", None) if resp.usage is not None else None
+            if used is not None:
+                self.buckets.adjust("tokens", est - used)
+        return resp
+
+    def _after_error(self, purpose: str, attempt: int, exc: Exception, est: int) -> float:
+        """Seconds to wait before retrying; re-raises when the error isn't worth retrying."""
+        if self.buckets:
+            self.buckets.adjust("tokens", est)  # nothing was processed
+        if not isinstance(exc, _RETRYABLE):
+            if isinstance(exc, openai.APIStatusError):
+                self.breaker.success()  # a 4xx means the API is up; the request is at fault
+            raise exc
+        if attempt >= self.max_retries:
+            if not isinstance(exc, openai.RateLimitError):
+                self.breaker.failure()
+            raise exc
+        delay = self._backoff(attempt, exc)
+        if isinstance(exc, openai.RateLimitError):
+            # Throttled, not down: slow every worker down instead of tripping the breaker.
+            if self.buckets:
+                self.buckets.block(delay)
+            reason = "rate_limited"
+        else:
+            self.breaker.failure()
+            reason = "server_error" if isinstance(exc, openai.InternalServerError) else "connection"
+        metrics.MODEL_RETRIES.labels(purpose, reason).inc()
+        self.retries += 1
+        return delay
+
+    async def acreate(self, client: Any, purpose: str, **kwargs: Any) -> Any:
+        est = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            wait = await asyncio.to_thread(self._before, est)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                raw = await client.chat.completions.with_raw_response.create(**kwargs)
+            except asyncio.CancelledError:
+                if self.buckets:
+                    await asyncio.to_thread(self.buckets.adjust, "tokens", est)
+                raise
+            except Exception as e:
+                # adjust/block are SQLite writes: keep them off the event loop.
+                delay = await asyncio.to_thread(self._after_error, purpose, attempt, e, est)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            return await asyncio.to_thread(self._after_ok, raw, est)
+
+    def create(self, client: Any, purpose: str, **kwargs: Any) -> Any:
+        est = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            wait = self._before(est)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                raw = client.chat.completions.with_raw_response.create(**kwargs)
+            except Exception as e:
+                delay = self._after_error(purpose, attempt, e, est)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            return self._after_ok(raw, est)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retries": self.retries,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "limits": dict(self.buckets.limits) if self.buckets else None,
+        }
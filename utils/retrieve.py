@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import math
+import heapq
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+DEFAULT_DOC_STORE_DIR = os.path.join(tempfile.gettempdir(), "contract_backend_docs")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have if in into is it its of on or that the their "
+    "there these this to was were will with which who what when where how does do any all".split()
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def split_passages(pages: List[Dict[str, Any]], max_chars: int = 1200) -> List[Dict[str, Any]]:
+    """Paragraph-sized passages with their page number; short paragraphs are packed together."""
+    passages: List[Dict[str, Any]] = []
+    for p in pages:
+        buff = ""
+        for para in re.split(r"\n\s*\n", p.get("text") or ""):
+            para = para.strip()
+            if not para:
+                continue
+            if buff and len(buff) + len(para) > max_chars:
+                passages.append({"page": p["page"], "text": buff})
+                buff = ""
+            buff = f"{buff}\n{para}" if buff else para
+            while len(buff) > max_chars * 2:  # one giant paragraph (typical of OCR output)
+                passages.append({"page": p["page"], "text": buff[:max_chars]})
+                buff = buff[max_chars:]
+        if buff:
+            passages.append({"page": p["page"], "text": buff})
+    return passages
+
+
+def build_index(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """BM25 inverted index over page passages. Plain JSON types so it can be persisted as-is."""
+    passages = split_passages(pages)
+    postings: Dict[str, List[List[int]]] = {}
+    lengths: List[int] = []
+    for pid, psg in enumerate(passages):
+        terms = tokenize(psg["text"])
+        lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, []).append([pid, tf])
+    return {
+        "passages": passages,
+        "postings": postings,
+        "lengths": lengths,
+        "avgdl": (sum(lengths) / len(lengths)) if lengths else 0.0,
+    }
+
+
+def search(index: Dict[str, Any], query: str, k: int = 6) -> List[Tuple[float, Dict[str, Any]]]:
+    n = len(index["passages"])
+    if not n:
+        return []
+    lengths, avgdl = index["lengths"], index["avgdl"] or 1.0
+    scores: Dict[int, float] = {}
+    for term in set(tokenize(query)):
+        plist = index["postings"].get(term)
+        if not plist:
+            continue
+        idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        for pid, tf in plist:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[pid] / avgdl)
+            scores[pid] = scores.get(pid, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+    top = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+    return [(score, index["passages"][pid]) for pid, score in top]
+
+
+class DocStore:
+    """Extracted pages + retrieval index per document id, as JSON files on local disk.
+
+    Recently used indexes are kept in memory; the oldest files are pruned past `max_docs`.
+    """
+
+    def __init__(self, directory: str, max_docs: int = 2000, memory_docs: int = 32):
+        self.directory = directory
+        self.max_docs = max_docs
+        self.memory_docs = memory_docs
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, doc_id: str) -> str:
+        if not re.fullmatch(r"[0-9a-f]{8,64}", doc_id or ""):
+            raise KeyError(doc_id)
+        return os.path.join(self.directory, f"{doc_id}.json")
+
+    def exists(self, doc_id: str) -> bool:
+        try:
+            return doc_id in self._mem or os.path.exists(self._path(doc_id))
+        except KeyError:
+            return False
+
+    def save(self, doc_id: str, filename: str, pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        doc = {"doc_id": doc_id, "file": filename, "pages": pages, "index": build_index(pages)}
+        path = self._path(doc_id)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # unique per writer thread
+        with open(tmp, "w") as f:
+            json.dump(doc, f, separators=(",", ":"))
+        os.replace(tmp, path)
+        self._remember(doc_id, doc)
+        self._prune()
+        return doc
+
+    def load(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if doc_id in self._mem:
+                self._mem.move_to_end(doc_id)
+                return self._mem[doc_id]
+        try:
+            with open(self._path(doc_id)) as f:
+                doc = json.load(f)
+        except (KeyError, FileNotFoundError):
+            return None
+        self._remember(doc_id, doc)
+        return doc
+
+    def _remember(self, doc_id: str, doc: Dict[str, Any]) -> None:
+        with self._lock:
+            self._mem[doc_id] = doc
+            self._mem.move_to_end(doc_id)
+            while len(self._mem) > self.memory_docs:
+                self._mem.popitem(last=False)
+
+    def _prune(self) -> None:
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".json")]
+        if len(files) <= self.max_docs:
+            return
+        files.sort(key=lambda p: os.path.getmtime(p))
+        for path in files[: len(files) - self.max_docs]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,124 @@
+import os
+import re
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+SECTIONS = [
+    "title", "mortgages", "planning_zoning", "rates_outgoings",
+    "insurance", "building_permits", "notices", "special_conditions",
+]
+
+# (pattern, weight) per section. Strong, document-type phrases score high enough to tag a
+# page on their own; generic vocabulary needs corroboration (ROUTE_MIN_SCORE).
+_RULES: Dict[str, List[Tuple[str, int]]] = {
+    "title": [
+        (r"register search statement|certificate of title|copy of (?:the )?title", 3),
+        (r"\bvol(?:ume)?\.?\s*\d+\s*fol(?:io)?\.?\s*\d+", 3),
+        (r"registered proprietor|plan of subdivision|\b(?:lp|ps|tp|cp|sp)\s?\d{4,6}[a-z]?\b", 2),
+        (r"\bencumbrances?\b|\beasements?\b|\bcovenants?\b|\blot\s+\d+\b|\bcrown allotment\b", 1),
+    ],
+    "mortgages": [
+        (r"\bmortgages?\b|\bmortgagee\b", 2),
+        (r"\bdischarge of mortgage\b|\bregistered charge\b|\bcharges?\b", 1),
+        (r"\b(?:westpac|commonwealth bank|anz|nab|national australia bank|bendigo|ing bank|macquarie)\b", 1),
+    ],
+    "planning_zoning": [
+        (r"planning certificate|planning property report|planning scheme", 3),
+        (r"\b(?:grz|nrz|rgz|mud|c1z|c2z|ind[123]z|frz|gwz|lrdz|rlz|ucz|puz\d?|ppr?z)\d{0,2}\b", 2),
+        (r"\bzon(?:e|ing)\b|\boverlays?\b|\b(?:ho|ddo|eso|vpo|sbo|lsio|bmo|dpo|epo|pao)\d{0,3}\b", 1),
+    ],
+    "rates_outgoings": [
+        (r"land information certificate|rates notice|rate notice|valuation notice|owners corporation certificate", 3),
+        (r"\bcouncil rates\b|\boutgoings\b|\bowners corporation\b|\bland tax\b|\bwater (?:rates|charges|authority)\b", 2),
+        (r"\brates\b|\blevy\b|\blevies\b|\bcapital improved value\b|\bsite value\b", 1),
+    ],
+    "insurance": [
+        (r"certificate of (?:currency|insurance)|domestic building insurance|policy (?:no\.?|number)", 3),
+        (r"\binsurance\b|\binsurer\b|\bpolicy\b", 1),
+    ],
+    "building_permits": [
+        (r"building permit|occupancy permit|certificate of final inspection", 3),
+        (r"owner[- ]builder|\bpermit (?:no\.?|number)\b|building surveyor", 2),
+        (r"\bpermits?\b|\bbuilding work\b", 1),
+    ],
+    "notices": [
+        (r"notices?, orders?|compulsory acquisition|adverse affectation|notice of (?:proposal|intention)", 3),
+        (r"\bnotices?\b|\borders?\b|\bproposals?\b", 1),
+    ],
+    "special_conditions": [
+        (r"special conditions?", 3),
+        (r"\bcaveats?\b|\brestrictions?\b|\bgeneral conditions\b|contract of sale", 1),
+    ],
+}
+
+_COMPILED = {s: [(re.compile(p, re.IGNORECASE), w) for p, w in rules] for s, rules in _RULES.items()}
+
+ROUTE_MIN_SCORE = int(os.getenv("ROUTE_MIN_SCORE", "2"))
+# Attachments run over several pages and only the first usually names itself; an
+# untagged page inherits the previous page's sections for this many pages.
+ROUTE_CARRY_PAGES = int(os.getenv("ROUTE_CARRY_PAGES", "1"))
+
+
+def score_page(text: str) -> Dict[str, int]:
+    scores = {}
+    for sect, rules in _COMPILED.items():
+        # Cap each rule's contribution so one repeated word can't tag a page by itself.
+        score = sum(w * min(2, len(rx.findall(text))) for rx, w in rules)
+        if score:
+            scores[sect] = score
+    return scores
+
+
+def route_pages(pages: Iterable[Dict[str, Any]], min_score: int = ROUTE_MIN_SCORE,
+                carry: int = ROUTE_CARRY_PAGES) -> Dict[int, List[str]]:
+    """Map page number -> sections it probably covers (empty list: skip the page)."""
+    routes: Dict[int, List[str]] = {}
+    prev: List[str] = []
+    carried = 0
+    for p in pages:
+        scores = score_page(p.get("text") or "")
+        tags = [s for s in SECTIONS if scores.get(s, 0) >= min_score]
+        if tags:
+            prev, carried = tags, 0
+        elif prev and carried < carry and (p.get("text") or "").strip():
+            tags, carried = prev, carried + 1
+        routes[p["page"]] = tags
+    return routes
+
+
+def chunk_sections(chunk_pages: Iterable[int], routes: Dict[int, List[str]]) -> Dict[str, List[int]]:
+    """Section -> pages of this chunk routed to it, in SECTIONS order."""
+    out: Dict[str, List[int]] = {}
+    for n in chunk_pages:
+        for s in routes.get(n, []):
+            out.setdefault(s, [])
+            if n not in out[s]:
+                out[s].append(n)
+    return {s: out[s] for s in SECTIONS if s in out}
+
+
+def sub_schema(schema: Dict[str, Any], sections: Iterable[str],
+               omit: Optional[Dict[str, Iterable[str]]] = None) -> Dict[str, Any]:
+    """`schema` restricted to `sections` (plus missing_or_unclear), without the
+    {section: [fields]} in `omit` (fields already known; required ones are kept)."""
+    keep = [s for s in sections if s in schema["properties"]] + ["missing_or_unclear"]
+    props = {k: schema["properties"][k] for k in keep}
+    for s, fields in (omit or {}).items():
+        if s in props and fields:
+            sect = props[s]
+            drop = set(fields) - set(sect.get("required", []))
+            props[s] = {**sect, "properties": {f: v for f, v in sect["properties"].items() if f not in drop}}
+    return {
+        "type": "object",
+        "properties": props,
+        "required": [k for k in schema.get("required", []) if k in keep],
+    }
+
+
+def routing_report(routes: Dict[int, List[str]]) -> Dict[str, Any]:
+    per_section: Dict[str, int] = {s: 0 for s in SECTIONS}
+    for tags in routes.values():
+        for s in tags:
+            per_section[s] += 1
+    skipped = sorted(n for n, tags in routes.items() if not tags)
+    return {"pages_total": len(routes), "pages_skipped": len(skipped), "skipped": skipped,
+            "pages_per_section": per_section}
@@ -0,0 +1,181 @@
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.cache import fingerprint
+from utils.route import SECTIONS
+
+# Deterministic extraction of fields with a regular format (volume/folio, plan/lot, zone and
+# overlay codes, policy and permit numbers, ...). Resolved fields are pre-filled with the
+# pages they came from and dropped from the schema the model is asked to fill; a section
+# whose every field is resolved isn't sent to the model at all.
+RULES_PREFILL = os.getenv("RULES_PREFILL", "true").lower() == "true"
+
+_MONTHS = r"(?i:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+_DATE = rf"\d{{1,2}}[/.-]\d{{1,2}}[/.-]\d{{2,4}}|\d{{1,2}}\s+{_MONTHS}\.?,?\s+\d{{4}}"
+_ZONES = (r"GRZ|NRZ|RGZ|MUZ|TZ|LDRZ|C[123]Z|IN[123]Z|SUZ|CDZ|ACZ|CCZ|DZ|PDZ|UGZ|FZ|GWZ|GWAZ|RLZ|RAZ|RCZ"
+          r"|PPRZ|PCRZ|PUZ|RDZ|UFZ|ERZ")
+_OVERLAYS = r"HO|DDO|NCO|SBO|LSIO|FO|VPO|ESO|SLO|EAO|BMO|WMO|DPO|PAO|EMO|IPO|DCPO|ICO|SCO|CLPO|AEO|MAEO|PO"
+# Words that run into a council's name in headings ("Council Rates Notice Whitehorse City Council").
+_COUNCIL_NOISE = {"the", "council", "rates", "rate", "notice", "issued", "by", "land", "information",
+                  "certificate", "valuation", "from", "of", "for", "to", "and", "municipal", "local"}
+
+
+def _council(m: "re.Match") -> Optional[str]:
+    words = m.group(1).split()
+    while words and words[0].lower() in _COUNCIL_NOISE:
+        words.pop(0)
+    return " ".join(words + [_space(m.group(2)), "Council"]) if words else None
+
+
+def _space(s: str) -> str:
+    return " ".join(s.split())
+
+
+# (section, field) -> [(rule name, pattern, value from match)]. Labels match in any case;
+# codes and numbers only in the case they're printed in, so prose doesn't look like a code.
+_RULES: Dict[Tuple[str, str], List[Tuple[str, str, Callable[["re.Match"], Optional[str]]]]] = {
+    ("title", "volume_folio"): [
+        ("volume_folio", r"(?i:\bvol(?:ume)?\.?)\s*(\d{1,6})\s*,?\s*(?i:fol(?:io)?\.?)\s*(\d{1,4})\b",
+         lambda m: f"Volume {int(m.group(1))} Folio {int(m.group(2))}"),
+    ],
+    ("title", "plan_lot"): [
+        ("lot_on_plan", r"(?i:\blot)\s+(\d{1,4}[A-Z]?)\s+(?i:on\s+(?:(?:plan\s+of\s+subdivision|title\s+plan|strata\s+plan"
+                        r"|cluster\s+plan|plan)\s+)?(?:no\.?\s*)?)?((?:LP|PS|TP|CP|SP|RP|PC)\s?\d{3,6}[A-Z]?)\b",
+         lambda m: f"Lot {m.group(1)} on {m.group(2).replace(' ', '')}"),
+    ],
+    ("planning_zoning", "zone"): [
+        ("zone_code", rf"\b((?:{_ZONES})\d{{0,2}})\b", lambda m: m.group(1)),
+    ],
+    ("planning_zoning", "overlays"): [
+        ("overlay_code", rf"\b((?:{_OVERLAYS})\d{{0,3}})\b(?!\s+(?i:box)\b)", lambda m: m.group(1)),
+    ],
+    ("planning_zoning", "certificate_date"): [
+        ("certificate_date", rf"(?i:\b(?:date\s+of\s+(?:certificate|issue)|certificate\s+date|date\s+issued|issued\s+on))"
+                             rf"\s*[:\-]?\s*({_DATE})", lambda m: _space(m.group(1))),
+    ],
+    ("rates_outgoings", "council"): [
+        ("council_name", r"\b((?:[A-Z][a-zA-Z'-]+\s+){1,4})(City|Shire|Rural\s+City|Borough)\s+Council\b",
+         _council),
+        ("city_of", r"\b(City|Shire|Borough)\s+of\s+([A-Z][a-zA-Z'-]+(?:\s+[A-Z][a-zA-Z'-]+){0,2})\b(?!\s+(?:Planning|Scheme))",
+         lambda m: f"{m.group(1)} of {m.group(2)}"),
+    ],
+    ("rates_outgoings", "annual_amount"): [
+        ("annual_rates", r"(?i:\b(?:annual|total|council)\s+rates?(?:\s+(?:and|&)\s+charges)?"
+                         r"(?:\s+(?:for|in)\s+(?:the\s+)?(?:\d{4}\s*[/-]\s*\d{2,4}|year))?)\s*[:\-]?\s*"
+                         r"(\$\s?\d[\d,]*(?:\.\d{2})?)", lambda m: m.group(1).replace(" ", "")),
+    ],
+    ("insurance", "policy_number"): [
+        ("policy_number", r"(?i:\bpolicy\s+(?:no\.?|number|#))\s*[:\-]?\s*((?=[A-Z0-9/-]*\d)[A-Z0-9][A-Z0-9/-]{3,})\b",
+         lambda m: m.group(1)),
+    ],
+    ("insurance", "insurer"): [
+        ("insurer_label", r"(?i:\binsurer)\s*:\s*([A-Z][A-Za-z&'.-]*(?:[ ][A-Z&][A-Za-z&'.-]*){0,5}?)(?=\s*(?:[,;(\n]|\.\s|$))",
+         lambda m: m.group(1).rstrip(".")),
+    ],
+    ("insurance", "valid_to"): [
+        ("expiry_date", rf"(?i:\b(?:expiry\s+date|expires(?:\s+on)?|valid\s+(?:to|until)|period\s+of\s+(?:insurance|cover)"
+                        rf"\b[^\n]{{0,40}}?\bto))\s*[:\-]?\s*({_DATE})", lambda m: _space(m.group(1))),
+    ],
+    ("building_permits", "permits"): [
+        ("permit_number", r"(?i:\b(?:building|occupancy)\s+permit\s+(?:no\.?|number|#)?)\s*[:\-]?\s*"
+                          r"([A-Z]{1,5}(?:[- ][A-Z]{1,3})?[- ]?\d{2,7}(?:/\d{2,5}){0,2})\b",
+         lambda m: _space(m.group(1))),
+    ],
+}
+
+_COMPILED = {key: [(name, re.compile(p), fn) for name, p, fn in rules] for key, rules in _RULES.items()}
+LIST_FIELDS = {("planning_zoning", "overlays"), ("building_permits", "permits")}
+RULE_FIELDS = [f"{s}.{f}" for s, f in _RULES]
+# Changes whenever a pattern does, so cached documents don't keep an old rule's values.
+RULES_VERSION = fingerprint([(k, [(n, p) for n, p, _ in v]) for k, v in _RULES.items()], sorted(LIST_FIELDS))[:12]
+
+
+def _section_pages(pages: List[Dict[str, Any]], routes: Optional[Dict[int, List[str]]], section: str) -> List[Dict[str, Any]]:
+    if routes is None:
+        return pages
+    return [p for p in pages if section in routes.get(p["page"], ())]
+
+
+def extract_fields(pages: List[Dict[str, Any]], routes: Optional[Dict[int, List[str]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Run every rule over the pages routed to its section (all pages if `routes` is None).
+
+    Returns {"section.field": {"value", "pages", "rule", "resolved"}}. A scalar field is
+    resolved only when every match agrees; otherwise its candidates are reported and the
+    model decides. List fields collect every match.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    for (section, field), rules in _COMPILED.items():
+        found: Dict[str, Tuple[List[int], str]] = {}
+        for p in _section_pages(pages, routes, section):
+            text = p.get("text") or ""
+            for name, rx, fn in rules:
+                for m in rx.finditer(text):
+                    value = fn(m)
+                    if not value:
+                        continue
+                    hit = found.setdefault(value, ([], name))
+                    if p["page"] not in hit[0]:
+                        hit[0].append(p["page"])
+        if not found:
+            continue
+        key = f"{section}.{field}"
+        refs = sorted({n for pg, _ in found.values() for n in pg})
+        if (section, field) in LIST_FIELDS:
+            out[key] = {"value": list(found), "pages": refs, "rule": sorted({r for _, r in found.values()}), "resolved": True}
+        elif len(found) == 1:
+            (value, (pg, name)), = found.items()
+            out[key] = {"value": value, "pages": pg, "rule": name, "resolved": True}
+        else:
+            out[key] = {"candidates": {v: pg for v, (pg, _) in found.items()}, "pages": refs, "resolved": False}
+    return out
+
+
+def resolved_fields(fields: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Section -> fields the rules settled (omit these from the model's schema)."""
+    out: Dict[str, List[str]] = {}
+    for key, f in fields.items():
+        if f["resolved"]:
+            section, field = key.split(".", 1)
+            out.setdefault(section, []).append(field)
+    return out
+
+
+def covered_sections(fields: Dict[str, Dict[str, Any]], schema: Dict[str, Any]) -> List[str]:
+    """Sections whose every content field (not supporting_doc_present/page_refs) is resolved."""
+    done = resolved_fields(fields)
+    out = []
+    for s in SECTIONS:
+        props = schema["properties"].get(s, {}).get("properties", {})
+        wanted = [f for f in props if f not in ("supporting_doc_present", "page_refs")]
+        if s in done and wanted and all(f in done[s] for f in wanted):
+            out.append(s)
+    return out
+
+
+def prefill(fields: Dict[str, Dict[str, Any]], section_pages: Optional[Dict[str, Iterable[int]]] = None) -> Dict[str, Any]:
+    """Resolved fields as a chunk-shaped result for MergeAccumulator.add.
+
+    `section_pages` adds further page_refs per section (for a covered section, every page
+    routed to it: nothing else will cite them).
+    """
+    out: Dict[str, Any] = {}
+    for key, f in fields.items():
+        if not f["resolved"]:
+            continue
+        section, field = key.split(".", 1)
+        sect = out.setdefault(section, {"supporting_doc_present": True, "page_refs": []})
+        sect[field] = f["value"]
+        sect["page_refs"] = sorted(set(sect["page_refs"]) | set(f["pages"]))
+    for section, extra in (section_pages or {}).items():
+        if section in out:
+            out[section]["page_refs"] = sorted(set(out[section]["page_refs"]) | set(extra))
+    return out
+
+
+def rules_report(fields: Dict[str, Dict[str, Any]], covered: List[str]) -> Dict[str, Any]:
+    return {
+        "fields": {k: {x: v for x, v in f.items() if x != "resolved"} for k, f in fields.items() if f["resolved"]},
+        "ambiguous": {k: f["candidates"] for k, f in fields.items() if not f["resolved"]},
+        "sections_covered": covered,
+    }
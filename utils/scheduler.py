@@ -0,0 +1,109 @@
+import os
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Hashable
+
+# Process-wide model-call slots, and the most any one owner (document) may hold at once.
+MODEL_CONCURRENCY_PER_PROCESS = int(os.getenv("MODEL_CONCURRENCY_PER_PROCESS", "16"))
+MODEL_CONCURRENCY_PER_REQUEST = int(os.getenv("MODEL_CONCURRENCY_PER_REQUEST", "4"))
+
+
+class FairScheduler:
+    """Global work queue for model calls, handed out round-robin across owners.
+
+    Every chunk waits in its owner's FIFO; when a slot frees up it goes to the next owner
+    in rotation that has work and is under `per_owner`, so a 400-page bundle queued first
+    can't hold every slot while a 10-page certificate waits behind all of its chunks.
+
+        async with scheduler.slot(doc_key):
+            resp = await aclient.chat.completions.create(...)
+    """
+
+    def __init__(self, capacity: int = MODEL_CONCURRENCY_PER_PROCESS, per_owner: int = MODEL_CONCURRENCY_PER_REQUEST):
+        self.capacity = max(1, capacity)
+        self.per_owner = per_owner  # 0 = no per-owner cap
+        self._running = 0
+        self._owner_running: Dict[Hashable, int] = {}
+        self._waiting: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self.granted = 0
+        self.queued = 0  # grants that had to wait
+
+    def _eligible(self, owner: Hashable) -> bool:
+        return not self.per_owner or self._owner_running.get(owner, 0) < self.per_owner
+
+    def _grant(self, owner: Hashable) -> None:
+        self._running += 1
+        self._owner_running[owner] = self._owner_running.get(owner, 0) + 1
+        self.granted += 1
+
+    async def acquire(self, owner: Hashable) -> None:
+        if self._running < self.capacity and self._eligible(owner) and not self._waiting.get(owner):
+            self._grant(owner)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(owner, deque()).append(fut)
+        self.queued += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(owner)  # granted just as we were cancelled
+            else:
+                q = self._waiting.get(owner)
+                if q is not None and fut in q:
+                    q.remove(fut)
+                    if not q:
+                        del self._waiting[owner]
+            raise
+
+    def release(self, owner: Hashable) -> None:
+        self._running -= 1
+        n = self._owner_running.get(owner, 1) - 1
+        if n:
+            self._owner_running[owner] = n
+        else:
+            self._owner_running.pop(owner, None)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._running < self.capacity and self._waiting:
+            for owner in list(self._waiting):
+                if not self._eligible(owner):
+                    continue
+                q = self._waiting[owner]
+                while q and q[0].done():
+                    q.popleft()
+                if not q:
+                    del self._waiting[owner]
+                    continue
+                q.popleft().set_result(None)
+                self._grant(owner)
+                # Served: rotate this owner to the back.
+                if q:
+                    self._waiting.move_to_end(owner)
+                else:
+                    del self._waiting[owner]
+                break
+            else:
+                return  # everyone waiting is at their per-owner cap
+
+    @asynccontextmanager
+    async def slot(self, owner: Hashable) -> AsyncIterator[None]:
+        await self.acquire(owner)
+        try:
+            yield
+        finally:
+            self.release(owner)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "per_owner": self.per_owner,
+            "running": self._running,
+            "waiting": sum(len(q) for q in self._waiting.values()),
+            "owners_waiting": len(self._waiting),
+            "owners_running": len(self._owner_running),
+            "granted": self.granted,
+            "queued": self.queued,
+        }
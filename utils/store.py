@@ -0,0 +1,223 @@
+import os
+import json
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+try:
+    import psycopg2  # type: ignore
+    import psycopg2.pool  # type: ignore
+    import psycopg2.extras  # type: ignore
+    _HAS_PSYCOPG2 = True
+except Exception:
+    _HAS_PSYCOPG2 = False
+
+DEFAULT_DATABASE_URL = "sqlite:///" + os.path.join(tempfile.gettempdir(), "contract_backend.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    model TEXT,
+    prompt_version TEXT,
+    page_count INTEGER NOT NULL,
+    summary {json} NOT NULL,
+    created_at {ts},
+    updated_at {ts}
+);
+CREATE TABLE IF NOT EXISTS document_pages (
+    doc_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (doc_id, page)
+);
+CREATE TABLE IF NOT EXISTS chunk_outputs (
+    doc_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    pages {json} NOT NULL,
+    output {json} NOT NULL,
+    PRIMARY KEY (doc_id, idx)
+);
+CREATE TABLE IF NOT EXISTS document_usage (
+    doc_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    prompt_tokens BIGINT NOT NULL,
+    completion_tokens BIGINT NOT NULL,
+    calls INTEGER NOT NULL,
+    created_at {ts}
+);
+CREATE INDEX IF NOT EXISTS document_usage_doc ON document_usage (doc_id);
+CREATE TABLE IF NOT EXISTS feedback (
+    id {serial},
+    rating INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    email TEXT,
+    doc_name TEXT,
+    received_at {ts_col} NOT NULL
+);
+"""
+
+
+class Store:
+    """Document persistence over a pooled Postgres connection, or SQLite as a local stand-in.
+
+    `url` is a libpq DSN/URL (postgres://...) or sqlite:///path. Methods are blocking;
+    call them from a threadpool in async code.
+    """
+
+    def __init__(self, url: str, minconn: int = 1, maxconn: int = 10, connect_timeout: int = 10):
+        self.url = url
+        self.is_sqlite = url.startswith("sqlite://")
+        self._pool = None
+        if self.is_sqlite:
+            self._sqlite_path = url[len("sqlite:///"):] or ":memory:"
+        else:
+            if not _HAS_PSYCOPG2:
+                raise RuntimeError("psycopg2 is required for a Postgres DATABASE_URL")
+            self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn=url, connect_timeout=connect_timeout)
+        self._init_schema()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """A connection in a transaction: committed on success, rolled back on error."""
+        if self.is_sqlite:
+            conn = sqlite3.connect(self._sqlite_path, timeout=30)
+            conn.execute("PRAGMA foreign_keys=ON")
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            return
+        conn = self._pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.putconn(conn)
+
+    def _sql(self, sql: str) -> str:
+        return sql.replace("%s", "?") if self.is_sqlite else sql
+
+    def _init_schema(self) -> None:
+        ddl = _SCHEMA.format(
+            json="TEXT" if self.is_sqlite else "JSONB",
+            ts="TEXT DEFAULT CURRENT_TIMESTAMP" if self.is_sqlite else "TIMESTAMPTZ DEFAULT now()",
+            ts_col="TEXT" if self.is_sqlite else "TIMESTAMPTZ",
+            serial="INTEGER PRIMARY KEY AUTOINCREMENT" if self.is_sqlite else "BIGSERIAL PRIMARY KEY",
+        )
+        with self.connection() as conn:
+            cur = conn.cursor()
+            for stmt in ddl.split(";"):
+                if stmt.strip():
+                    cur.execute(stmt)
+
+    def executemany(self, conn: Any, sql: str, rows: Sequence[Sequence[Any]]) -> None:
+        """Multi-row insert: one statement per page of rows on Postgres (execute_values)."""
+        if not rows:
+            return
+        cur = conn.cursor()
+        if self.is_sqlite:
+            cur.executemany(self._sql(sql.replace("VALUES %s", "VALUES (" + ",".join("?" * len(rows[0])) + ")")), rows)
+        else:
+            psycopg2.extras.execute_values(cur, sql, rows, page_size=500)
+
+    def save_document(self, doc_id: str, filename: str, sha256: str, pages: List[Dict[str, Any]],
+                      summary: Dict[str, Any], chunks: Optional[List[Dict[str, Any]]] = None,
+                      outputs: Optional[List[Dict[str, Any]]] = None, model: Optional[str] = None,
+                      prompt_version: Optional[str] = None, usage: Optional[Dict[str, Any]] = None) -> None:
+        """Upsert a document with its page text, per-chunk model outputs and merged summary.
+
+        `usage` (a utils.usage report) is appended per run, so totals cover every analysis.
+        """
+        now = "CURRENT_TIMESTAMP" if self.is_sqlite else "now()"
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(
+                "INSERT INTO documents (id, filename, sha256, model, prompt_version, page_count, summary)"
+                " VALUES (%s, %s, %s, %s, %s, %s, %s)"
+                " ON CONFLICT (id) DO UPDATE SET filename = excluded.filename, model = excluded.model,"
+                " prompt_version = excluded.prompt_version, page_count = excluded.page_count,"
+                f" summary = excluded.summary, updated_at = {now}"
+            ), (doc_id, filename, sha256, model, prompt_version, len(pages), json.dumps(summary)))
+            cur.execute(self._sql("DELETE FROM document_pages WHERE doc_id = %s"), (doc_id,))
+            cur.execute(self._sql("DELETE FROM chunk_outputs WHERE doc_id = %s"), (doc_id,))
+            self.executemany(conn, "INSERT INTO document_pages (doc_id, page, text) VALUES %s",
+                             [(doc_id, p["page"], (p.get("text") or "").replace("\x00", "")) for p in pages])
+            if chunks and outputs:
+                self.executemany(conn, "INSERT INTO chunk_outputs (doc_id, idx, pages, output) VALUES %s", [
+                    (doc_id, i, json.dumps(ch["pages"]), json.dumps(out))
+                    for i, (ch, out) in enumerate(zip(chunks, outputs))
+                ])
+            if usage and usage.get("by_model"):
+                self.executemany(conn, "INSERT INTO document_usage (doc_id, model, prompt_tokens, completion_tokens, calls) VALUES %s", [
+                    (doc_id, m, b["prompt_tokens"], b["completion_tokens"], b["calls"]) for m, b in usage["by_model"].items()
+                ])
+
+    def save_feedback(self, items: List[Dict[str, Any]]) -> None:
+        """One multi-row insert for a batch of FeedbackIn dicts (plus `received_at`, epoch seconds)."""
+        rows = [
+            (it["rating"], it["message"], it.get("email"), it.get("docName"),
+             datetime.fromtimestamp(it["received_at"], timezone.utc).isoformat())
+            for it in items
+        ]
+        with self.connection() as conn:
+            self.executemany(conn, "INSERT INTO feedback (rating, message, email, doc_name, received_at) VALUES %s", rows)
+
+    def has_document(self, doc_id: str) -> bool:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql("SELECT 1 FROM documents WHERE id = %s"), (doc_id,))
+            return cur.fetchone() is not None
+
+    def get_document(self, doc_id: str, include_pages: bool = False,
+                     include_chunks: bool = False) -> Optional[Dict[str, Any]]:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(
+                "SELECT id, filename, sha256, model, prompt_version, page_count, summary, created_at, updated_at"
+                " FROM documents WHERE id = %s"
+            ), (doc_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            doc = {
+                "doc_id": row[0], "file": row[1], "sha256": row[2], "model": row[3],
+                "prompt_version": row[4], "page_count": row[5], "summary": _json(row[6]),
+                "created_at": _ts(row[7]), "updated_at": _ts(row[8]),
+            }
+            cur.execute(self._sql(
+                "SELECT model, SUM(prompt_tokens), SUM(completion_tokens), SUM(calls) FROM document_usage"
+                " WHERE doc_id = %s GROUP BY model ORDER BY model"
+            ), (doc_id,))
+            doc["usage"] = {m: {"prompt_tokens": int(p), "completion_tokens": int(c), "calls": int(n)}
+                            for m, p, c, n in cur.fetchall()}
+            if include_pages:
+                cur.execute(self._sql("SELECT page, text FROM document_pages WHERE doc_id = %s ORDER BY page"), (doc_id,))
+                doc["pages"] = [{"page": p, "text": t} for p, t in cur.fetchall()]
+            if include_chunks:
+                cur.execute(self._sql("SELECT idx, pages, output FROM chunk_outputs WHERE doc_id = %s ORDER BY idx"), (doc_id,))
+                doc["chunks"] = [{"index": i, "pages": _json(p), "output": _json(o)} for i, p, o in cur.fetchall()]
+        return doc
+
+
+def _json(value: Any) -> Any:
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def _ts(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
@@ -0,0 +1,210 @@
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# USD per 1M tokens (input, output), for the cost estimate only. PRICE_IN / PRICE_OUT override.
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+# Per-request budgets (0 = unlimited). Over budget: "refuse" (413 before any model call)
+# or "degrade" (send only the highest-value chunks that fit).
+UPLOAD_MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "0"))
+UPLOAD_MAX_TOKENS = int(os.getenv("UPLOAD_MAX_TOKENS", "0"))
+BUDGET_MODE = os.getenv("BUDGET_MODE", "refuse").lower()
+# Completion tokens assumed per chunk when estimating a request's cost up front.
+BUDGET_COMPLETION_ALLOWANCE = int(os.getenv("BUDGET_COMPLETION_ALLOWANCE", "500"))
+
+
+def price(model: str) -> Tuple[float, float]:
+    # Dated snapshots ("gpt-4o-mini-2024-07-18") price like their family.
+    base = next((m for m in sorted(PRICES, key=len, reverse=True) if model.startswith(m)), "gpt-4o-mini")
+    p_in, p_out = PRICES[base]
+    return float(os.getenv("PRICE_IN", p_in)), float(os.getenv("PRICE_OUT", p_out))
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    p_in, p_out = price(model)
+    return (prompt_tokens * p_in + completion_tokens * p_out) / 1e6
+
+
+class UsageMeter:
+    """Token totals for one request, per model and per purpose (chunk/ask/vision).
+
+    A meter opened inside another (one file of /upload/batch) also adds its usage and pages
+    to the outer one, and spends the outer one's budget as well as its own. Its `reserve`d
+    estimate is held against that budget while it runs, so files planned in parallel
+    don't each count on the whole of it.
+    """
+
+    def __init__(self, max_tokens: int = 0, max_pages: int = 0, parent: Optional["UsageMeter"] = None):
+        self.max_tokens = max_tokens
+        self.max_pages = max_pages
+        self.parent = parent
+        self.pages = 0
+        self.reserved = 0
+        self.children: List["UsageMeter"] = []
+        self.by_model: Dict[str, Dict[str, int]] = {}
+        self.by_purpose: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()  # vision OCR records from the threadpool
+
+    def add(self, model: str, purpose: str, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            for bucket in (self.by_model.setdefault(model, _zero()), self.by_purpose.setdefault(purpose, _zero())):
+                bucket["prompt_tokens"] += prompt_tokens
+                bucket["completion_tokens"] += completion_tokens
+                bucket["calls"] += 1
+        if self.parent is not None:
+            self.parent.add(model, purpose, prompt_tokens, completion_tokens)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(b["prompt_tokens"] + b["completion_tokens"] for b in self.by_model.values())
+
+    def reserve(self, tokens: int) -> None:
+        """Hold `tokens` (this meter's planned spend) against the outer budgets until it closes."""
+        self.reserved = tokens
+
+    def remaining_tokens(self) -> Optional[int]:
+        """Tokens left in the tightest budget on the chain, less what sibling meters hold; None if unlimited."""
+        left = []
+        via = None
+        for m in self._chain():
+            if m.max_tokens:
+                held = sum(max(0, c.reserved - c.total_tokens) for c in m.children if c is not via)
+                left.append(m.max_tokens - m.total_tokens - held)
+            via = m
+        return min(left) if left else None
+
+    def exhausted(self) -> bool:
+        left = self.remaining_tokens()
+        return left is not None and left <= 0
+
+    def check_pages(self, n_pages: int, charge: bool = False) -> None:
+        """Raise BudgetExceeded if a document of `n_pages` doesn't fit; `charge` counts it."""
+        for m in self._chain():
+            if m.max_pages and m.pages + n_pages > m.max_pages:
+                if m.pages:
+                    raise BudgetExceeded(f"Document has {n_pages} pages; {m.max_pages - m.pages} of the "
+                                         f"request's {m.max_pages}-page budget are left.")
+                raise BudgetExceeded(f"Document has {n_pages} pages; the limit is {m.max_pages}.")
+        if charge:
+            for m in self._chain():
+                m.pages += n_pages
+
+    def _chain(self) -> Iterator["UsageMeter"]:
+        m: Optional[UsageMeter] = self
+        while m is not None:
+            yield m
+            m = m.parent
+
+    def report(self) -> Dict[str, Any]:
+        total = _zero()
+        cost = 0.0
+        for model, b in self.by_model.items():
+            for k in total:
+                total[k] += b[k]
+            cost += estimate_cost(model, b["prompt_tokens"], b["completion_tokens"])
+        return {**total, "estimated_cost_usd": round(cost, 6),
+                "by_model": {m: dict(b) for m, b in self.by_model.items()},
+                "by_purpose": {p: dict(b) for p, b in self.by_purpose.items()}}
+
+
+def _zero() -> Dict[str, int]:
+    return {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}
+
+
+_current: ContextVar[Optional[UsageMeter]] = ContextVar("usage_meter", default=None)
+
+
+@contextmanager
+def metering(max_tokens: int = 0, max_pages: int = 0) -> Iterator[UsageMeter]:
+    """Route usage from model calls made in this context (threads and tasks included) to a new meter.
+
+    Nested inside another metering() context, the new meter is a child of that one.
+    """
+    parent = _current.get()
+    meter = UsageMeter(max_tokens, max_pages, parent=parent)
+    if parent is not None:
+        parent.children.append(meter)
+    token = _current.set(meter)
+    try:
+        yield meter
+    finally:
+        _current.reset(token)
+        if parent is not None:
+            parent.children.remove(meter)
+
+
+def current() -> Optional[UsageMeter]:
+    return _current.get()
+
+
+def record(model: str, purpose: str, usage: Any) -> None:
+    meter = _current.get()
+    if meter is not None and usage is not None:
+        meter.add(model, purpose, getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def check_pages(n_pages: int, charge: bool = False) -> None:
+    """UsageMeter.check_pages on the current meter (the UPLOAD_MAX_PAGES limit outside one)."""
+    meter = _current.get()
+    if meter is None:
+        meter = UsageMeter(max_pages=UPLOAD_MAX_PAGES)
+    meter.check_pages(n_pages, charge)
+
+
+def page_ranges(pages: List[int]) -> str:
+    """[1, 2, 3, 7, 9, 10] -> "1-3, 7, 9-10"."""
+    out: List[str] = []
+    last: Optional[int] = None
+    for n in sorted(set(pages)):
+        if last is not None and n == last + 1:
+            out[-1] = f"{out[-1].split('-')[0]}-{n}"
+        else:
+            out.append(str(n))
+        last = n
+    return ", ".join(out)
+
+
+def fit_chunks(chunks: List[Dict[str, Any]], budget: int, overhead: int) -> Tuple[List[int], List[int]]:
+    """Pick chunk indexes whose estimated prompt tokens fit `budget`: (kept, dropped), both sorted.
+
+    First one chunk per section (the one with most of that section's pages), so every
+    section the router found gets looked at; then the rest by routed pages per token.
+    """
+    cost = [c.get("tokens", 0) + overhead for c in chunks]
+    kept: List[int] = []
+    used = 0
+
+    def take(i: int) -> None:
+        nonlocal used
+        if i not in kept and used + cost[i] <= budget:
+            kept.append(i)
+            used += cost[i]
+
+    sections: Dict[str, List[Tuple[int, int]]] = {}
+    for i, c in enumerate(chunks):
+        for s, pages in (c.get("sections") or {}).items():
+            sections.setdefault(s, []).append((len(pages), i))
+    for s, cands in sections.items():
+        if not any(i in kept for _, i in cands):
+            for _, i in sorted(cands, key=lambda t: (-t[0], cost[t[1]], t[1])):
+                if used + cost[i] <= budget:
+                    take(i)
+                    break
+    density = lambda i: sum(len(p) for p in (chunks[i].get("sections") or {}).values()) / max(1, cost[i])
+    for i in sorted(range(len(chunks)), key=lambda i: (-density(i), i)):
+        take(i)
+    kept.sort()
+    return kept, [i for i in range(len(chunks)) if i not in kept]